@@ -8,6 +8,7 @@ from flask_wtf import CSRFProtect
 # 自定义模块导入
 from config.prod import DevelopmentConfig
 from src.blueprints.check import bp as check_bp
+from src.blueprints.check.views import remove_viewer
 from src.blueprints.cms import bp as cms_bp
 from src.blueprints.common import bp as common_bp
 from src.blueprints.front import bp as front_bp
@@ -84,6 +85,8 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     app.logger.info('WebSocket客户端已断开连接')
+    # 停止向该客户端发送实时画面
+    remove_viewer(request.sid)
 
 # 初始化Celery
 celery = make_celery(app)
@@ -10,6 +10,7 @@ import json
 from collections import deque  
 import threading
 import re
+import time
 
 import requests
 from flask import Blueprint, render_template, jsonify, current_app, send_from_directory, make_response, Response, g, send_file
@@ -23,6 +24,7 @@ from config.prod import YoloBaseConfig
 from config.prod import BaseConfig
 from src.utils.decorators import login_required
 from src.utils.exts import socketio
+from src.utils.viewer_congestion import ViewerCongestionController
 from aiortc import RTCPeerConnection, RTCSessionDescription
 
 # 导入Redis客户端
@@ -32,7 +34,7 @@ import redis
 from src.blueprints.stream.views import save_video_metadata, sync_videos_with_redis, REDIS_VIDEO_KEY_PREFIX, RECORD_FOLDER
 
 # 导入本地的检测模块
-from src.blueprints.check.detection import check_frame_for_accident, save_accident_image, ACCIDENT_CLASS_NAMES
+from src.blueprints.check.detection import save_accident_image, ACCIDENT_CLASS_NAMES
 
 UPLOAD_FOLDER = YoloBaseConfig.UPLOAD_FOLDER
 RESULT_FOLDER = YoloBaseConfig.RESULT_FOLDER
@@ -74,6 +76,15 @@ video_quality_settings = {
     'frameSkip': 3    # 添加跳帧率设置
 }
 
+# 实时画面按观看者自适应画质(分辨率、JPEG质量、帧率)
+viewer_controller = ViewerCongestionController()
+
+# 选择了metadata模式的观看者: sid -> 摄像头ID(None表示所有摄像头)，这些观看者只接收检测元数据
+metadata_viewers = {}
+# 已发给检测服务的各摄像头输出模式: 摄像头ID -> frames/metadata/both
+camera_stream_modes = {}
+stream_mode_lock = threading.Lock()
+
 # --------------------------------------------------------#
 # ----------------------图片检测-已完成(已优化)-------------------#
 # --------------------------------------------------------#
@@ -211,19 +222,115 @@ def handle_toggle_monitoring(data):
     print(f'监控状态已切换为: {"开启" if monitoring_active else "关闭"}')
     return {'success': True, 'active': monitoring_active}
 
+@socketio.on('join_viewer')
+def handle_join_viewer(data=None):
+    """监控页面开始观看实时画面，按该观看者的网络状况单独调整画质"""
+    with stream_mode_lock:
+        metadata_viewers.pop(request.sid, None)
+    viewer_controller.add_viewer(request.sid)
+    update_camera_stream_modes()
+
+def remove_viewer(sid):
+    """
+    观看者断开连接时清理其发送状态
+    
+    disconnect事件由app.py统一处理(后注册的同名处理函数会覆盖先注册的)，在那里调用本函数
+    """
+    viewer_controller.remove_viewer(sid)
+    with stream_mode_lock:
+        metadata_viewers.pop(sid, None)
+    update_camera_stream_modes()
+
+def update_camera_stream_modes():
+    """
+    按观看者的选择计算各摄像头的输出模式，有变化时通知检测服务
+    
+    只有元数据观看者时为metadata(跳过标注和编码)，同时有画面观看者时为both，否则为frames
+    """
+    with stream_mode_lock:
+        has_frame_viewers = bool(viewer_controller.viewers)
+        camera_ids = set(metadata_viewers.values()) | set(camera_stream_modes)
+        changes = []
+        # 先更新None(所有摄像头)，再更新具体的摄像头，后者覆盖前者
+        for camera_id in sorted(camera_ids, key=lambda c: (c is not None, str(c))):
+            wants_metadata = any(c is None or c == camera_id for c in metadata_viewers.values())
+            if wants_metadata:
+                mode = 'both' if has_frame_viewers else 'metadata'
+            else:
+                mode = 'frames'
+            if camera_stream_modes.get(camera_id, 'frames') != mode:
+                changes.append((camera_id, mode))
+            if mode == 'frames':
+                camera_stream_modes.pop(camera_id, None)
+            else:
+                camera_stream_modes[camera_id] = mode
+    for camera_id, mode in changes:
+        socketio.emit('stream_mode_updated', {'camera_id': camera_id, 'mode': mode})
+
 @socketio.on('detection_frame')
 def handle_frame(data):
-    """处理检测帧数据，只有当监控启用时才广播"""
-    # 只有当监控处于开启状态时才广播帧数据
+    """处理检测帧数据，只有当监控启用时才转发给观看者"""
+    # 只有当监控处于开启状态时才转发帧数据
     global monitoring_active, video_quality_settings
     if monitoring_active:
         # 添加当前视频质量设置到数据中
         data['video_quality'] = video_quality_settings
-        emit('update_frame', data, broadcast=True)
+        send_frame_to_viewers(data)
     else:
         # 只对发送者回复监控未开启的消息
         emit('monitoring_inactive', {'message': '监控当前处于关闭状态'})
 
+def send_frame_to_viewers(data):
+    """按各观看者的档位发送帧，同一档位的观看者共用一次转码"""
+    image = data.get('image')
+    for level, targets in viewer_controller.select().items():
+        rung = viewer_controller.ladder[level]
+        payload = dict(data, viewer_level=rung['name'])
+        if image:
+            payload['image'] = viewer_controller.render(image, level)
+        for sid, sent_at in targets:
+            socketio.emit('update_frame', payload, to=sid,
+                          callback=lambda *args, sid=sid, sent_at=sent_at: viewer_controller.on_ack(sid, sent_at))
+
+@bp.route('/viewer_stats')
+@login_required
+def viewer_stats():
+    """各观看者的画质档位、确认延迟和未确认帧数"""
+    return jsonify({'viewers': viewer_controller.stats()})
+
+@socketio.on('detection_metadata')
+def handle_metadata(data):
+    """把实时流的检测元数据转发给选择了metadata模式的观看者，浏览器在原生视频上绘制叠加层"""
+    if not monitoring_active:
+        return
+    camera_id = data.get('camera_id')
+    with stream_mode_lock:
+        targets = [sid for sid, c in metadata_viewers.items() if c is None or c == camera_id]
+    for sid in targets:
+        socketio.emit('update_metadata', data, to=sid)
+
+@socketio.on('set_stream_mode')
+def handle_set_stream_mode(data):
+    """
+    切换本观看者的实时流模式(frames/metadata)
+    
+    metadata模式的观看者不再接收图像帧，只接收检测元数据；摄像头的输出模式由所有观看者的选择决定，
+    仍有画面观看者时检测服务继续输出图像帧
+    """
+    mode = data.get('mode')
+    if mode not in ('frames', 'metadata'):
+        return {'success': False, 'message': f'无效的输出模式: {mode}'}
+    if mode == 'metadata':
+        viewer_controller.remove_viewer(request.sid)
+        with stream_mode_lock:
+            metadata_viewers[request.sid] = data.get('camera_id')
+    else:
+        with stream_mode_lock:
+            metadata_viewers.pop(request.sid, None)
+        viewer_controller.add_viewer(request.sid)
+    update_camera_stream_modes()
+    return {'success': True, 'mode': mode}
+
 @socketio.on('save_accident')
 def handle_save_accident(data):
     """处理事故捕捉保存请求"""
@@ -497,6 +604,44 @@ def upload_video():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+# 视频检测任务: 每次上传有自己的任务ID，对应一个YOLO任务ID
+# YOLO服务器会把相同视频的上传合并到同一个任务，此时多个上传等待同一个YOLO任务。
+# 结果由页面轮询/check/video_job/<job_id>获取，YOLO任务结束后只取一次结果、下载一次视频，
+# 再分别保存到每个等待者自己的文件
+YOLO_JOB_MAX_AGE = 6 * 3600  # 秒，超过后清理任务记录
+video_jobs = {}  # 上传任务ID -> 上传信息和处理结果
+yolo_job_waiters = {}  # YOLO任务ID -> [上传任务ID, ...]
+finalizing_yolo_jobs = set()  # 正在下载和保存结果的YOLO任务
+video_jobs_lock = threading.Lock()
+
+def register_video_job(job_id, yolo_job_id, **info):
+    """记录提交的视频任务并加入YOLO任务的等待者，同时清理过期的记录"""
+    now = time.time()
+    with video_jobs_lock:
+        for old_id in [k for k, v in video_jobs.items() if now - v['created'] > YOLO_JOB_MAX_AGE]:
+            _remove_waiter(video_jobs.pop(old_id))
+        video_jobs[job_id] = dict(info, job_id=job_id, yolo_job_id=yolo_job_id,
+                                  created=now, response=None)
+        yolo_job_waiters.setdefault(yolo_job_id, []).append(job_id)
+
+def _remove_waiter(info):
+    """
+    从YOLO任务的等待者中移除(调用时需持有锁)
+
+    返回:
+        int: 该YOLO任务剩余的等待者数量
+    """
+    waiters = yolo_job_waiters.get(info['yolo_job_id'], [])
+    if info['job_id'] in waiters:
+        waiters.remove(info['job_id'])
+    if not waiters:
+        yolo_job_waiters.pop(info['yolo_job_id'], None)
+    return len(waiters)
+
+def cancel_yolo_job(job_id):
+    """取消YOLO服务器上的任务，返回YOLO服务器的响应"""
+    return requests.post(f"{YOLO_URL}/jobs/{job_id}/cancel", timeout=10)
+
 @bp.route('/video_predict', methods=['POST'])
 @login_required
 def video_predict():
@@ -560,20 +705,78 @@ def video_predict():
         # 发送请求到YOLO服务器进行处理
         try:
             # 使用with语句正确关闭文件
+            # 以异步任务提交，避免长视频处理期间请求超时
             with open(input_path, 'rb') as video_file:
                 files = {'video': (input_filename, video_file, 'video/mp4')}
-                print(f"[视频检测] 发送请求到YOLO服务器: {YOLO_URL}/video_predict")
-                response = requests.post(YOLO_URL + '/video_predict', files=files, timeout=300)  # 增加超时时间
+                print(f"[视频检测] 提交任务到YOLO服务器: {YOLO_URL}/video_predict")
+                response = requests.post(YOLO_URL + '/video_predict', files=files,
+                                         data={'async': '1'}, timeout=60)
         except Exception as e:
             print(f"[视频检测] 发送请求失败: {str(e)}")
             return jsonify({"error": f"连接YOLO服务器失败: {str(e)}"}), 500
         
         # 检查响应状态
-        if response.status_code != 200:
+        if response.status_code != 202:
             print(f"[视频检测] YOLO服务器返回错误: {response.status_code}, 内容: {response.text}")
             return jsonify({"error": f"YOLO服务器处理失败: {response.text}"}), 500
+        
+        job = response.json()
+        yolo_job_id = job['job_id']
+        job_id = uuid.uuid4().hex
+        if job.get('coalesced'):
+            print(f"[视频检测] 相同视频正在处理，任务 {job_id} 等待YOLO任务: {yolo_job_id}")
+        else:
+            print(f"[视频检测] YOLO任务已提交: {yolo_job_id}，任务ID: {job_id}")
+        try:
+            register_video_job(job_id, yolo_job_id, timestamp=timestamp, secure_name=secure_name,
+                               record_filename=record_filename)
+        except Exception as e:
+            # 无法跟踪的任务不再占用YOLO服务器(合并的任务属于其他上传，不取消)
+            if not job.get('coalesced'):
+                try:
+                    cancel_yolo_job(yolo_job_id)
+                except Exception as cancel_error:
+                    print(f"[视频检测] 取消YOLO任务失败: {str(cancel_error)}")
+            raise
+        
+        # 立即返回任务ID，页面轮询status_url获取结果，也可以订阅progress_url获取进度
+        return jsonify({
+            'job_id': job_id,
+            'yolo_job_id': yolo_job_id,
+            'status': job.get('status', 'queued'),
+            'status_url': url_for('check.video_job_status', job_id=job_id),
+            'cancel_url': url_for('check.video_job_cancel', job_id=job_id),
+            'progress_url': YOLO_URL + job.get('progress_url', f"/video_progress/{yolo_job_id}")
+        }), 202
+        
+    except Exception as e:
+        print(f"[视频检测错误] {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+def finish_video_job(info, job, downloads):
+    """
+    处理完成的YOLO视频任务: 广播检测结果，下载处理后的视频并保存元数据
+    
+    参数:
+        info: 提交任务时记录的上传信息(job_id/timestamp/secure_name/record_filename)
+        job: YOLO服务器返回的任务结果(包含status/result/error)
+        downloads: 已下载的视频(URL -> 响应)，同一YOLO任务的等待者共用，只下载一次
+    
+    返回:
+        tuple: (响应内容, HTTP状态码)
+    """
+    timestamp = info['timestamp']
+    secure_name = info['secure_name']
+    record_filename = info['record_filename']
+    try:
+        if job.get('status') == 'failed' or not job.get('result'):
+            print(f"[视频检测] YOLO任务失败: {job.get('error')}")
+            return {"error": f"YOLO服务器处理失败: {job.get('error')}"}, 500
             
-        result = response.json()
+        # 每个等待者修改自己的结果副本
+        result = dict(job['result'])
         print(f"[视频检测] YOLO处理结果: {result}")
         
         # 存储检测结果
@@ -633,7 +836,8 @@ def video_predict():
         video_duration = result.get('duration', '00:00:00')
         
         if download_url:
-            output_filename = os.path.basename(download_url)
+            # 输出文件按上传任务命名，合并到同一YOLO任务的上传各自保存一份
+            output_filename = f"{info['job_id']}_{os.path.basename(download_url)}"
             try:
                 # 检查URL格式，确保正确处理相对和绝对URL
                 if not download_url.startswith(('http://', 'https://')):
@@ -642,7 +846,10 @@ def video_predict():
                     full_url = download_url
                     
                 print(f"[视频检测] 下载处理后的视频: {full_url}")
-                download_response = requests.get(full_url, timeout=180)  # 增加超时时间
+                download_response = downloads.get(full_url)
+                if download_response is None:
+                    download_response = requests.get(full_url, timeout=180)  # 增加超时时间
+                    downloads[full_url] = download_response
                 
                 if download_response.status_code == 200:
                     # 获取处理后的视频数据
@@ -650,7 +857,7 @@ def video_predict():
                     
                     if len(processed_video_data) == 0:
                         print("[视频检测] 警告：下载的视频数据为空")
-                        return jsonify({"error": "下载的处理视频为空"}), 500
+                        return {"error": "下载的处理视频为空"}, 500
                     
                     # 保存到RESULT_FOLDER目录
                     output_path = os.path.join(RESULT_FOLDER, output_filename)
@@ -784,15 +991,15 @@ def video_predict():
                     })
                 else:
                     print(f"[视频检测] 下载视频失败，状态码: {download_response.status_code}, 内容: {download_response.text[:200]}")
-                    return jsonify({"error": f"下载处理后的视频失败: HTTP {download_response.status_code}"}), 500
+                    return {"error": f"下载处理后的视频失败: HTTP {download_response.status_code}"}, 500
             except Exception as e:
                 print(f"[视频检测] 下载或保存视频失败: {str(e)}")
                 import traceback
                 traceback.print_exc()
-                return jsonify({"error": f"下载或保存处理后的视频失败: {str(e)}"}), 500
+                return {"error": f"下载或保存处理后的视频失败: {str(e)}"}, 500
         else:
             print("[视频检测] YOLO结果中没有下载URL")
-            return jsonify({"error": "YOLO处理结果中缺少视频下载链接"}), 500
+            return {"error": "YOLO处理结果中缺少视频下载链接"}, 500
         
         # 同步更新视频库
         try:
@@ -800,13 +1007,105 @@ def video_predict():
         except Exception as e:
             print(f"[视频检测] 同步视频库失败: {str(e)}")
         
-        return jsonify(result)
+        return result, 200
         
     except Exception as e:
         print(f"[视频检测错误] {str(e)}")
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+@bp.route('/video_job/<job_id>', methods=['GET'])
+@login_required
+def video_job_status(job_id):
+    """
+    查询视频任务
+    
+    任务未结束时返回202和YOLO服务器的任务状态；YOLO任务结束后为它的所有等待者
+    下载并保存处理结果，返回200和检测结果。
+    """
+    with video_jobs_lock:
+        info = video_jobs.get(job_id)
+        if info is None:
+            return jsonify({"error": "任务不存在或已过期", "job_id": job_id}), 404
+        if info['response'] is not None:
+            body, status_code = info['response']
+            return jsonify(body), status_code
+        yolo_job_id = info['yolo_job_id']
+        if yolo_job_id in finalizing_yolo_jobs:
+            return jsonify({"job_id": job_id, "status": "saving"}), 202
+    
+    try:
+        response = requests.get(f"{YOLO_URL}/jobs/{yolo_job_id}/result", timeout=10)
+    except Exception as e:
+        # 查询失败不影响任务本身，页面稍后重试或主动取消
+        print(f"[视频检测] 查询YOLO任务失败: {str(e)}")
+        return jsonify({"error": f"连接YOLO服务器失败: {str(e)}", "job_id": job_id}), 502
+    if response.status_code == 404:
+        with video_jobs_lock:
+            video_jobs.pop(job_id, None)
+            _remove_waiter(info)
+        return jsonify({"error": f"任务不存在或已过期: {job_id}", "job_id": job_id}), 404
+    if response.status_code != 200:
+        return jsonify(dict(response.json(), job_id=job_id)), response.status_code
+    
+    # YOLO任务已结束(取结果后YOLO服务器会在短时间后删除输出文件)，
+    # 由一个请求为所有等待者下载一次视频并分别保存
+    with video_jobs_lock:
+        if yolo_job_id in finalizing_yolo_jobs or info['response'] is not None:
+            return jsonify({"job_id": job_id, "status": "saving"}), 202
+        finalizing_yolo_jobs.add(yolo_job_id)
+        waiters = [video_jobs[w] for w in yolo_job_waiters.pop(yolo_job_id, []) if w in video_jobs]
+    job = response.json()
+    downloads = {}
+    try:
+        for waiter in waiters:
+            try:
+                body, status_code = finish_video_job(waiter, job, downloads)
+            except Exception as e:
+                body, status_code = {"error": str(e)}, 500
+            with video_jobs_lock:
+                waiter['response'] = (dict(body, job_id=waiter['job_id']), status_code)
+    finally:
+        with video_jobs_lock:
+            finalizing_yolo_jobs.discard(yolo_job_id)
+    
+    with video_jobs_lock:
+        if info['response'] is None:
+            # 查询期间已取消
+            return jsonify({"error": "任务已取消", "job_id": job_id}), 404
+        body, status_code = info['response']
+    return jsonify(body), status_code
+
+@bp.route('/video_job/<job_id>/cancel', methods=['POST'])
+@login_required
+def video_job_cancel(job_id):
+    """
+    取消视频任务
+    
+    只有YOLO任务的最后一个等待者取消时才取消YOLO任务(运行中的任务保留已完成的部分)，
+    其他上传合并到同一任务时继续处理。
+    """
+    with video_jobs_lock:
+        info = video_jobs.get(job_id)
+        if info is None:
+            return jsonify({"error": "任务不存在或已过期", "job_id": job_id}), 404
+        if info['response'] is not None:
+            body, status_code = info['response']
+            return jsonify(dict(body, error="任务已结束")), 409
+        if info['yolo_job_id'] in finalizing_yolo_jobs:
+            return jsonify({"error": "任务已结束，正在保存结果", "job_id": job_id}), 409
+        video_jobs.pop(job_id, None)
+        remaining = _remove_waiter(info)
+    if remaining:
+        print(f"[视频检测] 任务 {job_id} 已取消，YOLO任务 {info['yolo_job_id']} 还有 {remaining} 个等待者")
+        return jsonify({"job_id": job_id, "status": "cancelled", "waiters": remaining})
+    try:
+        response = cancel_yolo_job(info['yolo_job_id'])
+    except Exception as e:
+        print(f"[视频检测] 取消YOLO任务失败: {str(e)}")
+        return jsonify({"error": f"连接YOLO服务器失败: {str(e)}", "job_id": job_id}), 502
+    return jsonify(dict(response.json(), job_id=job_id)), response.status_code
 
 # 视频检测页面 
 @bp.route('/video')
@@ -913,10 +1212,10 @@ def clear_accident_captures():
             'message': str(e)
         }), 500
 
-# 添加一个额外的Socket事件处理函数，用于处理检测结果并自动检查事故
+# 添加一个额外的Socket事件处理函数，用于记录检测历史
 @socketio.on('update_detections')
 def detection_handler(data):
-    """处理并存储检测结果，自动检查事故"""
+    """处理并存储检测结果(事故抓拍和短信通知由incident事件按事件触发)"""
     try:
         # 如果监控未启用，直接返回
         global monitoring_active
@@ -937,82 +1236,89 @@ def detection_handler(data):
                 }
                 detection_history.appendleft(record)
                 print(f"[检测历史] 已保存新的检测记录，当前历史记录数: {len(detection_history)}", flush=True)
-                
-                # 检查是否有事故，如果有则自动保存到事故记录中
-                if 'image' in data and data.get('image') and check_frame_for_accident(data['detections']):
-                    print("[检测历史] 发现事故，自动保存到事故记录", flush=True)
-                    
-                    # 创建事故记录
-                    accident_record = {
-                        'id': str(uuid.uuid4()),
-                        'timestamp': datetime.now().isoformat(),
-                        'image': data['image'],
-                        'detections': data['detections'],
-                        'location': data.get('location', '未知位置'),
-                        'auto_detected': True
-                    }
-                    
-                    # 保存到事故队列
-                    with accident_captures_lock:
-                        accident_captures.appendleft(accident_record)
-                        print(f"[事故检测] 自动添加到事故队列，当前记录数: {len(accident_captures)}", flush=True)
-                    
-                    # 保存图像到文件系统
-                    save_result = save_accident_image(data['image'])
-                    if save_result['success']:
-                        print(f"[事故检测] 自动保存事故图像成功: {save_result['path']}", flush=True)
-                        accident_record['file_path'] = save_result['path']
-                        accident_record['file_url'] = save_result['url']
-                    
-                    # 通知客户端有事故捕捉
-                    socketio.emit('accident_detected', {
-                        'id': accident_record['id'],
-                        'timestamp': accident_record['timestamp'],
-                        'message': '系统自动检测到事故车辆',
-                        'success': True
-                    })
-                    
-                    # 发送短信通知 (新增)
-                    try:
-                        from src.utils.sms import send_accident_notification
-                        
-                        # 检查是否启用了短信功能
-                        sms_enabled = current_app.config.get('SMS_ENABLED', False)
-                        if not sms_enabled:
-                            print("[事故通知] 短信功能未启用，跳过短信通知", flush=True)
-                            return
-                            
-                        # 获取配置中的通知手机号码
-                        notify_numbers = current_app.config.get('ACCIDENT_NOTIFY_NUMBERS', [])
-                        if notify_numbers:
-                            # 格式化时间为人类可读形式
-                            accident_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            # 获取事故类型
-                            accident_type = "交通事故"
-                            # 获取位置信息
-                            location = accident_record.get('location', '监控区域')
-                            
-                            # 遍历所有需要通知的手机号码
-                            for mobile in notify_numbers:
-                                try:
-                                    # 发送短信通知
-                                    result = send_accident_notification(mobile, accident_type, location, accident_time)
-                                    if result:
-                                        print(f"[事故通知] 成功发送短信通知到 {mobile}", flush=True)
-                                    else:
-                                        print(f"[事故通知] 发送短信通知到 {mobile} 失败", flush=True)
-                                except Exception as sms_err:
-                                    print(f"[事故通知] 向 {mobile} 发送短信时出错: {str(sms_err)}", flush=True)
-                        else:
-                            print("[事故通知] 未配置通知手机号码，跳过短信通知", flush=True)
-                    except Exception as notify_err:
-                        print(f"[事故通知] 发送短信通知时出错: {str(notify_err)}", flush=True)
                     
     except Exception as e:
         print(f"[检测处理] 处理检测结果失败: {str(e)}", flush=True)
         import traceback
         traceback.print_exc()
 
+@socketio.on('incident')
+def handle_incident(data):
+    """检测服务聚合后的事件变化，每起事故只在开始时自动抓拍并发送一次短信通知"""
+    try:
+        incident = data.get('incident') or {}
+        # 转发给页面，便于显示进行中的事件
+        socketio.emit('incident_update', {'event': data.get('event'), 'incident': incident})
+        if data.get('event') != 'start' or incident.get('type') != 'accident':
+            return
+        if not monitoring_active:
+            return
+        print(f"[事故检测] 事故事件开始: {incident.get('id')} (视频源: {incident.get('source_id')})", flush=True)
+
+        accident_record = {
+            'id': str(uuid.uuid4()),
+            'incident_id': incident.get('id'),
+            'timestamp': datetime.now().isoformat(),
+            'image': data.get('image', ''),
+            'detections': [incident],
+            'location': data.get('location', '未知位置'),
+            'auto_detected': True
+        }
+        with accident_captures_lock:
+            accident_captures.appendleft(accident_record)
+            print(f"[事故检测] 自动添加到事故队列，当前记录数: {len(accident_captures)}", flush=True)
+
+        if data.get('image'):
+            save_result = save_accident_image(data['image'])
+            if save_result['success']:
+                print(f"[事故检测] 自动保存事故图像成功: {save_result['path']}", flush=True)
+                accident_record['file_path'] = save_result['path']
+                accident_record['file_url'] = save_result['url']
+
+        # 通知客户端有事故捕捉
+        socketio.emit('accident_detected', {
+            'id': accident_record['id'],
+            'incident_id': incident.get('id'),
+            'timestamp': accident_record['timestamp'],
+            'message': '系统自动检测到事故车辆',
+            'success': True
+        })
+
+        notify_accident(accident_record.get('location', '监控区域'))
+    except Exception as e:
+        print(f"[事故检测] 处理事件失败: {str(e)}", flush=True)
+        import traceback
+        traceback.print_exc()
+
+def notify_accident(location):
+    """向配置的手机号码发送事故短信通知"""
+    try:
+        from src.utils.sms import send_accident_notification
+
+        # 检查是否启用了短信功能
+        if not current_app.config.get('SMS_ENABLED', False):
+            print("[事故通知] 短信功能未启用，跳过短信通知", flush=True)
+            return
+
+        # 获取配置中的通知手机号码
+        notify_numbers = current_app.config.get('ACCIDENT_NOTIFY_NUMBERS', [])
+        if not notify_numbers:
+            print("[事故通知] 未配置通知手机号码，跳过短信通知", flush=True)
+            return
+
+        accident_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for mobile in notify_numbers:
+            try:
+                result = send_accident_notification(mobile, "交通事故", location, accident_time)
+                if result:
+                    print(f"[事故通知] 成功发送短信通知到 {mobile}", flush=True)
+                else:
+                    print(f"[事故通知] 发送短信通知到 {mobile} 失败", flush=True)
+            except Exception as sms_err:
+                print(f"[事故通知] 向 {mobile} 发送短信时出错: {str(sms_err)}", flush=True)
+    except Exception as notify_err:
+        print(f"[事故通知] 发送短信通知时出错: {str(notify_err)}", flush=True)
+
 # 添加处理视频质量设置的事件
 @socketio.on('set_video_quality')
 def handle_set_video_quality(data):
@@ -0,0 +1,247 @@
+#实时画面按观看者的拥塞控制
+import base64
+import math
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+try:
+    from eventlet import tpool
+    HAS_TPOOL = True
+except ImportError:
+    HAS_TPOOL = False
+
+# 画质档位，从高到低。scale为相对检测服务输出画面的缩放比例，quality为None时直接转发原图
+DEFAULT_LADDER = [
+    {'name': 'HIGH', 'scale': 1.0, 'quality': None, 'max_fps': 30},
+    {'name': 'MEDIUM', 'scale': 0.75, 'quality': 70, 'max_fps': 15},
+    {'name': 'LOW', 'scale': 0.5, 'quality': 60, 'max_fps': 8},
+    {'name': 'MINIMAL', 'scale': 0.5, 'quality': 45, 'max_fps': 3},
+]
+
+
+class ViewerState:
+    """单个观看者的发送状态"""
+
+    def __init__(self, sid, level, window):
+        self.sid = sid
+        self.level = level
+        self.inflight = deque()  # 已发送未确认帧的发送时间
+        self.lag = None  # 确认延迟的指数平均(秒)
+        self.window = window  # 发送窗口(未确认帧数上限)，通畅时逐帧增大，拥塞时减半
+        self.lag_samples = deque()  # (确认时间, 确认延迟)，延迟单调递增，队首为窗口内的最小值
+        self.last_sent = 0.0
+        self.last_change = time.time()
+        self.last_congestion = 0.0
+        self.sent = 0
+        self.acked = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.consecutive_timeouts = 0  # 上次确认以来超时的帧数
+
+
+class ViewerCongestionController:
+    """
+    按观看者调整实时画面的分辨率、JPEG质量和帧率
+
+    每个观看者收到帧后回复确认(ack)。拥塞按排队延迟判断: 确认延迟超出该观看者基础往返时间
+    (最近的最小确认延迟)的部分超过阈值时降低档位，持续通畅时逐级恢复。往返时间长但带宽充足的
+    连接(如移动网络)排队延迟不增长，不会被降档。
+    未确认帧数的上限(发送窗口)在通畅时逐帧增大到基础往返时间×档位帧率，拥塞时减半；
+    窗口满时跳过该观看者的新帧而不排队，
+    只有排队延迟同时在增长时才视为拥塞。慢速客户端只会降低自己的画质和帧率，不会积压延迟，
+    也不影响其他观看者。连续max_timeouts帧都没有确认的观看者视为已断开，不再发送。
+    """
+
+    def __init__(self, ladder=None, max_inflight=2, lag_high=0.4, lag_low=0.1,
+                 step_up_after=5.0, step_down_cooldown=1.0, ack_timeout=5.0, max_timeouts=3,
+                 max_window=16, min_rtt_window=10.0):
+        """
+        Args:
+            ladder: 画质档位列表(从高到低)
+            max_inflight: 发送窗口的最小值(未测得往返时间时使用)
+            lag_high: 排队延迟(确认延迟超出基础往返时间的部分)超过此值(秒)时降档
+            lag_low: 排队延迟低于此值(秒)且持续step_up_after秒无拥塞时升档；
+                     窗口满时排队延迟超过此值才视为拥塞
+            step_up_after: 升档前需要保持通畅的时间(秒)
+            step_down_cooldown: 两次降档的最小间隔(秒)，等待上一次降档生效
+            ack_timeout: 超过此时间未确认的帧视为丢失(秒)
+            max_timeouts: 连续超时未确认的帧数达到此值时移除该观看者
+            max_window: 发送窗口的最大值
+            min_rtt_window: 基础往返时间取最近多少秒内的最小确认延迟，旧样本过期后适应网络变化
+        """
+        self.ladder = ladder or DEFAULT_LADDER
+        self.max_inflight = max_inflight
+        self.lag_high = lag_high
+        self.lag_low = lag_low
+        self.step_up_after = step_up_after
+        self.step_down_cooldown = step_down_cooldown
+        self.ack_timeout = ack_timeout
+        self.max_timeouts = max_timeouts
+        self.max_window = max_window
+        self.min_rtt_window = min_rtt_window
+        self.viewers = {}
+        self._lock = threading.Lock()
+
+    def add_viewer(self, sid, level=0):
+        with self._lock:
+            self.viewers[sid] = ViewerState(sid, level, self.max_inflight)
+
+    def remove_viewer(self, sid):
+        with self._lock:
+            self.viewers.pop(sid, None)
+
+    def select(self, now=None):
+        """
+        选出本帧要发送的观看者
+
+        Returns:
+            dict: {档位序号: [(sid, 发送时间), ...]}，确认时把发送时间传给on_ack
+        """
+        now = now or time.time()
+        targets = {}
+        with self._lock:
+            for viewer in list(self.viewers.values()):
+                self._expire(viewer, now)
+                if viewer.consecutive_timeouts >= self.max_timeouts:
+                    # 断开时未能移除(或客户端不再确认)的观看者不再占用转码和发送
+                    del self.viewers[viewer.sid]
+                    continue
+                rung = self.ladder[viewer.level]
+                if len(viewer.inflight) >= min(viewer.window, self._target_window(viewer, rung)):
+                    # 窗口已满，跳过而不是排队；排队延迟稳定时只是往返时间较长，不算拥塞
+                    viewer.skipped += 1
+                    if self._queue_delay(viewer) > self.lag_low:
+                        self._congested(viewer, now)
+                    continue
+                if now - viewer.last_sent < 1.0 / rung['max_fps']:
+                    continue
+                viewer.inflight.append(now)
+                viewer.last_sent = now
+                viewer.sent += 1
+                targets.setdefault(viewer.level, []).append((viewer.sid, now))
+        return targets
+
+    def on_ack(self, sid, sent_at, now=None):
+        """观看者确认收到一帧"""
+        now = now or time.time()
+        with self._lock:
+            viewer = self.viewers.get(sid)
+            if viewer is None:
+                return
+            try:
+                viewer.inflight.remove(sent_at)
+            except ValueError:
+                return  # 已按超时处理
+            viewer.acked += 1
+            viewer.consecutive_timeouts = 0
+            lag = now - sent_at
+            viewer.lag = lag if viewer.lag is None else 0.7 * viewer.lag + 0.3 * lag
+            # 滑动窗口最小值: 新样本淘汰队尾更大的样本，过期样本从队首移除
+            samples = viewer.lag_samples
+            while samples and samples[-1][1] >= lag:
+                samples.pop()
+            samples.append((now, lag))
+            while samples[0][0] < now - self.min_rtt_window:
+                samples.popleft()
+            queue_delay = self._queue_delay(viewer)
+            if queue_delay > self.lag_high:
+                self._congested(viewer, now)
+                return
+            if queue_delay < self.lag_low:
+                # 排队延迟稳定时逐帧增大窗口，直到覆盖基础往返时间
+                viewer.window = min(viewer.window + 1, self._target_window(viewer, self.ladder[viewer.level]))
+            if (queue_delay < self.lag_low and viewer.level > 0
+                  and now - max(viewer.last_change, viewer.last_congestion) >= self.step_up_after):
+                viewer.level -= 1
+                viewer.last_change = now
+
+    def _min_lag(self, viewer):
+        """基础往返时间: 最近min_rtt_window秒内的最小确认延迟(秒)，没有测量值时为None"""
+        return viewer.lag_samples[0][1] if viewer.lag_samples else None
+
+    def _queue_delay(self, viewer):
+        """确认延迟超出基础往返时间的部分(秒)，没有测量值时为0"""
+        min_lag = self._min_lag(viewer)
+        if viewer.lag is None or min_lag is None:
+            return 0.0
+        return max(0.0, viewer.lag - min_lag)
+
+    def _target_window(self, viewer, rung):
+        """发送窗口的目标大小: 基础往返时间内按档位帧率发出的帧数"""
+        min_lag = self._min_lag(viewer)
+        if min_lag is None:
+            return self.max_inflight
+        window = math.ceil(min_lag * rung['max_fps']) + 1
+        return max(self.max_inflight, min(self.max_window, window))
+
+    def _expire(self, viewer, now):
+        """超时未确认的帧视为丢失(调用时需持有锁)"""
+        while viewer.inflight and now - viewer.inflight[0] > self.ack_timeout:
+            viewer.inflight.popleft()
+            viewer.timeouts += 1
+            viewer.consecutive_timeouts += 1
+            self._congested(viewer, now)
+
+    def _congested(self, viewer, now):
+        """记录拥塞，冷却时间已过时降一档并把发送窗口减半(调用时需持有锁)"""
+        viewer.last_congestion = now
+        if viewer.level < len(self.ladder) - 1 and now - viewer.last_change >= self.step_down_cooldown:
+            viewer.level += 1
+            viewer.last_change = now
+            viewer.window = max(self.max_inflight, viewer.window // 2)
+
+    def render(self, image, level):
+        """
+        生成档位对应的画面
+
+        Args:
+            image: 检测服务发送的JPEG(bytes或Base64字符串)
+            level: 档位序号
+
+        Returns:
+            与输入类型相同的JPEG数据
+        """
+        rung = self.ladder[level]
+        if rung['quality'] is None and rung['scale'] >= 1.0:
+            return image
+        is_text = isinstance(image, str)
+        data = base64.b64decode(image) if is_text else bytes(image)
+        if HAS_TPOOL:
+            # 解码和编码在线程池中进行，不阻塞eventlet的事件循环
+            encoded = tpool.execute(_transcode, data, rung['scale'], rung['quality'] or 80)
+        else:
+            encoded = _transcode(data, rung['scale'], rung['quality'] or 80)
+        if encoded is None:
+            return image
+        return base64.b64encode(encoded).decode('utf-8') if is_text else encoded
+
+    def stats(self):
+        with self._lock:
+            return [{
+                'sid': v.sid,
+                'level': self.ladder[v.level]['name'],
+                'lag_ms': None if v.lag is None else round(v.lag * 1000, 1),
+                'min_rtt_ms': None if not v.lag_samples else round(self._min_lag(v) * 1000, 1),
+                'inflight': len(v.inflight),
+                'window': min(v.window, self._target_window(v, self.ladder[v.level])),
+                'sent': v.sent,
+                'acked': v.acked,
+                'skipped': v.skipped,
+                'timeouts': v.timeouts
+            } for v in self.viewers.values()]
+
+
+def _transcode(data, scale, quality):
+    """缩放并重新编码JPEG，缩小一半时在解码阶段完成缩放"""
+    flags = cv2.IMREAD_REDUCED_COLOR_2 if scale <= 0.5 else cv2.IMREAD_COLOR
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if frame is None:
+        return None
+    if 0.5 < scale < 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+    return buffer.tobytes() if ok else None
@@ -0,0 +1,120 @@
+/**
+ * 检测结果叠加层
+ *
+ * 实时流工作在metadata模式时，检测服务只推送检测元数据(update_metadata事件)，
+ * 由浏览器在原生视频(SRS的HTTP-FLV/HLS)上绘制检测框、类别、跟踪ID和车牌。
+ * 监控页面(templates/check/monitor.html)的原生视频模式使用此叠加层。
+ *
+ * 用法:
+ *   const overlay = new DetectionOverlay(videoElement, canvasElement, {cameraId: 'livestream', delayMs: 1500});
+ *   socket.on('update_metadata', (data) => overlay.push(data));
+ *   socket.emit('set_stream_mode', {camera_id: 'livestream', mode: 'metadata'});
+ *
+ * 原生视频通常比元数据晚到(播放器缓冲)，delayMs为视频相对元数据的延迟，
+ * 绘制时选取采集时间最接近(当前时间 - delayMs)的元数据。
+ * capture_time是检测服务的时钟，与浏览器时钟可能不一致: 按元数据到达时(本地时间 - capture_time)
+ * 在最近offsetWindowMs内的最小值估计时钟差(包含最小传输延迟)，换算到检测服务的时间后再选取。
+ */
+class DetectionOverlay {
+    constructor(video, canvas, options = {}) {
+        this.video = video;
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.cameraId = options.cameraId || null;
+        this.delayMs = options.delayMs || 0;
+        this.maxAgeMs = options.maxAgeMs || 1000;  // 元数据超过此时间未更新则不再绘制
+        this.bufferSize = options.bufferSize || 120;
+        this.colors = options.colors || {};
+        this.offsetWindowMs = options.offsetWindowMs || 30000;
+        this.offsetSamples = [];  // [到达时间, 本地时间 - capture_time]，差值单调递增，队首为窗口内最小值
+        this.buffer = [];
+        this.running = true;
+        this._draw = this._draw.bind(this);
+        requestAnimationFrame(this._draw);
+    }
+
+    push(metadata) {
+        if (this.cameraId && metadata.camera_id !== this.cameraId) return;
+        this._updateOffset(Date.now(), metadata.capture_time);
+        this.buffer.push(metadata);
+        if (this.buffer.length > this.bufferSize) {
+            this.buffer.splice(0, this.buffer.length - this.bufferSize);
+        }
+    }
+
+    stop() {
+        this.running = false;
+        this.ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+    }
+
+    _updateOffset(now, captureTime) {
+        // 滑动窗口最小值: 新样本淘汰队尾更大的样本，过期样本从队首移除
+        const sample = now - captureTime;
+        const samples = this.offsetSamples;
+        while (samples.length && samples[samples.length - 1][1] >= sample) samples.pop();
+        samples.push([now, sample]);
+        while (samples[0][0] < now - this.offsetWindowMs) samples.shift();
+    }
+
+    // 浏览器时钟与检测服务时钟的差(毫秒)，还没有元数据时为0
+    clockOffset() {
+        return this.offsetSamples.length ? this.offsetSamples[0][1] : 0;
+    }
+
+    _select(targetTime) {
+        // 取采集时间不晚于目标时间的最新一条，之前的元数据不再需要
+        let index = -1;
+        for (let i = 0; i < this.buffer.length; i++) {
+            if (this.buffer[i].capture_time <= targetTime) index = i;
+            else break;
+        }
+        if (index < 0) return null;
+        if (index > 0) this.buffer.splice(0, index);
+        const metadata = this.buffer[0];
+        return targetTime - metadata.capture_time <= this.maxAgeMs ? metadata : null;
+    }
+
+    _draw() {
+        if (!this.running) return;
+        const width = this.video.clientWidth;
+        const height = this.video.clientHeight;
+        if (this.canvas.width !== width || this.canvas.height !== height) {
+            this.canvas.width = width;
+            this.canvas.height = height;
+        }
+        this.ctx.clearRect(0, 0, width, height);
+
+        const metadata = this._select(Date.now() - this.clockOffset() - this.delayMs);
+        if (metadata && metadata.width && metadata.height) {
+            // 检测坐标基于检测服务的画面尺寸，按视频的显示区域(保持宽高比)换算
+            const videoWidth = this.video.videoWidth || metadata.width;
+            const videoHeight = this.video.videoHeight || metadata.height;
+            const scale = Math.min(width / videoWidth, height / videoHeight);
+            const offsetX = (width - videoWidth * scale) / 2;
+            const offsetY = (height - videoHeight * scale) / 2;
+            const sx = scale * videoWidth / metadata.width;
+            const sy = scale * videoHeight / metadata.height;
+
+            this.ctx.lineWidth = 2;
+            this.ctx.font = '14px sans-serif';
+            for (const det of metadata.detections || []) {
+                const [x1, y1, x2, y2] = det.coordinates;
+                const x = offsetX + x1 * sx;
+                const y = offsetY + y1 * sy;
+                const color = this.colors[det.class_id] || '#00ff00';
+                this.ctx.strokeStyle = color;
+                this.ctx.strokeRect(x, y, (x2 - x1) * sx, (y2 - y1) * sy);
+
+                let label = `${det.class} ${(det.confidence * 100).toFixed(0)}%`;
+                if (det.track_id != null) label = `#${det.track_id} ${label}`;
+                if (det.plate_text) label += ` ${det.plate_text}`;
+                const textWidth = this.ctx.measureText(label).width;
+                this.ctx.fillStyle = color;
+                this.ctx.fillRect(x, Math.max(0, y - 18), textWidth + 6, 18);
+                this.ctx.fillStyle = '#000000';
+                this.ctx.fillText(label, x + 3, Math.max(14, y - 4));
+            }
+        }
+        requestAnimationFrame(this._draw);
+    }
+}
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, Response, send_from_directory, send_file
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory, send_file, stream_with_context
 import cv2
 import numpy as np
 import base64
@@ -14,8 +14,14 @@ from werkzeug.utils import secure_filename
 import uuid
 from flask_cors import CORS  # 添加在文件顶部
 import re 
+import hashlib
 import detection  # 导入新的集成检测模块
+from detection.frame_encoder import FORMATS as FRAME_FORMATS, MIME_TYPES as FRAME_MIME_TYPES
 from utils.mqtt_module import MQTTModule  # 导入MQTT模块
+from utils.mqtt_policy import SnapshotPolicy
+from utils.frame_payload import pack_frame
+from utils.job_queue import JobQueue, JobQueueFull
+from utils.result_cache import ResultCache
 import json
 
 # 初始化Flask应用
@@ -41,9 +47,28 @@ mqtt_client = MQTTModule(
     client_id="dawdawdw",
     broker="117.72.120.52",
     port=1883,
-    topic="alarm/command"
+    topic="alarm/command",
+    # 报警命令默认QoS 1(至少送达一次)，检测帧QoS 0
+    lane_qos={
+        'alarm': int(os.environ.get('MQTT_ALARM_QOS', 1)),
+        'frame': int(os.environ.get('MQTT_FRAME_QOS', 0))
+    },
+    payload_format=os.environ.get('MQTT_PAYLOAD_FORMAT', 'json'),
+    # 断开期间的消息暂存到磁盘，重连后限速重放(报警优先)；MQTT_SPOOL_DIR设为空时不暂存
+    spool_dir=os.environ.get('MQTT_SPOOL_DIR', 'mqtt_spool') or None,
+    spool_max_bytes=int(os.environ.get('MQTT_SPOOL_MAX_BYTES', 64 * 1024 ** 2)),
+    frame_spool_max_bytes=int(os.environ.get('MQTT_FRAME_SPOOL_MAX_BYTES', 8 * 1024 ** 2)),
+    spool_max_age=float(os.environ.get('MQTT_SPOOL_MAX_AGE', 24 * 3600)),
+    replay_rate=float(os.environ.get('MQTT_REPLAY_RATE', 20))
 )
 
+# MQTT消息默认只含检测结果，出现以下事件时附带缩小的快照(按流量计费的链路上大部分是重复画面)
+mqtt_snapshot_policy = SnapshotPolicy(
+    events=[e.strip() for e in os.environ.get('MQTT_SNAPSHOT_EVENTS', 'accident,violation,new_plate').split(',') if e.strip()]
+)
+MQTT_SNAPSHOT_WIDTH = int(os.environ.get('MQTT_SNAPSHOT_WIDTH', 480))
+MQTT_SNAPSHOT_QUALITY = int(os.environ.get('MQTT_SNAPSHOT_QUALITY', 60))
+
 # 修改服务器地址为本地地址
 SERVER_URL = 'http://127.0.0.1:5000'  # 本地Flask服务器地址
 
@@ -84,7 +109,8 @@ else:
 # 初始化检测器
 # 统一使用zhlkv3.onnx模型，并利用GPU加速
 log_info("使用统一的zhlkv3.onnx模型初始化检测器")
-detector = detection.get_detector("models/zhlkv3.onnx", device=device)
+MODEL_PATH = "models/zhlkv3.onnx"
+detector = detection.get_detector(MODEL_PATH, device=device)
 
 # 添加专用检测器
 plate_detector = None  # 车牌专用检测器
@@ -96,6 +122,50 @@ detected_objects = []
 processing_lock = threading.Lock()
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
 
+# 运行中的视频任务，每个任务有独立的取消令牌和时间预算
+video_jobs = detection.JobRegistry()
+VIDEO_JOB_TIMEOUT = 600  # 默认时间预算(秒)
+VIDEO_JOB_MAX_TIMEOUT = 3600
+
+# 视频任务队列: 工作线程数即并发上限，任务记录保存在SQLite中，服务重启后未完成的任务重新排队
+job_queue = JobQueue(
+    workers=int(os.environ.get('VIDEO_JOB_WORKERS', 2)),
+    db_path=os.path.join(app.config['UPLOAD_FOLDER'], 'jobs', 'jobs.db'),
+    result_ttl=3600,
+    on_cancel=video_jobs.cancel,
+    logger=log_info
+)
+
+# 检测结果缓存: 键由输入内容哈希、检测参数和模型版本组成，模型文件变化后旧结果自动失效
+MODEL_VERSION = detection.file_fingerprint(MODEL_PATH) if os.path.exists(MODEL_PATH) else MODEL_PATH
+video_cache = ResultCache(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'cache', 'video'),
+    max_bytes=int(os.environ.get('VIDEO_CACHE_MAX_BYTES', 5 * 1024 ** 3)),
+    logger=log_info
+)
+image_cache = ResultCache(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'cache', 'image'),
+    max_bytes=int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 ** 2)),
+    logger=log_info
+)
+IMAGE_CACHE_WAIT = 30  # 等待相同图像的在途请求的最长时间(秒)
+video_job_keys = {}  # 缓存键 -> 最近提交的异步任务ID，用于合并相同的异步请求
+checkpoint_owners = {}  # 检查点目录 -> 正在使用该目录的任务ID，同一目录同时只允许一个任务写入
+checkpoint_owners_lock = threading.Lock()
+
+# 各摄像头的测速标定(地面单应矩阵或图像/地面对应点)，/video_predict通过camera字段选择
+SPEED_CALIBRATION_FILE = os.environ.get('SPEED_CALIBRATION_FILE', 'config/speed_calibration.json')
+speed_calibrations = {}
+if os.path.exists(SPEED_CALIBRATION_FILE):
+    with open(SPEED_CALIBRATION_FILE, 'r', encoding='utf-8') as f:
+        speed_calibrations = json.load(f)
+    log_info(f"已加载 {len(speed_calibrations)} 个摄像头的测速标定")
+
+# 视频任务进度事件，同时通过Socket.IO广播(video_progress)和/video_progress/<job_id>订阅
+video_progress_hub = detection.ProgressHub()
+video_progress_hub.add_listener(
+    lambda event: socketio.emit('video_progress', json.loads(detection.dumps_event(event))))
+
 # 添加帧处理控制变量
 frame_skip = 3  # 每3帧处理1帧，提高帧率
 frame_counter = 0  # 帧计数器
@@ -115,13 +185,22 @@ sio = client_sio.Client(
 frame_buffer = []
 MAX_BUFFER_SIZE = 5  # 最大缓冲区大小
 
+# 实时帧传输格式: binary为JPEG字节(Socket.IO二进制附件/MQTT二进制消息)，base64为旧的JSON字符串格式
+FRAME_TRANSPORT = os.environ.get('FRAME_TRANSPORT', 'binary')
+BINARY_FRAMES = FRAME_TRANSPORT == 'binary'
+
 # 添加视频质量设置变量，用于动态调整质量
 video_quality = {
     'width': 640,  # 默认使用较低分辨率提高帧率
     'height': 360,
-    'quality': 75  # 默认使用较低的JPEG质量以减少传输数据量
+    'quality': 75,  # 默认使用较低的JPEG质量以减少传输数据量
+    'format': 'jpeg',  # jpeg / jpeg_optimized / webp，不开启JPEG优化以降低编码延迟
+    'preset': None  # 当前质量档位名称，自定义设置时为None
 }
 
+# 实时帧编码线程池，按质量档位统计编码耗时和字节数(GET /encoder_stats)
+frame_encoder = detection.FrameEncoderPool(workers=int(os.environ.get('FRAME_ENCODER_WORKERS', 2)))
+
 # 修改batch_size设置
 batch_processing = {
     'enabled': True,
@@ -142,23 +221,43 @@ detection_settings = {
 def log_info(message): print(f"[INFO] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
 def log_error(message): print(f"[ERROR] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
 
-# 处理特定类型检测结果的MQTT发布
-def publish_special_detection(detections):
-    """向MQTT发布特定类型的检测结果"""
-    if not mqtt_client.is_connected() or mqtt_client.is_paused():
+# 事件聚合: 逐帧的事故、违停、超速检测合并为有开始和结束的事件，每个事件只报警一次
+INCIDENT_COMMANDS = {'accident': 'accident', 'illegal_parking': 'illegal_parkin', 'overspeed': 'overspeed'}
+INCIDENT_MIN_FRAMES = int(os.environ.get('INCIDENT_MIN_FRAMES', 2))
+INCIDENT_END_TIMEOUT = float(os.environ.get('INCIDENT_END_TIMEOUT', 5))
+INCIDENT_HOLDOFF = float(os.environ.get('INCIDENT_HOLDOFF', 30))
+# 视频测速结果超过此速度(km/h)时记为超速事件
+SPEED_LIMIT_KMH = float(os.environ.get('SPEED_LIMIT_KMH', 60))
+incident_engine = detection.IncidentEngine(
+    min_frames=INCIDENT_MIN_FRAMES, end_timeout=INCIDENT_END_TIMEOUT, holdoff=INCIDENT_HOLDOFF)
+
+def publish_incident_alarm(incident):
+    """事件开始时向MQTT发送一次报警命令(MQTT断开期间也会排队，重连后发出)"""
+    command = INCIDENT_COMMANDS.get(incident['type'])
+    if command is None or mqtt_client.is_paused():
         return
-        
-    for detection in detections:
-        class_name = detection.get("class_name", "")
-        detection_type = detection.get("type", "")
-        
-        # 只检测accident（事故）
-        if "accident" in class_name.lower() or "accident" in detection_type.lower():
-            try:
-                mqtt_client.publish_command("accident")
-                log_info("MQTT已发送事故警报")
-            except Exception as e:
-                log_error(f"MQTT发送事故警报失败: {str(e)}")
+    try:
+        mqtt_client.publish_command(command)
+        log_info(f"MQTT已发送报警: {command} (事件 {incident['id']})")
+    except Exception as e:
+        log_error(f"MQTT发送报警失败: {str(e)}")
+
+def report_incidents(events, source_id=None, frame=None):
+    """
+    报告事件变化: 事件开始时发送MQTT报警，并通知Flask服务器(事故自动抓拍和短信通知)
+    
+    frame为source_id当前帧，附带在该视频源新开始事件的快照中
+    """
+    for event, incident in events:
+        if event == 'start':
+            publish_incident_alarm(incident)
+        payload = {'event': event, 'incident': incident}
+        if event == 'start' and frame is not None and incident['source_id'] == source_id:
+            snapshot = mqtt_snapshot(frame)
+            if snapshot is not None:
+                # 快照会保存在事故记录中并通过JSON接口返回，固定使用base64
+                payload['image'] = base64.b64encode(snapshot).decode('utf-8')
+        emit_to_server('incident', payload)
 
 # 添加全局错误处理
 @app.errorhandler(Exception)
@@ -194,11 +293,12 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def cleanup_temp_files():
-    """清理超过1小时的临时文件"""
+    """清理超过1小时的临时文件(任务队列中未过期的任务文件除外)"""
     now = time.time()
+    retained = job_queue.retained_files()
     for filename in os.listdir(app.config['UPLOAD_FOLDER']):
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        if os.path.isfile(file_path):
+        if os.path.isfile(file_path) and file_path not in retained:
             if (now - os.path.getctime(file_path)) > 3600:  # 1小时
                 try:
                     os.remove(file_path)
@@ -206,176 +306,172 @@ def cleanup_temp_files():
                 except Exception as e:
                     log_error(f"清理文件失败 {filename}: {str(e)}")
 
-# 实时视频流处理 - 使用detection模块
-def process_stream(stream_url):
-    cap = None
-    reconnect_count = 0
-    max_reconnects = 10
-    reconnect_delay = 3
-    error_count = 0  # 错误计数器
-    frame_counter = 0  # 帧计数器重置
-    
-    # 添加FPS计算相关变量
-    fps_start_time = time.time()
-    fps_frame_count = 0
-    fps_value = 0
+# 实时流输出模式: frames推送标注后的图像帧；metadata只推送检测元数据，由浏览器在原生视频(SRS)上绘制；
+# both两者都推送(Flask服务器同时有两种模式的观看者时使用)
+STREAM_MODES = ('frames', 'metadata', 'both')
+DEFAULT_STREAM_MODE = os.environ.get('STREAM_MODE', 'frames')
+stream_modes = {}  # 摄像头ID -> 输出模式
+stream_trackers = {}  # 摄像头ID -> BoxTracker，为实时流的检测结果分配跟踪ID
+
+# 实时视频流处理 - 多路摄像头共用一个检测器，由调度器批量推理后回调此函数(同一摄像头的回调按帧顺序串行执行)
+def handle_stream_result(camera_id, frame, detections, info):
+    conf_threshold = detection_settings['conf_threshold']
     
-    # 添加帧缓存，避免渲染上一帧
-    prev_frame = None
+    tracker = stream_trackers.get(camera_id)
+    if tracker is None:
+        tracker = stream_trackers.setdefault(camera_id, detection.BoxTracker())
+    tracker.update(detections, info['frame_index'])
+
+    # 过滤低置信度的检测结果，只保留高置信度的结果
+    filtered_detections = []
+    for detection_item in detections:
+        confidence = detection_item.get("confidence", 0)
+        if confidence >= conf_threshold:  # 使用全局设置的置信度阈值
+            item = {
+                "class": detection_item["class_name"],
+                "confidence": confidence,
+                "coordinates": detection_item["coordinates"],
+                "type": detection_item.get("type", "unknown"),
+                "class_id": detection_item.get("class_id", 0),
+                "track_id": detection_item.get("track_id")
+            }
+            if detection_item.get("plate_text"):
+                item["plate_text"] = detection_item["plate_text"]
+                item["plate_conf"] = detection_item.get("plate_conf")
+            filtered_detections.append(item)
+
+    mode = stream_modes.get(camera_id, DEFAULT_STREAM_MODE)
+    if mode in ('metadata', 'both'):
+        publish_stream_metadata(camera_id, filtered_detections, info)
+    if mode != 'metadata':
+        # 标注检测结果(调度器推理时不绘制，帧归本回调所有，直接原地绘制)；metadata模式跳过标注和编码
+        for detection_item in detections:
+            frame = detector.draw_detection(frame, detection_item)
+
+        # 编码在编码线程池中进行，完成后再推送，回调线程可以立即处理下一帧；
+        # 每个摄像头最多一帧在编码，编码跟不上时只保留最新一帧，推送顺序与帧顺序一致
+        fmt = video_quality.get('format', 'jpeg')
+        frame_encoder.submit_latest(
+            camera_id, lambda image_bytes: publish_stream_frame(camera_id, image_bytes, fmt, filtered_detections, info),
+            frame, fmt, video_quality['quality'], label=video_quality.get('preset'))
+
+    report_incidents(incident_engine.update(camera_id, filtered_detections, info['capture_time']),
+                     camera_id, frame)
+    publish_stream_mqtt(camera_id, filtered_detections, frame)
+
+def emit_to_server(event, data):
+    """通过Socket.IO向Flask服务器发送事件"""
+    if not sio.connected:
+        return
+    try:
+        sio.emit(event, data)
+    except client_sio.exceptions.ConnectionError:
+        log_error("Socket.IO发送失败，连接已断开")
+    except Exception as socket_error:
+        log_error(f"Socket.IO发送异常: {str(socket_error)}")
+
+def mqtt_snapshot(frame):
+    """按MQTT快照宽度缩小并编码图像"""
+    height, width = frame.shape[:2]
+    size = None
+    if width > MQTT_SNAPSHOT_WIDTH:
+        size = (MQTT_SNAPSHOT_WIDTH, max(1, int(height * MQTT_SNAPSHOT_WIDTH / width)))
+    return frame_encoder.encode(frame, 'jpeg', MQTT_SNAPSHOT_QUALITY, size=size, label='mqtt_snapshot')
+
+def publish_mqtt_detection(source_id, detections, frame=None, **fields):
+    """
+    通过MQTT发布检测结果
     
-    while True:
-        try:
-            if cap is None or not cap.isOpened():
-                log_info(f"尝试连接视频流: {stream_url}")
-                cap = cv2.VideoCapture(stream_url)
-                if not cap.isOpened():
-                    reconnect_count += 1
-                    log_error(f"无法打开视频流 (尝试 {reconnect_count}/{max_reconnects})")
-                    if reconnect_count >= max_reconnects:
-                        log_info("达到最大重连次数，休眠60秒后重试")
-                        time.sleep(60)
-                        reconnect_count = 0
-                    else:
-                        time.sleep(reconnect_delay)
-                    continue
-                else:
-                    reconnect_count = 0
-                    error_count = 0  # 连接成功，重置错误计数
-                    log_info("视频流连接成功")
-                    
-                    # 优化视频流属性
-                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)  # 减小缓冲区大小以减少延迟
-                    # 设置较低的分辨率以提高帧率
-                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, video_quality['width'])
-                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, video_quality['height'])
-                    # 尝试设置较高的摄像头FPS（如果摄像头支持）
-                    cap.set(cv2.CAP_PROP_FPS, 30)
-
-            success, frame = cap.read()
-            if not success:
-                log_error("读取视频帧失败")
-                if cap:
-                    cap.release()
-                cap = None
-                time.sleep(reconnect_delay)
-                continue
+    默认只发布检测结果；出现快照事件(事故、违章、新车牌)时附带缩小的快照。
+    报警命令由事件聚合发送(report_incidents)，不在此逐帧发送。
+    断开期间的消息暂存到磁盘，重连后重放。
+    """
+    if mqtt_client.is_paused():
+        return
+    try:
+        events = mqtt_snapshot_policy.check(source_id, detections)
+        snapshot = mqtt_snapshot(frame) if events and frame is not None else None
+        if snapshot is None:
+            mqtt_client.publish_detection(detections, **fields)
+        elif BINARY_FRAMES:
+            mqtt_client.publish_detection(detections, image_bytes=snapshot, events=events, **fields)
+        else:
+            mqtt_client.publish_detection(detections, base64.b64encode(snapshot).decode('utf-8'),
+                                          events=events, **fields)
+    except Exception as mqtt_error:
+        log_error(f"MQTT发布异常: {str(mqtt_error)}")
 
-            # 帧跳过逻辑，提高处理效率
-            frame_counter += 1
-            
-            # 计算实际FPS
-            fps_frame_count += 1
-            current_time = time.time()
-            elapsed = current_time - fps_start_time
-            
-            if elapsed >= 2.0:  # 每2秒更新一次FPS
-                fps_value = fps_frame_count / elapsed
-                # log_info(f"当前视频处理帧率: {fps_value:.2f} FPS")  # 注释掉FPS日志输出
-                fps_frame_count = 0
-                fps_start_time = current_time
-            
-            # 根据设置的帧跳过率处理帧
-            if frame_counter % frame_skip != 0:
-                continue
+def publish_stream_mqtt(camera_id, filtered_detections, frame):
+    """通过MQTT发布实时流的检测结果"""
+    publish_mqtt_detection(camera_id, filtered_detections, frame, camera_id=camera_id)
 
-            # 计算当前需要使用的帧尺寸，根据当前质量设置调整
-            current_frame_size = (video_quality['width'], video_quality['height'])
-            
-            # 高效预处理图像 - 只缩放到所需大小
-            frame = cv2.resize(frame, current_frame_size, interpolation=cv2.INTER_AREA)
-            
-            # 检查帧是否与上一帧相同（避免重复发送相同帧）
-            if prev_frame is not None:
-                # 计算帧差异
-                frame_diff = cv2.absdiff(frame, prev_frame)
-                if frame_diff.mean() < 1.0:  # 如果帧几乎没有变化，跳过这一帧
-                    continue
-            
-            # 更新前一帧
-            prev_frame = frame.copy()
-            
-            # 使用优化的检测设置
-            conf_threshold = detection_settings['conf_threshold']
-            
-            # 直接将帧传递给detector进行处理，根据设置启用检测类型
-            try:
-                result_image, detections = detector.detect_objects(
-                    frame, 
-                    conf_threshold=conf_threshold,
-                    detect_vehicles=detection_settings['detect_vehicles'],
-                    detect_plates=detection_settings['detect_plates'],
-                    detect_accidents=detection_settings['detect_accidents'],
-                    detect_violations=detection_settings['detect_violations']
-                )
-            except Exception as detect_error:
-                log_error(f"检测处理异常: {str(detect_error)}")
-                time.sleep(0.2)  # 减少休眠时间
-                continue
-            
-            # 使用优化的JPEG质量设置
-            try:
-                # 使用更高质量设置，降低压缩伪影
-                encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), video_quality['quality'], 
-                                int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
-                _, buffer = cv2.imencode('.jpg', result_image, encode_params)
-                jpg_base64 = base64.b64encode(buffer).decode('utf-8')
-            except Exception as encode_error:
-                log_error(f"图像编码异常: {str(encode_error)}")
-                continue
+def publish_stream_frame(camera_id, image_bytes, fmt, filtered_detections, info):
+    """推送编码完成的实时帧(编码失败时image_bytes为None)"""
+    if image_bytes is None:
+        return
+    # 二进制传输时直接发送图像字节，base64模式兼容旧的接收端
+    image_payload = image_bytes if BINARY_FRAMES else base64.b64encode(image_bytes).decode('utf-8')
 
-            # 过滤低置信度的检测结果，只保留高置信度的结果
-            filtered_detections = []
-            for detection in detections:
-                confidence = detection.get("confidence", 0)
-                if confidence >= conf_threshold:  # 使用全局设置的置信度阈值
-                    filtered_detections.append({
-                        "class": detection["class_name"],
-                        "confidence": confidence,
-                        "coordinates": detection["coordinates"],
-                        "type": detection.get("type", "unknown"),
-                        "class_id": detection.get("class_id", 0)
-                    })
-
-            # 添加FPS信息到数据中
-            detection_data = {
-                'image': jpg_base64, 
-                'detections': filtered_detections,
-                'fps': round(fps_value, 1),
-                'timestamp': int(time.time() * 1000)  # 添加时间戳防止浏览器缓存
-            }
+    # 添加摄像头和FPS信息到数据中
+    emit_to_server('detection_frame', {
+        'camera_id': camera_id,
+        'image': image_payload,  # 二进制模式下作为Socket.IO二进制附件发送
+        'mime': FRAME_MIME_TYPES[fmt],
+        'detections': filtered_detections,
+        'fps': round(info['fps'], 1),
+        'latency_ms': int((time.time() - info['capture_time']) * 1000),
+        'timestamp': int(time.time() * 1000)  # 添加时间戳防止浏览器缓存
+    })
 
-            # 尝试通过Socket.IO发送结果
-            if sio.connected:
-                try:
-                    sio.emit('detection_frame', detection_data)
-                except client_sio.exceptions.ConnectionError:
-                    log_error("Socket.IO发送失败，连接已断开")
-                    # 不中断主循环，继续处理视频
-                except Exception as socket_error:
-                    log_error(f"Socket.IO发送异常: {str(socket_error)}")
-                
-            # 尝试通过MQTT发布检测结果
-            if mqtt_client.is_connected() and not mqtt_client.is_paused():
-                try:
-                    mqtt_client.publish_detection(filtered_detections, jpg_base64)
-                    # 发布特定类型的检测结果
-                    publish_special_detection(filtered_detections)
-                except Exception as mqtt_error:
-                    log_error(f"MQTT发布异常: {str(mqtt_error)}")
-                    
-            # 成功处理一帧，重置错误计数
-            error_count = 0
-            
-        except Exception as e:
-            error_count += 1
-            log_error(f"视频流处理异常: {str(e)}")
-            if error_count > 5:
-                log_error("连续错误过多，重新初始化视频捕获")
-                if cap:
-                    cap.release()
-                cap = None
-                error_count = 0
-            time.sleep(reconnect_delay)
+def publish_stream_metadata(camera_id, filtered_detections, info):
+    """推送实时流的检测元数据(坐标基于width x height的画面，浏览器按capture_time与视频对齐)"""
+    width, height = info['frame_size']
+    emit_to_server('detection_metadata', {
+        'camera_id': camera_id,
+        'capture_time': int(info['capture_time'] * 1000),
+        'frame_index': info['frame_index'],
+        'width': width,
+        'height': height,
+        'detections': filtered_detections,
+        'fps': round(info['fps'], 1),
+        'latency_ms': int((time.time() - info['capture_time']) * 1000),
+        'timestamp': int(time.time() * 1000)
+    })
+
+def set_stream_mode(camera_id, mode):
+    """设置摄像头的输出模式，返回是否有效"""
+    if mode not in STREAM_MODES:
+        return False
+    stream_modes[camera_id] = mode
+    log_info(f"摄像头 {camera_id} 输出模式: {mode}")
+    return True
+
+# 摄像头列表: config/cameras.json中为[{"id": ..., "url": ..., "fps": ..., "mode": ...}]，未配置时只接入本地直播流
+STREAM_CAMERAS_FILE = os.environ.get('STREAM_CAMERAS_FILE', 'config/cameras.json')
+DEFAULT_STREAM_FPS = 8.0
+
+def load_camera_config():
+    if os.path.exists(STREAM_CAMERAS_FILE):
+        with open(STREAM_CAMERAS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return [{'id': 'livestream', 'url': 'rtmp://127.0.0.1/live/livestream'}]
+
+stream_scheduler = detection.StreamScheduler(
+    detector,
+    handle_stream_result,
+    batch_size=int(os.environ.get('STREAM_BATCH_SIZE', 8)),
+    detect_options=detection_settings
+)
+
+# 切换实时流输出模式(camera_id为空时应用到所有摄像头)
+@sio.on('stream_mode_updated')
+def handle_stream_mode_update(data):
+    mode = data.get('mode')
+    camera_ids = [data['camera_id']] if data.get('camera_id') else list(stream_scheduler.cameras)
+    for camera_id in camera_ids:
+        if not set_stream_mode(camera_id, mode):
+            log_error(f"无效的输出模式: {mode}")
+            return
 
 # 添加接收质量设置事件处理
 @sio.on('video_quality_updated')
@@ -385,24 +481,23 @@ def handle_quality_update(data):
     try:
         # 更新视频质量设置
         if 'quality' in data:
-            quality_map = {
-                'HIGH': {'width': 1280, 'height': 720, 'quality': 85},
-                'MEDIUM': {'width': 854, 'height': 480, 'quality': 80},
-                'LOW': {'width': 640, 'height': 360, 'quality': 70}
-            }
-            
-            if data['quality'] in quality_map:
-                new_settings = quality_map[data['quality']]
-                video_quality.update(new_settings)
-                log_info(f"视频质量已更新为: {data['quality']}, 分辨率: {video_quality['width']}x{video_quality['height']}, JPEG质量: {video_quality['quality']}")
+            preset = frame_encoder.preset(data['quality'])
+            if preset:
+                # 预设档位(分辨率、编码格式和质量)
+                video_quality.update(preset)
+                video_quality['preset'] = data['quality']
+                log_info(f"视频质量已更新为: {data['quality']}, 分辨率: {video_quality['width']}x{video_quality['height']}, {video_quality['format']}质量: {video_quality['quality']}")
             else:
                 # 使用接收到的具体数值
+                fmt = data.get('format', video_quality['format'])
                 video_quality.update({
                     'width': int(data.get('width', video_quality['width'])),
                     'height': int(data.get('height', video_quality['height'])),
-                    'quality': int(data.get('jpegQuality', 0.9) * 100)  # 转换0-1范围为0-100
+                    'quality': int(data.get('jpegQuality', 0.9) * 100),  # 转换0-1范围为0-100
+                    'format': fmt if fmt in FRAME_FORMATS else 'jpeg',
+                    'preset': None
                 })
-                log_info(f"视频质量已更新, 分辨率: {video_quality['width']}x{video_quality['height']}, JPEG质量: {video_quality['quality']}")
+                log_info(f"视频质量已更新, 分辨率: {video_quality['width']}x{video_quality['height']}, {video_quality['format']}质量: {video_quality['quality']}")
         
         # 更新帧跳过率设置
         if 'frameSkip' in data:
@@ -427,203 +522,468 @@ def handle_quality_update(data):
                     detection_settings['conf_threshold'] = 0.35
                     detection_settings['detect_plates'] = True
                     detection_settings['detect_violations'] = True
+        
+        # 应用到所有摄像头(采集线程在下一帧生效)
+        stream_scheduler.configure_all(
+            size=(video_quality['width'], video_quality['height']),
+            frame_step=frame_skip
+        )
     except Exception as e:
         log_error(f"更新视频质量设置失败: {str(e)}")
 
+def detect_image(image_data, detection_type='general', annotate=True, source_id='img_predict'):
+    """
+    检测一张图像
+    
+    参数:
+        image_data: 图像文件的字节(bytes或memoryview，直接解码不复制)
+        detection_type: 检测类型 'general', 'vehicle', 'plate', 'accident', 'violation'
+        annotate: 是否绘制并编码标注图像，只需要检测结果时跳过
+        source_id: 事件聚合使用的视频源ID，每张上传图像各自独立(见img_predict)
+    
+    返回:
+        tuple: (响应数据{'detections', 'image_size'}或{'error'}, HTTP状态码, 标注图像的JPEG字节或None)，
+               image_size为检测坐标所在图像的[宽, 高]
+    """
+    # 设置检测配置
+    detect_vehicles = True  # 默认检测车辆
+    detect_plates = True    # 默认检测车牌
+    detect_accidents = True # 默认检测事故
+    detect_violations = True # 默认检测违章行为
+    
+    # 根据检测类型调整设置
+    if detection_type == 'vehicle':
+        detect_plates = False
+        detect_accidents = False
+        detect_violations = False
+    elif detection_type == 'plate':
+        detect_vehicles = False
+        detect_accidents = False
+        detect_violations = False
+    elif detection_type == 'accident':
+        detect_vehicles = False
+        detect_plates = False
+        detect_violations = False
+    elif detection_type == 'violation':
+        detect_vehicles = False
+        detect_plates = False
+        detect_accidents = False
+    
+    # 选择合适的检测器
+    current_detector = detector  # 默认使用通用检测器
+    conf_threshold = 0.3  # 默认置信度阈值
+    
+    if detection_type == 'plate':
+        current_detector = get_plate_detector()
+        conf_threshold = 0.35  # 提高车牌检测的置信度阈值，减少误检
+    elif detection_type == 'accident':
+        current_detector = get_accident_detector() 
+        conf_threshold = 0.4   # 提高事故检测的置信度阈值
+    
+    # 解码图像: 大图在解码阶段按需要的尺寸缩小(只返回检测结果时按模型输入尺寸，
+    # 需要标注图像时不小于IMAGE_ANNOTATE_SIZE)，识别车牌时再按原分辨率解码
+    try:
+        target_size = IMAGE_ANNOTATE_SIZE if annotate else current_detector.inference_size
+        decoded = detection.DecodedImage(image_data, target_size)
+        image = decoded.image
+        
+        if image is None:
+            return {'error': '无法解码图像数据'}, 400, None
+            
+        # 保存输入图像用于调试
+        if detection_type == 'plate':
+            debug_path = f"plate_input_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
+            cv2.imwrite(debug_path, image)
+            log_info(f"已保存车牌输入图像: {debug_path}")
+    except Exception as e:
+        log_error(f"解码图像失败: {e}")
+        return {'error': '解码图像失败'}, 400, None
+    
+    # 根据检测类型调用不同的detector方法
+    if detection_type == 'plate':
+        # 调用车牌检测方法
+        result_image, detections = current_detector.detect_license_plate(
+            image, conf_threshold=conf_threshold, annotate=annotate, hires=decoded)
+    elif detection_type == 'accident':
+        # 调用事故检测方法
+        result_image, detections = current_detector.detect_accident(
+            image, conf_threshold=conf_threshold, annotate=annotate)
+    elif detection_type == 'violation':
+        # 调用违章检测方法
+        result_image, detections = current_detector.detect_violation(
+            image, conf_threshold=conf_threshold, annotate=annotate)
+    elif detection_type == 'vehicle':
+        # 调用车辆检测方法，只启用车辆检测
+        result_image, detections = current_detector.detect_objects(
+            image, 
+            conf_threshold=conf_threshold,
+            detect_vehicles=True,
+            detect_plates=False,
+            detect_accidents=False,
+            detect_violations=False,
+            annotate=annotate
+        )
+    else:
+        # 调用通用检测方法，传递特定的检测参数
+        result_image, detections = current_detector.detect_objects(
+            image, 
+            conf_threshold=conf_threshold,
+            detect_vehicles=detect_vehicles,
+            detect_plates=detect_plates,
+            detect_accidents=detect_accidents,
+            detect_violations=detect_violations,
+            annotate=annotate,
+            hires=decoded
+        )
+    
+    # 如果检测失败
+    if result_image is None:
+        return {'error': '处理图像失败'}, 500, None
+    
+    # 编码标注图像(只需要检测结果时跳过)
+    result_bytes = None
+    if annotate:
+        _, buffer = cv2.imencode('.jpg', result_image, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+        result_bytes = buffer.tobytes()
+    
+    # 坐标在发布之前统一换算一次，HTTP响应、MQTT和事件使用相同的坐标:
+    # 返回标注图像时为标注图像上的坐标(大图缩小解码后)，只返回检测结果时为上传原图上的坐标
+    if annotate:
+        image_size = [result_image.shape[1], result_image.shape[0]]
+    else:
+        image_size = list(decoded.original_size)
+        if decoded.scale > 1:
+            for detection_item in detections:
+                detection_item['coordinates'] = decoded.to_full(detection_item['coordinates'])
+    
+    # 单张图片检测到即开始事件；每张图像是独立的视频源，只有hold-off窗口内重复上传的同一张图像不再报警
+    report_incidents(incident_engine.update(source_id, detections, min_frames=1),
+                     source_id, result_image)
+    # 发布检测结果到MQTT(只在快照事件时附带图像)
+    publish_mqtt_detection('img_predict', detections, result_image, image_size=image_size)
+    
+    return {'detections': detections, 'image_size': image_size}, 200, result_bytes
+
+# /img_predict的响应格式:
+# json: 检测结果和Base64编码的标注图像(默认，兼容旧客户端)
+# detections: 只返回检测结果，不绘制也不编码标注图像
+# image: 标注图像的JPEG字节
+# binary: [4字节大端头部长度][JSON头部(detections)][JPEG字节]，格式同utils.pack_frame
+IMAGE_RESPONSE_FORMATS = ('json', 'detections', 'image', 'binary')
+IMAGE_ANNOTATE_SIZE = int(os.environ.get('IMAGE_ANNOTATE_SIZE', 1920))  # 需要标注图像时，大图缩小解码后长边不小于此尺寸
+ANNOTATED_IMAGE_FILE = 'result.jpg'
+
+def read_image_upload():
+    """
+    读取/img_predict上传的图像和参数
+    
+    支持三种上传方式，参数可放在请求体或查询字符串中:
+    - JSON: {"image": Base64图像, "type": 检测类型, "response": 响应格式}
+    - multipart/form-data: 文件字段image(或file)，表单字段type、response
+    - 原始字节: Content-Type为image/*或application/octet-stream，请求体即图像文件
+    
+    返回:
+        tuple: (图像字节, 检测类型, 响应格式)，图像缺失或解码失败时图像字节为None
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        image_data = None
+        if data.get('image'):
+            try:
+                image_data = base64.b64decode(data['image'])
+            except Exception as e:
+                log_error(f"解码图像失败: {e}")
+        options = data
+    elif request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image') or request.files.get('file')
+        image_data = upload.read() if upload else None
+        options = request.form
+    else:
+        image_data = request.get_data(cache=False) or None
+        options = {}
+    detection_type = options.get('type') or request.args.get('type', 'general')  # 'general', 'vehicle', 'plate', 'accident', 'violation'
+    response_format = options.get('response') or request.args.get('response', 'json')
+    return image_data, detection_type, response_format
+
+def image_cache_entry_output(entry):
+    """缓存条目中的检测结果和标注图像字节(兼容以Base64保存图像的旧条目)"""
+    result = entry['result']
+    path = entry['files'].get(ANNOTATED_IMAGE_FILE)
+    if path:
+        with open(path, 'rb') as f:
+            return result, f.read()
+    if result.get('result'):
+        return result, base64.b64decode(result['result'])
+    return result, None
+
+def image_predict_response(result, image_bytes, response_format):
+    """按请求的格式生成图像检测的响应(image_size为检测坐标所在图像的尺寸)"""
+    header = {'detections': result.get('detections', []), 'image_size': result.get('image_size')}
+    if response_format == 'detections':
+        return jsonify(header)
+    if response_format == 'image':
+        response = Response(image_bytes, mimetype='image/jpeg')
+        response.headers['X-Detection-Count'] = str(len(header['detections']))
+        return response
+    if response_format == 'binary':
+        return Response(pack_frame(header, image_bytes), mimetype='application/octet-stream')
+    return jsonify(dict(header, result=base64.b64encode(image_bytes).decode('utf-8')))
+
 # API端点 - 图像检测 - 使用detection模块
+# 相同图像和检测类型的请求直接返回缓存结果，并发的相同请求只检测一次
 @app.route('/img_predict', methods=['POST'])
 def img_predict():
     try:
-        data = request.json
-        image_base64 = data.get('image')
-        detection_type = data.get('type', 'general') # 检测类型参数: 'general', 'vehicle', 'plate', 'accident', 'violation'
-        
-        # 设置检测配置
-        detect_vehicles = True  # 默认检测车辆
-        detect_plates = True    # 默认检测车牌
-        detect_accidents = True # 默认检测事故
-        detect_violations = True # 默认检测违章行为
-        
-        # 根据检测类型调整设置
-        if detection_type == 'vehicle':
-            detect_plates = False
-            detect_accidents = False
-            detect_violations = False
-        elif detection_type == 'plate':
-            detect_vehicles = False
-            detect_accidents = False
-            detect_violations = False
-        elif detection_type == 'accident':
-            detect_vehicles = False
-            detect_plates = False
-            detect_violations = False
-        elif detection_type == 'violation':
-            detect_vehicles = False
-            detect_plates = False
-            detect_accidents = False
-        
-        if not image_base64:
+        image_data, detection_type, response_format = read_image_upload()
+        if response_format not in IMAGE_RESPONSE_FORMATS:
+            return jsonify({'error': f'无效的响应格式: {response_format}'}), 400
+        if not image_data:
             return jsonify({'error': '未接收到图像数据'}), 400
-            
-        # 解码Base64图像
-        try:
-            image_data = base64.b64decode(image_base64)
-            image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
-            
-            if image is None:
-                return jsonify({'error': '无法解码图像数据'}), 400
-                
-            # 保存输入图像用于调试
-            if detection_type == 'plate':
-                debug_path = f"plate_input_{datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
-                cv2.imwrite(debug_path, image)
-                log_info(f"已保存车牌输入图像: {debug_path}")
-        except Exception as e:
-            log_error(f"解码图像失败: {e}")
-            return jsonify({'error': '解码图像失败'}), 400
         
-        # 选择合适的检测器
-        current_detector = detector  # 默认使用通用检测器
-        conf_threshold = 0.3  # 默认置信度阈值
-        
-        if detection_type == 'plate':
-            current_detector = get_plate_detector()
-            conf_threshold = 0.35  # 提高车牌检测的置信度阈值，减少误检
-        elif detection_type == 'accident':
-            current_detector = get_accident_detector() 
-            conf_threshold = 0.4   # 提高事故检测的置信度阈值
-        
-        # 根据检测类型调用不同的detector方法
-        if detection_type == 'plate':
-            # 调用车牌检测方法
-            result_image, detections = current_detector.detect_license_plate(image, conf_threshold=conf_threshold)
-        elif detection_type == 'accident':
-            # 调用事故检测方法
-            result_image, detections = current_detector.detect_accident(image, conf_threshold=conf_threshold)
-        elif detection_type == 'violation':
-            # 调用违章检测方法
-            result_image, detections = current_detector.detect_violation(image, conf_threshold=conf_threshold)
-        elif detection_type == 'vehicle':
-            # 调用车辆检测方法，只启用车辆检测
-            result_image, detections = current_detector.detect_objects(
-                image, 
-                conf_threshold=conf_threshold,
-                detect_vehicles=True,
-                detect_plates=False,
-                detect_accidents=False,
-                detect_violations=False
-            )
+        # 只要检测结果时不绘制标注，缓存条目与带标注的结果分开(两者的坐标分别基于标注图像和原图)
+        annotate = response_format != 'detections'
+        if annotate:
+            params = {'type': detection_type, 'annotate_size': IMAGE_ANNOTATE_SIZE}
         else:
-            # 调用通用检测方法，传递特定的检测参数
-            result_image, detections = current_detector.detect_objects(
-                image, 
-                conf_threshold=conf_threshold,
-                detect_vehicles=detect_vehicles,
-                detect_plates=detect_plates,
-                detect_accidents=detect_accidents,
-                detect_violations=detect_violations
-            )
-        
-        # 如果检测失败
-        if result_image is None:
-            return jsonify({'error': '处理图像失败'}), 500
-        
-        # 将结果图像转回Base64
-        _, buffer = cv2.imencode('.jpg', result_image, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-        result_base64 = base64.b64encode(buffer).decode('utf-8')
+            params = {'type': detection_type, 'annotate': False}
+        image_hash = hashlib.sha1(image_data).hexdigest()
+        cache_key = ResultCache.make_key(image_hash, params, MODEL_VERSION)
+        cached = image_cache.get(cache_key)
+        if cached is not None:
+            return image_predict_response(*image_cache_entry_output(cached), response_format)
+        flight, leader = image_cache.join(cache_key)
+        if not leader:
+            entry = flight.wait(IMAGE_CACHE_WAIT)
+            if entry is not None:
+                return image_predict_response(*image_cache_entry_output(entry), response_format)
         
-        # 发布检测结果到MQTT
-        if mqtt_client.is_connected() and not mqtt_client.is_paused():
-            try:
-                mqtt_client.publish_detection(detections, result_base64)
-                # 发布特定类型的检测结果
-                publish_special_detection(detections)
-            except Exception as mqtt_error:
-                log_error(f"MQTT发布异常: {str(mqtt_error)}")
-        
-        return jsonify({
-            'result': result_base64,
-            'detections': detections  
-        })
+        try:
+            result, status, image_bytes = detect_image(image_data, detection_type, annotate,
+                                                       source_id=f"img_predict:{image_hash[:16]}")
+            if status == 200:
+                cache_image_result(cache_key, result, image_bytes)
+        finally:
+            if leader:
+                image_cache.release(cache_key)
+        if status != 200:
+            return jsonify(result), status
+        return image_predict_response(result, image_bytes, response_format)
     except Exception as e:
         log_error(f"图像检测失败: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'处理失败: {str(e)}'}), 500
 
-# API端点 - 视频检测 - 使用detection模块
-@app.route('/video_predict', methods=['POST'])
-def video_predict():
+def cache_image_result(cache_key, result, image_bytes):
+    """缓存图像检测结果，标注图像以文件保存而不是Base64"""
+    if image_bytes is None:
+        image_cache.put(cache_key, result)
+        return
+    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"img_{uuid.uuid4().hex}.jpg")
+    with open(temp_path, 'wb') as f:
+        f.write(image_bytes)
     try:
-        if 'video' not in request.files:
-            return jsonify({'error': '未接收到视频文件'}), 400
-            
-        file = request.files['video']
-        if file.filename == '':
-            return jsonify({'error': '未选择文件'}), 400
-            
-        if not allowed_file(file.filename):
-            return jsonify({'error': '不支持的文件类型'}), 400
+        image_cache.put(cache_key, result, files={ANNOTATED_IMAGE_FILE: temp_path})
+    finally:
+        os.remove(temp_path)
 
-        # 获取检测类型
-        detection_type = request.form.get('type', 'general')  # 'general', 'plate', 'speed', 'integrated'
-        
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        
-        file_ext = file.filename.rsplit('.', 1)[1].lower()
-        unique_id = uuid.uuid4().hex
-        input_filename = f"input_{unique_id}.{file_ext}"
-        output_filename = f"output_{unique_id}.mp4"
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], input_filename)
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
+def video_cache_key(fingerprint, detection_type, camera=None):
+    """视频结果的缓存键(alerts: 结果包含事故和违章类别，之前缓存的结果没有，不再使用)"""
+    return ResultCache.make_key(fingerprint, {'type': detection_type, 'camera': camera, 'alerts': True},
+                                MODEL_VERSION)
 
-        file.save(input_path)
-        log_info(f"视频文件已保存: {input_filename}")
+def claim_checkpoint_dir(checkpoint_dir, job_id):
+    """
+    占用检查点目录(不等待)
+    
+    返回:
+        bool: 是否占用成功，目录正被其他任务使用时返回False
+    """
+    with checkpoint_owners_lock:
+        return checkpoint_owners.setdefault(checkpoint_dir, job_id) == job_id
 
-        # 记录开始时间用于计算处理用时
-        start_time = time.time()
+def release_checkpoint_dir(checkpoint_dir, job_id):
+    """释放claim_checkpoint_dir占用的检查点目录"""
+    with checkpoint_owners_lock:
+        if checkpoint_owners.get(checkpoint_dir) == job_id:
+            del checkpoint_owners[checkpoint_dir]
 
-        # 根据检测类型设置参数
-        enable_license_plate = detection_type in ['plate', 'integrated', 'general']
-        enable_speed = detection_type in ['speed', 'integrated']
-        
-        # 直接调用detector的process_video方法
-        output_path, processing_results = detector.process_video(
-            input_path, 
-            output_path, 
-            enable_license_plate=enable_license_plate, 
-            enable_speed=enable_speed
-        )
-        
-        # 计算处理时间
-        processing_time = int(time.time() - start_time)
+def video_result_from_cache(entry, job_id, output_filename):
+    """
+    由缓存条目生成视频任务结果，缓存的输出视频链接为本任务的输出文件
+    
+    参数:
+        entry: 缓存条目
+        job_id: 任务ID
+        output_filename: 输出视频文件名(位于UPLOAD_FOLDER)
+    
+    返回:
+        dict: 处理结果
+    """
+    ResultCache.link_file(entry['files']['output.mp4'],
+                          os.path.join(app.config['UPLOAD_FOLDER'], output_filename))
+    result = dict(entry['result'])
+    result.update({
+        'job_id': job_id,
+        'download_url': f"/download/{output_filename}",
+        'stream_url': f"/stream/{output_filename}",
+        'processing_time': 0,
+        'cached': True
+    })
+    return result
+
+def run_video_job(job_id, input_path, output_filename, detection_type='general',
+                  job_timeout=VIDEO_JOB_TIMEOUT, live_output=False, filename=None, fingerprint=None,
+                  camera=None):
+    """
+    处理一个视频任务，同步请求和任务队列共用
+    
+    相同视频和检测类型的结果会被缓存；相同的任务同时运行时只处理一次，其余任务等待并复用其结果。
+    
+    参数:
+        job_id: 任务ID
+        input_path: 已保存的输入视频路径
+        output_filename: 输出视频文件名(位于UPLOAD_FOLDER)
+        detection_type: 检测类型 'general', 'plate', 'speed', 'integrated'
+        job_timeout: 时间预算(秒)
+        live_output: 是否输出分片MP4
+        filename: 上传时的原始文件名
+        fingerprint: 输入视频的SHA1，None时重新计算
+        camera: 摄像头ID，用于选择测速标定
+    
+    返回:
+        dict: 可JSON序列化的处理结果
+    """
+    fingerprint = fingerprint or detection.file_fingerprint(input_path)
+    cache_key = video_cache_key(fingerprint, detection_type, camera)
+    flight, leader = video_cache.join(cache_key, owner=job_id)
+    try:
+        if not leader:
+            log_info(f"视频任务 {job_id} 等待相同任务 {flight.owner} 的结果")
+            flight.wait(job_timeout)
+        cached = video_cache.get(cache_key)
+        if cached is not None:
+            video_progress_hub.close(job_id, completed=True, cached=True)
+            return video_result_from_cache(cached, job_id, output_filename)
         
-        # 后处理视频
+        result = process_video_job(job_id, input_path, output_filename, detection_type,
+                                   job_timeout, live_output, filename, fingerprint, camera)
+        # 只缓存完整的结果
+        if not result['partial']:
+            video_cache.put(cache_key, result, {
+                'output.mp4': os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
+            })
+        return result
+    finally:
+        if leader:
+            video_cache.release(cache_key)
+
+def collect_video_incidents(job_id, input_path, processing_results):
+    """
+    把视频逐帧的事故、违停、超速结果聚合为事件
+    
+    事故和违章来自每帧的alerts(类别9-11的检测框)，超速来自测速结果超过SPEED_LIMIT_KMH的车辆。
+    
+    返回:
+        list: 事件列表(按开始时间排序)
+    """
+    capture = cv2.VideoCapture(input_path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    capture.release()
+    
+    engine = detection.IncidentEngine(
+        min_frames=INCIDENT_MIN_FRAMES, end_timeout=INCIDENT_END_TIMEOUT, holdoff=INCIDENT_HOLDOFF)
+    incidents = {}
+    for result in processing_results:
+        frame_detections = [{
+            'type': alert['type'],
+            'track_id': alert.get('track_id'),
+            'confidence': alert.get('conf', 0.0),
+            'coordinates': alert.get('box', [])
+        } for alert in result.get('alerts') or []]
+        for vehicle in result.get('vehicles') or []:
+            if vehicle.get('speed', 0) > SPEED_LIMIT_KMH:
+                frame_detections.append({
+                    'type': 'overspeed',
+                    'track_id': vehicle.get('track_id'),
+                    'confidence': vehicle.get('conf', 1.0),
+                    'coordinates': vehicle.get('box', [])
+                })
+        events = engine.update(job_id, frame_detections, result.get('frame', 0) / fps)
+        for _, incident in events:
+            incidents[incident['id']] = incident
+    for _, incident in engine.flush():
+        incidents[incident['id']] = incident
+    return sorted(incidents.values(), key=lambda i: i['start_time'])
+
+def process_video_job(job_id, input_path, output_filename, detection_type, job_timeout,
+                      live_output, filename, fingerprint, camera):
+    """处理视频并整理为前端需要的结果格式，参数同run_video_job"""
+    # 记录开始时间用于计算处理用时
+    start_time = time.time()
+
+    # 根据检测类型设置参数
+    enable_license_plate = detection_type in ['plate', 'integrated', 'general']
+    enable_speed = detection_type in ['speed', 'integrated']
+    
+    # 按缓存键(视频内容、检测类型、测速标定、模型版本)定位检查点，
+    # 同一任务在超时或服务重启后重新提交时从上次中断处继续
+    checkpoint_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'checkpoints',
+                                  video_cache_key(fingerprint, detection_type, camera))
+    
+    # 任务ID重复时抛出ValueError
+    cancel_token = video_jobs.register(
+        job_id, detection.CancellationToken(job_timeout), filename=filename)
+    
+    # 检查点目录正被相同的任务使用时(例如合并等待超时后自行处理)不使用检查点，避免互相删除片段
+    checkpoint_claimed = claim_checkpoint_dir(checkpoint_dir, job_id)
+    if not checkpoint_claimed:
+        log_info(f"视频任务 {job_id} 的检查点目录正被其他任务使用，本次不保存检查点")
+    
+    try:
+        video_progress_hub.create(job_id, reset=True)
+        video_progress_hub.publish(job_id, {
+            'type': 'output',
+            'stream_url': f"/stream/{output_filename}",
+            'download_url': f"/download/{output_filename}",
+            'live': live_output
+        })
+    
+        # 直接调用detector的process_video方法，截止时间由令牌控制
+        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
         try:
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{unique_id}.mp4")
-            ffmpeg_cmd = f"ffmpeg -i {output_path} -c:v libx264 -preset medium -movflags faststart {temp_path} -y -loglevel warning"
-            log_info(f"执行ffmpeg命令: {ffmpeg_cmd}")
-            exit_code = os.system(ffmpeg_cmd)
-            
-            if exit_code == 0:
-                os.replace(temp_path, output_path)
-                log_info("元数据优化成功")
-            else:
-                log_error(f"ffmpeg处理失败，退出码：{exit_code}")
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    
-        except Exception as e:
-            log_error(f"元数据处理失败: {str(e)}（视频仍可下载，但可能无法流式播放）")
-        
+            output_path, processing_results = detector.process_video(
+                input_path, 
+                output_path, 
+                enable_license_plate=enable_license_plate, 
+                enable_speed=enable_speed,
+                checkpoint_dir=checkpoint_dir if checkpoint_claimed else None,
+                cancel_token=cancel_token,
+                timeout=0,
+                progress_callback=video_progress_hub.callback(job_id),
+                fragmented_output=live_output,
+                speed_calibration=speed_calibrations.get(camera),
+                # 事故和违章类别用于事件报警(collect_video_incidents)
+                detect_accidents=True,
+                detect_violations=True
+            )
+        finally:
+            video_jobs.unregister(job_id)
+    
+        if output_path is None:
+            raise RuntimeError('视频处理失败')
+    
+        # 计算处理时间（process_video已通过ffmpeg管道一次性输出faststart的H.264 MP4，无需再转码）
+        processing_time = int(time.time() - start_time)
+
         # 优化检测结果的格式，确保与前端期望的格式一致
         formatted_detections = []
         all_objects = []  # 用于收集所有检测到的对象
-        
+    
         # 将每帧的检测结果重新组织为前端可识别的格式
         for result in processing_results:
             frame_detections = []
-            
+        
             # 处理车辆检测结果
             if 'vehicles' in result and result['vehicles']:
                 for vehicle in result['vehicles']:
@@ -635,7 +995,7 @@ def video_predict():
                     }
                     frame_detections.append(detection_obj)
                     all_objects.append(detection_obj)
-            
+        
             # 处理车牌检测结果
             if 'license_plates' in result and result['license_plates']:
                 for plate in result['license_plates']:
@@ -649,7 +1009,7 @@ def video_predict():
                         detection_obj['plate_text'] = plate['text']
                     frame_detections.append(detection_obj)
                     all_objects.append(detection_obj)
-            
+        
             # 处理事故检测结果
             if 'accidents' in result and result['accidents']:
                 for accident in result['accidents']:
@@ -661,7 +1021,7 @@ def video_predict():
                     }
                     frame_detections.append(detection_obj)
                     all_objects.append(detection_obj)
-            
+        
             # 处理违章检测结果
             if 'violations' in result and result['violations']:
                 for violation in result['violations']:
@@ -673,7 +1033,7 @@ def video_predict():
                     }
                     frame_detections.append(detection_obj)
                     all_objects.append(detection_obj)
-            
+        
             # 处理超速检测结果
             if 'speed_tracking' in result and result['speed_tracking']:
                 for track in result['speed_tracking']:
@@ -686,14 +1046,14 @@ def video_predict():
                     }
                     frame_detections.append(detection_obj)
                     all_objects.append(detection_obj)
-            
+        
             # 只有当有检测结果时才添加到总结果中
             if frame_detections:
                 formatted_detections.append({
                     'frame': result.get('frame', 0),
                     'detections': frame_detections
                 })
-        
+    
         # 如果没有检测到任何对象，确保返回一些默认数据以便前端正确显示
         if not all_objects:
             # 添加常见类别的空检测数据，确保前端可以显示类别列表
@@ -705,7 +1065,7 @@ def video_predict():
                 {'class_name': '事故', 'type': 'accident'},
                 {'class_name': '违停', 'type': 'violation'}
             ]
-            
+        
             for cls in default_classes:
                 all_objects.append({
                     'class_name': cls['class_name'],
@@ -713,50 +1073,311 @@ def video_predict():
                     'confidence': 0.0,
                     'coordinates': []
                 })
-        
+    
         download_url = f"/download/{output_filename}"
         threading.Thread(target=cleanup_temp_files).start()
-        
+    
+        # 逐帧的事故、违停、超速结果按视频内时间聚合为事件，每个事件只报警一次
+        incidents = collect_video_incidents(job_id, input_path, processing_results)
+        for incident in incidents:
+            publish_incident_alarm(incident)
+    
         # 发布视频处理结果到MQTT
-        if mqtt_client.is_connected() and not mqtt_client.is_paused():
-            # 检查处理结果中是否有需要发送命令的事件
-            for result in processing_results:
-                # 检查事故
-                if result.get('accidents'):
-                    mqtt_client.publish_command('accident')
-                
-                # 检查违章停车
-                if result.get('illegal_parking'):
-                    mqtt_client.publish_command('illegal_parkin')
-                
-                # 检查超速
-                if result.get('speed_tracking'):
-                    for track in result.get('speed_tracking', []):
-                        if track.get('speed', 0) > track.get('speed_limit', 60):  # 假设默认限速60
-                            mqtt_client.publish_command('overspeed')
-                            break
-            
+        if not mqtt_client.is_paused():
             # 提取关键信息以避免发送过大的数据
             mqtt_data = {
                 'detection_type': detection_type,
                 'detections': formatted_detections,
-                'video_url': download_url
+                'video_url': download_url,
+                'incidents': incidents
             }
             mqtt_client.publish_detection(mqtt_data, None)
-        
+    
         # 为了与前端兼容，将所有检测到的对象直接放到detections数组中
-        return jsonify({
+        return json.loads(detection.dumps_event({
             'status': '处理完成',
             'detection_type': detection_type,
             'detections': all_objects,  # 直接返回所有检测到的对象
             'download_url': download_url,
             'stream_url': f"/stream/{output_filename}",
-            'processing_time': processing_time  # 添加处理时间
-        })
+            'processing_time': processing_time,  # 添加处理时间
+            'job_id': job_id,
+            'incidents': incidents,  # 聚合后的事件，每个事件只报警一次
+            'partial': cancel_token.reason is not None,  # 取消或超时时只包含已完成的部分
+            'stop_reason': cancel_token.reason
+        }))
+    except Exception as e:
+        # 流水线发出done之前失败(无法打开视频、编码器创建失败、结果整理出错等)时结束进度通道
+        video_progress_hub.close(job_id, completed=False, error=str(e))
+        raise
+    finally:
+        if checkpoint_claimed:
+            release_checkpoint_dir(checkpoint_dir, job_id)
+
+def handle_video_job(job):
+    """任务队列中video类型任务的处理函数"""
+    try:
+        return run_video_job(job.job_id, **job.payload)
+    finally:
+        if job.payload.get('fingerprint'):
+            cache_key = video_cache_key(job.payload['fingerprint'], job.payload['detection_type'],
+                                        job.payload.get('camera'))
+            if video_job_keys.get(cache_key) == job.job_id:
+                video_job_keys.pop(cache_key, None)
+
+job_queue.register_handler('video', handle_video_job)
+
+def job_links(job_id):
+    """异步任务的查询接口地址"""
+    return {
+        'job_id': job_id,
+        'status_url': f"/jobs/{job_id}",
+        'result_url': f"/jobs/{job_id}/result",
+        'cancel_url': f"/jobs/{job_id}/cancel",
+        'progress_url': f"/video_progress/{job_id}"
+    }
+
+# API端点 - 视频检测 - 使用detection模块
+# async=1时提交到任务队列并立即返回任务ID，否则在请求内同步处理
+@app.route('/video_predict', methods=['POST'])
+def video_predict():
+    try:
+        if 'video' not in request.files:
+            return jsonify({'error': '未接收到视频文件'}), 400
+            
+        file = request.files['video']
+        if file.filename == '':
+            return jsonify({'error': '未选择文件'}), 400
+            
+        if not allowed_file(file.filename):
+            return jsonify({'error': '不支持的文件类型'}), 400
+
+        # 获取检测类型
+        detection_type = request.form.get('type', 'general')  # 'general', 'plate', 'speed', 'integrated'
+        
+        # 任务ID由客户端提供时可在处理过程中调用/video_cancel/<job_id>取消
+        unique_id = uuid.uuid4().hex
+        job_id = request.form.get('job_id') or unique_id
+        if not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', job_id):
+            return jsonify({'error': '无效的任务ID'}), 400
+        job_timeout = request.form.get('timeout', VIDEO_JOB_TIMEOUT, type=int)
+        job_timeout = max(1, min(job_timeout, VIDEO_JOB_MAX_TIMEOUT))
+        # live=1时输出分片MP4，处理过程中即可通过stream_url播放已完成的部分
+        live_output = request.form.get('live', '0').lower() in ('1', 'true', 'yes')
+        run_async = request.form.get('async', '0').lower() in ('1', 'true', 'yes')
+        priority = request.form.get('priority', 0, type=int)
+        # 摄像头ID，有标定时按地面坐标测速
+        camera = request.form.get('camera') or None
+        if camera is not None and camera not in speed_calibrations:
+            return jsonify({'error': f'没有摄像头的测速标定: {camera}'}), 400
+        if video_jobs.get(job_id) is not None or job_queue.status(job_id) is not None:
+            return jsonify({'error': f'任务ID已存在: {job_id}'}), 409
+        
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        
+        file_ext = file.filename.rsplit('.', 1)[1].lower()
+        input_filename = f"input_{unique_id}.{file_ext}"
+        output_filename = f"output_{unique_id}.mp4"
+        input_path = os.path.join(app.config['UPLOAD_FOLDER'], input_filename)
+        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
+
+        file.save(input_path)
+        log_info(f"视频文件已保存: {input_filename}")
+        
+        fingerprint = detection.file_fingerprint(input_path)
+        payload = {
+            'input_path': input_path,
+            'output_filename': output_filename,
+            'detection_type': detection_type,
+            'job_timeout': job_timeout,
+            'live_output': live_output,
+            'filename': file.filename,
+            'fingerprint': fingerprint,
+            'camera': camera
+        }
+        
+        # 相同视频和检测类型已有结果时直接返回
+        cache_key = video_cache_key(fingerprint, detection_type, camera)
+        cached = video_cache.get(cache_key)
+        if cached is not None:
+            log_info(f"视频结果命中缓存: {job_id}")
+            os.remove(input_path)
+            result = video_result_from_cache(cached, job_id, output_filename)
+            if not run_async:
+                return jsonify(result)
+            job_queue.add_completed('video', job_id, result, files=[output_path])
+            return jsonify(dict(job_links(job_id), status='done', cached=True)), 202
+        
+        if run_async:
+            # 相同的视频正在排队或处理时返回该任务，不重复处理
+            owner = video_job_keys.get(cache_key)
+            owner_status = job_queue.status(owner) if owner else None
+            if owner_status and owner_status['status'] in ('queued', 'running'):
+                log_info(f"视频任务 {job_id} 合并到相同的任务 {owner}")
+                os.remove(input_path)
+                return jsonify(dict(job_links(owner), status=owner_status['status'], coalesced=True)), 202
+            try:
+                job_queue.submit('video', payload, job_id, priority=priority,
+                                 files=[input_path, output_path])
+            except ValueError:
+                os.remove(input_path)
+                return jsonify({'error': f'任务ID已存在: {job_id}'}), 409
+            except JobQueueFull as e:
+                os.remove(input_path)
+                return jsonify({'error': str(e)}), 503
+            video_job_keys[cache_key] = job_id
+            log_info(f"视频任务已排队: {job_id}")
+            return jsonify(dict(job_links(job_id), status='queued')), 202
+        
+        return jsonify(run_video_job(job_id, **payload))
     except Exception as e:
         log_error(f"视频处理失败: {str(e)}")
         return jsonify({'error': f'视频处理失败: {str(e)}'}), 500
 
+# 查询任务队列中的任务
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'jobs': job_queue.list()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': '任务不存在或已过期', 'job_id': job_id}), 404
+    return jsonify(status)
+
+# 获取任务结果，取走后结果和输出文件在短时间后删除
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': '任务不存在或已过期', 'job_id': job_id}), 404
+    if status['status'] in ('queued', 'running'):
+        return jsonify(status), 202
+    return jsonify(job_queue.result(job_id))
+
+# 取消排队中或运行中的任务(运行中的任务返回已完成的部分)
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    status = job_queue.cancel(job_id)
+    if status is None:
+        return jsonify({'error': '任务不存在或已过期', 'job_id': job_id}), 404
+    log_info(f"任务取消请求: {job_id} ({status})")
+    return jsonify({'job_id': job_id, 'status': status})
+
+# 取消正在处理的视频任务
+@app.route('/video_cancel/<job_id>', methods=['POST'])
+def video_cancel(job_id):
+    if not video_jobs.cancel(job_id):
+        return jsonify({'error': '任务不存在或已结束', 'job_id': job_id}), 404
+    log_info(f"视频任务取消请求: {job_id}")
+    return jsonify({'status': '已请求取消', 'job_id': job_id})
+
+# 订阅视频任务的进度和部分结果: 默认SSE，format=ndjson时每行一个JSON事件
+@app.route('/video_progress/<job_id>', methods=['GET'])
+def video_progress(job_id):
+    if not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', job_id):
+        return jsonify({'error': '无效的任务ID'}), 400
+    use_ndjson = request.args.get('format', 'sse') == 'ndjson'
+    # 允许在提交任务之前订阅
+    channel = video_progress_hub.create(job_id)
+    
+    def generate():
+        for event in channel.subscribe():
+            if event is None:
+                # 心跳，防止代理断开空闲连接
+                yield '\n' if use_ndjson else ': keepalive\n\n'
+                continue
+            data = detection.dumps_event(event)
+            if use_ndjson:
+                yield data + '\n'
+            else:
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson' if use_ndjson else 'text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# 结果缓存统计
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'video': video_cache.stats(), 'image': image_cache.stats()})
+
+# 摄像头调度状态
+@app.route('/cameras', methods=['GET'])
+def list_cameras():
+    stats = stream_scheduler.stats()
+    for camera in stats['cameras']:
+        camera['mode'] = stream_modes.get(camera['camera_id'], DEFAULT_STREAM_MODE)
+    return jsonify(stats)
+
+# MQTT各发布通道的排队、合并和丢弃统计
+@app.route('/mqtt_stats', methods=['GET'])
+def mqtt_stats():
+    return jsonify({'connected': mqtt_client.is_connected(), 'lanes': mqtt_client.get_stats(),
+                    'spool': mqtt_client.get_spool_stats()})
+
+# 实时帧编码统计，用于按实测成本选择质量档位
+@app.route('/encoder_stats', methods=['GET'])
+def encoder_stats():
+    return jsonify({
+        'current': video_quality,
+        'presets': frame_encoder.presets,
+        'stats': frame_encoder.stats()
+    })
+
+# 运行时添加摄像头
+@app.route('/cameras', methods=['POST'])
+def add_camera():
+    data = request.get_json(silent=True) or {}
+    camera_id = data.get('id')
+    url = data.get('url')
+    if not camera_id or not url:
+        return jsonify({'error': '缺少摄像头ID或视频流地址'}), 400
+    try:
+        target_fps = float(data.get('fps', DEFAULT_STREAM_FPS))
+    except (TypeError, ValueError):
+        return jsonify({'error': '无效的目标帧率'}), 400
+    mode = data.get('mode', DEFAULT_STREAM_MODE)
+    if mode not in STREAM_MODES:
+        return jsonify({'error': f'无效的输出模式: {mode}'}), 400
+    try:
+        camera = stream_scheduler.add_camera(
+            camera_id, url, target_fps=target_fps,
+            size=(video_quality['width'], video_quality['height'])
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    set_stream_mode(camera_id, mode)
+    return jsonify(dict(camera.stats(), mode=mode)), 201
+
+# 切换摄像头的输出模式
+@app.route('/cameras/<camera_id>/mode', methods=['PUT'])
+def update_camera_mode(camera_id):
+    if camera_id not in stream_scheduler.cameras:
+        return jsonify({'error': '摄像头不存在'}), 404
+    mode = (request.get_json(silent=True) or {}).get('mode')
+    if not set_stream_mode(camera_id, mode):
+        return jsonify({'error': f'无效的输出模式: {mode}'}), 400
+    return jsonify({'camera_id': camera_id, 'mode': mode})
+
+# 移除摄像头
+@app.route('/cameras/<camera_id>', methods=['DELETE'])
+def remove_camera(camera_id):
+    if not stream_scheduler.remove_camera(camera_id):
+        return jsonify({'error': '摄像头不存在'}), 404
+    stream_modes.pop(camera_id, None)
+    stream_trackers.pop(camera_id, None)
+    report_incidents(incident_engine.flush(camera_id))
+    return jsonify({'camera_id': camera_id, 'removed': True})
+
+# 列出正在处理的视频任务
+@app.route('/video_jobs', methods=['GET'])
+def list_video_jobs():
+    return jsonify({'jobs': video_jobs.list()})
+
 # 添加日志警告函数
 def log_warning(message): print(f"[WARNING] {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
 
@@ -900,31 +1521,24 @@ if __name__ == '__main__':
     if not mqtt_connected:
         log_warning("MQTT连接失败，将在后台继续尝试自动重连")
     
-    # 创建视频流处理线程并设置优先级
-    import threading
-    video_stream_thread = threading.Thread(
-        target=process_stream, 
-        args=('rtmp://127.0.0.1/live/livestream',), 
-        daemon=True,
-        name="StreamProcessor"
-    )
-    # 设置为较高优先级
-    video_stream_thread.start()
+    # 接入配置的摄像头并启动调度器，每路摄像头有独立的采集线程，推理在调度线程中批量进行
+    for camera in load_camera_config():
+        stream_scheduler.add_camera(
+            camera['id'],
+            camera['url'],
+            target_fps=camera.get('fps', DEFAULT_STREAM_FPS),
+            size=(video_quality['width'], video_quality['height'])
+        )
+        set_stream_mode(camera['id'], camera.get('mode', DEFAULT_STREAM_MODE))
+    stream_scheduler.start()
+    
+    # 启动视频任务队列的工作线程
+    job_queue.start()
     
     # 设置全局异常处理
     def handle_thread_exception(args):
         log_error(f"线程异常: {args.exc_type.__name__}: {args.exc_value}")
         log_error(f"线程名称: {args.thread.name}")
-        # 如果是视频流线程崩溃，尝试重新启动
-        if args.thread.name == "StreamProcessor":
-            log_info("尝试重新启动视频流处理线程...")
-            new_thread = threading.Thread(
-                target=process_stream, 
-                args=('rtmp://127.0.0.1/live/livestream',), 
-                daemon=True,
-                name="StreamProcessor"
-            )
-            new_thread.start()
     
     # 设置线程异常处理器
     threading.excepthook = handle_thread_exception
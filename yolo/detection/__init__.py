@@ -10,6 +10,22 @@ __version__ = '1.0.1'
 # Import sub-modules
 from .detector import Detector, get_detector
 from .video_processor import process_video, detect_video_objects
+from .frame_source import (FrameSource, OpenCVFrameSource, FFmpegFrameSource,
+                           PyAVFrameSource, open_frame_source, probe_video)
+from .sampling import SceneChangeDetector, iter_video_samples
+from .tracking import BoxTracker
+from .speed_estimator import SpeedEstimator, SpeedEstimatorRegistry, homography_from_points
+from .frame_pool import FramePool
+from .video_pipeline import (VideoPipeline, Stage, GateStage, DetectStage, ModelDetectStage,
+                             TrackStage, OCRStage, SpeedStage, AnnotateStage)
+from .checkpoint import JobCheckpoint, file_fingerprint
+from .cancellation import CancellationToken, CancelledError, JobRegistry
+from .progress import ProgressHub, ProgressReporter, dumps_event
+from .frame_grabber import LatestFrameGrabber
+from .frame_encoder import FrameEncoderPool
+from .stream_scheduler import CameraStream, StreamScheduler
+from .incidents import Incident, IncidentEngine
+from .image_decode import DecodedImage, image_size, reduction_factor
 from .image_processor import process_image, process_images_batch
 from .license_plate_ocr import get_license_plate_ocr, LicensePlateOCR
 from .vehicle_analyzer import identify_vehicle_color
@@ -73,5 +89,44 @@ __all__ = [
     'get_vehicle_class_name',
     'load_classes',
     'detect_video_objects',
+    'FrameSource',
+    'OpenCVFrameSource',
+    'FFmpegFrameSource',
+    'PyAVFrameSource',
+    'open_frame_source',
+    'probe_video',
+    'SceneChangeDetector',
+    'iter_video_samples',
+    'BoxTracker',
+    'FramePool',
+    'VideoPipeline',
+    'Stage',
+    'GateStage',
+    'DetectStage',
+    'ModelDetectStage',
+    'TrackStage',
+    'OCRStage',
+    'SpeedStage',
+    'AnnotateStage',
+    'JobCheckpoint',
+    'file_fingerprint',
+    'CancellationToken',
+    'CancelledError',
+    'JobRegistry',
+    'ProgressHub',
+    'ProgressReporter',
+    'dumps_event',
+    'SpeedEstimator',
+    'SpeedEstimatorRegistry',
+    'homography_from_points',
+    'LatestFrameGrabber',
+    'FrameEncoderPool',
+    'CameraStream',
+    'StreamScheduler',
+    'Incident',
+    'IncidentEngine',
+    'DecodedImage',
+    'image_size',
+    'reduction_factor',
     'CONFIG'
 ]
\ No newline at end of file
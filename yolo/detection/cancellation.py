@@ -0,0 +1,165 @@
+"""
+任务取消模块
+
+此模块提供线程安全的取消令牌和任务注册表。每个视频任务持有自己的令牌(可带截止时间)，
+流水线各阶段在处理每一帧前检查令牌，因此多个任务可以在同一进程的不同线程中并行运行，
+互不影响彼此的时间预算；取消请求只需在任意线程中调用cancel()。
+"""
+
+import time
+import threading
+import logging
+
+logger = logging.getLogger("video_processor")
+
+REASON_CANCELLED = 'cancelled'
+REASON_TIMEOUT = 'timeout'
+
+
+class CancelledError(Exception):
+    """任务被取消或超时"""
+    def __init__(self, reason=REASON_CANCELLED):
+        super().__init__(f"任务已终止: {reason}")
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    协作式取消令牌
+
+    cancel()可在任意线程调用；设置了截止时间时，超过截止时间后视为以timeout原因取消。
+    子令牌在父令牌取消时同样视为取消。
+    """
+    def __init__(self, timeout=None, parent=None):
+        """
+        参数:
+            timeout: 时间预算(秒)，None或<=0表示不限制
+            parent: 父令牌
+        """
+        self.deadline = time.monotonic() + timeout if timeout and timeout > 0 else None
+        self.parent = parent
+        self._event = threading.Event()
+        self._reason = None
+        self._lock = threading.Lock()
+
+    def cancel(self, reason=REASON_CANCELLED):
+        """请求取消，只记录第一次的原因"""
+        with self._lock:
+            if self._reason is None:
+                self._reason = reason
+                logger.info(f"任务取消请求: {reason}")
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        """是否已取消(包括超时和父令牌取消)"""
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(REASON_TIMEOUT)
+            return True
+        if self.parent is not None and self.parent.cancelled:
+            self.cancel(self.parent.reason)
+            return True
+        return False
+
+    @property
+    def reason(self):
+        """取消原因，未取消时为None"""
+        return self._reason
+
+    def remaining(self):
+        """距离截止时间的秒数，没有截止时间时返回None"""
+        remaining = None
+        if self.deadline is not None:
+            remaining = max(0.0, self.deadline - time.monotonic())
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                remaining = parent_remaining if remaining is None else min(remaining, parent_remaining)
+        return remaining
+
+    def raise_if_cancelled(self):
+        """已取消时抛出CancelledError"""
+        if self.cancelled:
+            raise CancelledError(self.reason)
+
+    def wait(self, timeout=None):
+        """
+        等待取消或超时
+
+        返回:
+            bool: 是否已取消
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled
+
+
+class JobRegistry:
+    """
+    运行中任务的注册表
+
+    按任务ID保存取消令牌，供取消接口查找。
+    """
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def register(self, job_id, token=None, **info):
+        """
+        注册任务
+
+        参数:
+            job_id: 任务ID
+            token: 取消令牌，为None时创建新的令牌
+            **info: 附加信息(如视频文件名)，会出现在list()中
+
+        返回:
+            CancellationToken
+        """
+        token = token or CancellationToken()
+        with self._lock:
+            if job_id in self._jobs:
+                raise ValueError(f"任务ID已存在: {job_id}")
+            self._jobs[job_id] = {'token': token, 'started': time.time(), 'info': info}
+        return token
+
+    def unregister(self, job_id):
+        """任务结束后移除"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        """获取任务的取消令牌，不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job['token'] if job else None
+
+    def cancel(self, job_id, reason=REASON_CANCELLED):
+        """
+        取消任务
+
+        返回:
+            bool: 任务是否存在
+        """
+        token = self.get(job_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def list(self):
+        """列出运行中的任务"""
+        with self._lock:
+            jobs = list(self._jobs.items())
+        now = time.time()
+        return [{
+            'job_id': job_id,
+            'elapsed': round(now - job['started'], 1),
+            'remaining': job['token'].remaining(),
+            'cancelled': job['token'].cancelled,
+            **job['info']
+        } for job_id, job in jobs]
@@ -0,0 +1,292 @@
+"""
+视频任务检查点模块
+
+长视频按固定时长切分为片段编码，每个片段写完后记录检查点: 已处理到的帧号、
+已完成的片段、已产生的结果以及各阶段的状态。任务因超时、崩溃或重启中断后，
+可以从最后一个检查点继续处理；超时时已完成的片段会先拼接为部分输出。
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from .video_encoder import create_video_encoder, concat_videos
+
+logger = logging.getLogger("video_processor")
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的SHA1，用于识别同一个视频的重复上传
+
+    参数:
+        path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    返回:
+        str: 十六进制摘要
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def json_default(value):
+    """把numpy类型转换为JSON可序列化的类型"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化类型: {type(value)}")
+
+
+class CheckpointMarker:
+    """
+    检查点标记
+
+    由处理线程放入编码队列，编码线程写完标记之前的所有帧后据此提交检查点。
+    """
+    def __init__(self, last_frame, results, stage_state):
+        self.last_frame = last_frame
+        self.results = results
+        self.stage_state = stage_state
+
+
+class JobCheckpoint:
+    """
+    视频任务检查点
+
+    目录结构:
+        checkpoint.json   进度和状态(原子替换写入)
+        results.ndjson    已提交的结果，每行一条
+        segment_00000.mp4 已完成的视频片段
+    """
+    STATE_FILE = 'checkpoint.json'
+    RESULTS_FILE = 'results.ndjson'
+
+    def __init__(self, directory, interval_seconds=30.0, signature=None):
+        """
+        参数:
+            directory: 检查点目录
+            interval_seconds: 提交检查点的间隔(视频时长，秒)
+            signature: 处理参数签名，参数不同的旧检查点不会被恢复
+        """
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.signature = signature
+        self.state = None
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, self.STATE_FILE)
+
+    @property
+    def results_path(self):
+        return os.path.join(self.directory, self.RESULTS_FILE)
+
+    def segment_path(self, index):
+        """第index个片段的路径"""
+        return os.path.join(self.directory, f"segment_{index:05d}.mp4")
+
+    def load(self, video_info):
+        """
+        读取可恢复的检查点
+
+        参数:
+            video_info: 当前视频信息{'width', 'height', 'frame_count'}，与检查点不一致时不恢复
+
+        返回:
+            dict: 检查点状态，没有可恢复的检查点时返回None
+        """
+        self.state = None
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f"检查点损坏，重新开始处理: {e}")
+            return None
+
+        if state.get('signature') != self.signature:
+            logger.info("处理参数已变化，忽略旧检查点")
+            return None
+        for key in ('width', 'height', 'frame_count'):
+            if state.get('video', {}).get(key) != video_info.get(key):
+                logger.info("视频与检查点不一致，忽略旧检查点")
+                return None
+        missing = [s for s in state.get('segments', []) if not os.path.exists(os.path.join(self.directory, s))]
+        if missing:
+            logger.warning(f"检查点缺少片段 {missing}，重新开始处理")
+            return None
+
+        self.state = state
+        return state
+
+    def begin(self, video_info, start_time):
+        """开始新的任务，清除旧的检查点文件"""
+        self.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        self.state = {
+            'signature': self.signature,
+            'video': dict(video_info),
+            'start_time': start_time.isoformat(),
+            'last_frame': 0,
+            'segments': [],
+            'results_count': 0,
+            'stages': {},
+            'updated_at': datetime.now().isoformat()
+        }
+        self._write_state()
+        return self.state
+
+    def load_results(self):
+        """读取已提交的结果(只取检查点记录的条数，忽略提交中断时多写的行)"""
+        results = []
+        count = self.state.get('results_count', 0) if self.state else 0
+        if count <= 0 or not os.path.exists(self.results_path):
+            return results
+        with open(self.results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if len(results) >= count:
+                    break
+                line = line.strip()
+                if line:
+                    results.append(json.loads(line))
+        return results
+
+    def commit(self, segment_name, marker):
+        """
+        提交一个已完成的片段及其对应的结果和阶段状态
+
+        参数:
+            segment_name: 片段文件名，None表示没有新片段
+            marker: CheckpointMarker
+        """
+        if self.state is None:
+            return
+        if marker.results:
+            self._truncate_results(self.state['results_count'])
+            with open(self.results_path, 'a', encoding='utf-8') as f:
+                for record in marker.results:
+                    f.write(json.dumps(record, ensure_ascii=False, default=json_default) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        if segment_name:
+            self.state['segments'].append(segment_name)
+        self.state['last_frame'] = marker.last_frame
+        self.state['results_count'] += len(marker.results)
+        self.state['stages'] = marker.stage_state
+        self.state['updated_at'] = datetime.now().isoformat()
+        self._write_state()
+        logger.info(f"检查点已保存: 第 {marker.last_frame} 帧, {len(self.state['segments'])} 个片段")
+
+    def _truncate_results(self, count):
+        """去掉上次提交中断时写入但未记录的结果行"""
+        if not os.path.exists(self.results_path):
+            return
+        with open(self.results_path, 'r+', encoding='utf-8') as f:
+            lines = f.readlines()
+            if len(lines) <= count:
+                return
+            f.seek(0)
+            f.writelines(lines[:count])
+            f.truncate()
+
+    def _write_state(self):
+        """原子写入状态文件"""
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, default=json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def segment_paths(self):
+        """已提交片段的完整路径"""
+        if self.state is None:
+            return []
+        return [os.path.join(self.directory, s) for s in self.state['segments']]
+
+    def export(self, output_path):
+        """
+        把已提交的片段拼接为输出视频
+
+        返回:
+            bool: 是否成功
+        """
+        segments = self.segment_paths()
+        if not segments:
+            return False
+        if len(segments) == 1:
+            shutil.copyfile(segments[0], output_path)
+            return True
+        return concat_videos(segments, output_path)
+
+    def clear(self):
+        """删除检查点目录"""
+        self.state = None
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SegmentWriter:
+    """
+    分片段编码器
+
+    接口与视频编码器一致(write/close)，另外在收到CheckpointMarker时结束当前片段并提交检查点。
+    """
+    def __init__(self, checkpoint, width, height, fps, encoder_options=None):
+        self.checkpoint = checkpoint
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.encoder_options = encoder_options or {}
+        self.encoder = None
+        self.segment_name = None
+        self.failed = False
+
+    def write(self, frame):
+        if self.encoder is None:
+            index = len(self.checkpoint.state['segments'])
+            path = self.checkpoint.segment_path(index)
+            self.segment_name = os.path.basename(path)
+            self.encoder = create_video_encoder(path, self.width, self.height, self.fps,
+                                                **self.encoder_options)
+            if self.encoder is None:
+                self.failed = True
+                raise RuntimeError(f"无法创建视频片段: {path}")
+        return self.encoder.write(frame)
+
+    def commit(self, marker):
+        """结束当前片段并提交检查点"""
+        segment_name = None
+        if self.encoder is not None:
+            ok = self.encoder.close()
+            self.encoder = None
+            if not ok:
+                self.failed = True
+                raise RuntimeError(f"视频片段编码失败: {self.segment_name}")
+            segment_name = self.segment_name
+        self.checkpoint.commit(segment_name, marker)
+
+    def close(self, timeout=None):
+        """丢弃未提交的片段(其中的帧恢复时会重新处理)"""
+        if self.encoder is not None:
+            self.encoder.close(timeout)
+            self.encoder = None
+            path = os.path.join(self.checkpoint.directory, self.segment_name)
+            if os.path.exists(path):
+                os.remove(path)
+        return not self.failed
@@ -17,6 +17,9 @@ from .license_plate_ocr import LicensePlateOCR, identify_plate_color
 from .vehicle_analyzer import identify_vehicle_color
 from .class_mapper import get_vehicle_class_name, load_classes, DEFAULT_CLASSES, DEFAULT_CLASS_NAMES_ZH
 
+# 模型未记录输入尺寸时使用的默认值(ultralytics默认imgsz)
+DEFAULT_INFERENCE_SIZE = 640
+
 class Detector:
     """
     YOLO检测器类
@@ -41,6 +44,7 @@ class Detector:
         self.use_chinese = use_chinese
         self.batch_size = batch_size
         self.is_onnx = False  # 默认非ONNX模型
+        self.batch_inference = True  # 模型不支持批量输入时自动置为False
         
         # 加载模型
         if model is not None:
@@ -90,8 +94,108 @@ class Detector:
         except Exception as e:
             raise Exception(f"模型加载失败: {e}")
             
+    def _classes_to_detect(self, detect_vehicles, detect_plates, detect_accidents, detect_violations):
+        """根据检测开关确定要检测的类别，全部关闭时返回None(检测所有类别)"""
+        classes_to_detect = []
+        if detect_vehicles:
+            classes_to_detect.extend([0, 1, 2, 3, 4, 5, 6, 7])  # 车辆类别
+        if detect_plates:
+            classes_to_detect.append(8)  # 车牌类别
+        if detect_accidents:
+            classes_to_detect.append(9)  # 事故类别
+        if detect_violations:
+            classes_to_detect.extend([10, 11])  # 违章类别
+        return classes_to_detect or None
+
+    @property
+    def inference_size(self):
+        """模型输入的长边尺寸(像素)，用于选择缩小解码的倍数"""
+        imgsz = (getattr(self.model, 'overrides', None) or {}).get('imgsz') or DEFAULT_INFERENCE_SIZE
+        return max(imgsz) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+    def _predict(self, source, conf_threshold, classes_to_detect):
+        """运行推理，source为单张图像或图像列表"""
+        # 对ONNX模型需要特殊处理，在predict时指定设备
+        if hasattr(self, 'is_onnx') and self.is_onnx:
+            return self.model.predict(
+                source=source, 
+                conf=conf_threshold, 
+                classes=classes_to_detect, 
+                device=self.device,
+                verbose=False
+            )
+        # 使用常规方式处理PT模型
+        return self.model(source, conf=conf_threshold, classes=classes_to_detect, verbose=False)
+
+    def _parse_result(self, r, image, detect_vehicles, detect_plates, hires=None):
+        """
+        把一张图像的推理结果转换为检测结果列表
+        
+        参数:
+            r: 推理结果(ultralytics Results)
+            image: 对应的未标注图像，用于车牌识别和车辆颜色识别
+            detect_vehicles: 是否识别车辆颜色
+            detect_plates: 是否识别车牌号码
+            hires: image为缩小解码的结果时对应的DecodedImage，车牌按原分辨率裁剪识别
+            
+        返回:
+            list: 检测结果
+        """
+        detections = []
+        for box in r.boxes:
+            # 获取边界框
+            x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+            
+            # 获取置信度
+            conf = float(box.conf[0])
+            
+            # 获取类别
+            cls_id = int(box.cls[0])
+            class_name = get_vehicle_class_name(cls_id, self.use_chinese, 
+                                              self.classes, self.class_names_zh)
+            
+            # 确定对象类型
+            box_type = self._determine_box_type(cls_id)
+            
+            # 创建检测结果字典
+            detection = {
+                "coordinates": [x1, y1, x2, y2],
+                "confidence": conf,
+                "class_id": cls_id,
+                "class_name": class_name,
+                "type": box_type
+            }
+            
+            # 如果是车牌且启用了车牌检测，尝试识别车牌号码
+            if cls_id == 8 and detect_plates and self.plate_ocr.is_available():
+                ocr_image, ocr_box = image, [x1, y1, x2, y2]
+                if hires is not None and hires.scale > 1:
+                    # 只在需要识别车牌时按原分辨率解码，裁剪高分辨率的车牌区域
+                    ocr_image, ocr_box = hires.full_resolution(), hires.full_crop_box(ocr_box)
+                plate_text, plate_conf = self._recognize_license_plate(ocr_image, ocr_box)
+                if plate_text:
+                    detection["plate_text"] = plate_text
+                    detection["plate_conf"] = plate_conf
+                    
+                    # 识别车牌颜色
+                    plate_region = ocr_image[ocr_box[1]:ocr_box[3], ocr_box[0]:ocr_box[2]]
+                    plate_color, _ = identify_plate_color(plate_region)
+                    detection["plate_color"] = plate_color
+            
+            # 如果是车辆，尝试识别车辆颜色
+            if cls_id < 8 and detect_vehicles:
+                vehicle_region = image[y1:y2, x1:x2]
+                color_name, rgb_color = identify_vehicle_color(vehicle_region)
+                detection["vehicle_color"] = color_name
+                detection["vehicle_rgb"] = rgb_color
+            
+            # 添加到检测结果列表
+            detections.append(detection)
+        return detections
+
     def detect_objects(self, image, conf_threshold=None, detect_vehicles=True, 
-                       detect_plates=True, detect_accidents=False, detect_violations=False):
+                       detect_plates=True, detect_accidents=False, detect_violations=False,
+                       inplace=False, annotate=True, hires=None):
         """
         检测图像中的对象
         
@@ -102,180 +206,182 @@ class Detector:
             detect_plates: 是否检测车牌
             detect_accidents: 是否检测事故
             detect_violations: 是否检测违章
+            inplace: 是否直接在输入图像上绘制标注(调用方拥有该帧缓冲区时使用，避免整帧复制)
+            annotate: 是否绘制标注，为False时只返回检测结果，由调用方另行绘制
+            hires: image为缩小解码的结果时传入对应的DecodedImage，车牌按原分辨率识别
             
         返回:
             result_image: 标注后的图像
-            detections: 检测结果列表
+            detections: 检测结果列表(坐标基于image)
         """
         if conf_threshold is None:
             conf_threshold = self.conf_threshold
             
-        result_image = image.copy()
+        result_image = image if (inplace or not annotate) else image.copy()
         all_detections = []
         
         # 确定要检测的类别
-        classes_to_detect = []
-        if detect_vehicles:
-            classes_to_detect.extend([0, 1, 2, 3, 4, 5, 6, 7])  # 车辆类别
-        if detect_plates:
-            classes_to_detect.append(8)  # 车牌类别
-        if detect_accidents:
-            classes_to_detect.append(9)  # 事故类别
-        if detect_violations:
-            classes_to_detect.extend([10, 11])  # 违章类别
-            
-        # 如果未指定类别，检测所有类别
-        if not classes_to_detect:
-            classes_to_detect = None
+        classes_to_detect = self._classes_to_detect(detect_vehicles, detect_plates,
+                                                    detect_accidents, detect_violations)
             
         # 运行推理
         try:
-            # 对ONNX模型需要特殊处理，在predict时指定设备
-            if hasattr(self, 'is_onnx') and self.is_onnx:
-                results = self.model.predict(
-                    source=image, 
-                    conf=conf_threshold, 
-                    classes=classes_to_detect, 
-                    device=self.device,
-                    verbose=False
-                )
-            else:
-                # 使用常规方式处理PT模型
-                results = self.model(image, conf=conf_threshold, classes=classes_to_detect, verbose=False)
+            results = self._predict(image, conf_threshold, classes_to_detect)
             
             # 处理检测结果
             for r in results:
-                boxes = r.boxes
-                
-                for box in boxes:
-                    # 获取边界框
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                    
-                    # 获取置信度
-                    conf = float(box.conf[0])
-                    
-                    # 获取类别
-                    cls_id = int(box.cls[0])
-                    class_name = get_vehicle_class_name(cls_id, self.use_chinese, 
-                                                      self.classes, self.class_names_zh)
-                    
-                    # 确定对象类型
-                    box_type = self._determine_box_type(cls_id)
-                    
-                    # 创建检测结果字典
-                    detection = {
-                        "coordinates": [x1, y1, x2, y2],
-                        "confidence": conf,
-                        "class_id": cls_id,
-                        "class_name": class_name,
-                        "type": box_type
-                    }
-                    
-                    # 如果是车牌且启用了车牌检测，尝试识别车牌号码
-                    if cls_id == 8 and detect_plates and self.plate_ocr.is_available():
-                        plate_text, plate_conf = self._recognize_license_plate(image, [x1, y1, x2, y2])
-                        if plate_text:
-                            detection["plate_text"] = plate_text
-                            detection["plate_conf"] = plate_conf
-                            
-                            # 识别车牌颜色
-                            plate_region = image[y1:y2, x1:x2]
-                            plate_color, _ = identify_plate_color(plate_region)
-                            detection["plate_color"] = plate_color
-                    
-                    # 如果是车辆，尝试识别车辆颜色
-                    if cls_id < 8 and detect_vehicles:
-                        vehicle_region = image[y1:y2, x1:x2]
-                        color_name, rgb_color = identify_vehicle_color(vehicle_region)
-                        detection["vehicle_color"] = color_name
-                        detection["vehicle_rgb"] = rgb_color
-                    
-                    # 绘制边界框
-                    # 基于类型设置颜色
-                    custom_color = None
-                    
-                    # 根据类别ID设置不同颜色
-                    if cls_id == 0:  # 小汽车
-                        custom_color = (0, 255, 0)  # 绿色 (BGR)
-                    elif cls_id == 1:  # 公交车
-                        custom_color = (255, 128, 0)  # 蓝紫色
-                    elif cls_id == 2:  # 油罐车
-                        custom_color = (0, 0, 255)  # 红色
-                    elif cls_id == 3:  # 集装箱卡车
-                        custom_color = (255, 0, 0)  # 蓝色
-                    elif cls_id == 4:  # 卡车
-                        custom_color = (0, 255, 255)  # 黄色
-                    elif cls_id == 5:  # 面包车
-                        custom_color = (128, 0, 128)  # 紫色
-                    elif cls_id == 6:  # 皮卡
-                        custom_color = (255, 128, 128)  # 浅蓝色
-                    elif cls_id == 7:  # 特种车辆
-                        custom_color = (0, 165, 255)  # 橙色
-                    elif cls_id == 8:  # 车牌
-                        custom_color = (255, 0, 0)  # 蓝色
-                    elif cls_id == 9:  # 事故
-                        custom_color = (0, 0, 255)  # 红色
-                    elif cls_id == 10:  # 违章停车
-                        custom_color = (0, 140, 255)  # 橙色
-                    elif cls_id == 11:  # 超速
-                        custom_color = (0, 0, 200)  # 暗红色
-                        
-                    # 如果是车辆，并且颜色识别可用，使用车辆颜色
-                    if box_type == "vehicle" and cls_id < 8 and "vehicle_rgb" in detection:
-                        # 检查配置选项
-                        use_class_color = True  # 默认使用类别颜色
-                        # 尝试从全局配置中获取
-                        try:
-                            # 动态导入避免循环导入
-                            import sys
-                            if 'detection' in sys.modules and hasattr(sys.modules['detection'], 'CONFIG'):
-                                use_class_color = sys.modules['detection'].CONFIG.get('use_class_color', True)
-                        except:
-                            pass  # 出错时使用默认值
-                            
-                        if not use_class_color:
-                            rgb = detection["vehicle_rgb"]
-                            # 转换RGB到BGR
-                            custom_color = (int(rgb[2]), int(rgb[1]), int(rgb[0]))
-                    
-                    draw_fancy_box(result_image, x1, y1, x2, y2, box_type=box_type, custom_color=custom_color)
-                    
-                    # 绘制标签
-                    label_text = f"{class_name} ({conf:.2f})"
-                    if 'plate_text' in detection:
-                        label_text = f"{detection['plate_text']} ({detection['plate_conf']:.2f})"
-                    
-                    # 根据对象类型选择文字颜色
-                    if box_type == "vehicle":
-                        text_color = (50, 255, 50)  # 车辆：亮绿色
-                    elif box_type == "license_plate":
-                        text_color = (255, 255, 0)  # 车牌：黄色
-                    elif box_type == "accident":
-                        text_color = (0, 165, 255)  # 事故：橙色
-                    elif box_type in ["illegal_parking", "overspeed", "violation"]:
-                        text_color = (0, 0, 255)    # 违章：红色
-                    else:
-                        text_color = (255, 255, 255)  # 其他：白色
-                    
-                    # 绘制文本
-                    result_image = draw_text_pil(
-                        result_image,
-                        label_text,
-                        (x1, max(y1-30, 10)),
-                        font_size=20,
-                        text_color=text_color,
-                        bg_color=(0, 0, 0, 180),
-                        with_background=True
-                    )
-                    
-                    # 添加到检测结果列表
-                    all_detections.append(detection)
+                all_detections.extend(self._parse_result(r, image, detect_vehicles, detect_plates, hires))
+            
+            # 所有区域(车牌OCR、车辆颜色)都取自未标注的图像后再统一绘制，
+            # 因此原地绘制不会影响识别结果
+            if annotate:
+                for detection in all_detections:
+                    result_image = self.draw_detection(result_image, detection)
         except Exception as e:
             print(f"检测失败: {e}")
             import traceback
             traceback.print_exc()
             
         return result_image, all_detections
+
+    def detect_batch(self, images, conf_threshold=None, detect_vehicles=True, 
+                     detect_plates=True, detect_accidents=False, detect_violations=False,
+                     inplace=False, annotate=True):
+        """
+        批量检测多张图像(例如多路摄像头的当前帧)，一次推理处理整批
+        
+        模型不支持批量输入时(如固定batch为1导出的ONNX)自动退回逐张推理。
+        参数与detect_objects相同。
+        
+        返回:
+            list: 与images对应的(result_image, detections)
+        """
+        if not images:
+            return []
+        if conf_threshold is None:
+            conf_threshold = self.conf_threshold
+        classes_to_detect = self._classes_to_detect(detect_vehicles, detect_plates,
+                                                    detect_accidents, detect_violations)
+        
+        results = None
+        if len(images) > 1 and self.batch_inference:
+            try:
+                results = self._predict(list(images), conf_threshold, classes_to_detect)
+            except Exception as e:
+                print(f"批量推理失败，改为逐张推理: {e}")
+                self.batch_inference = False
+        
+        outputs = []
+        for i, image in enumerate(images):
+            result_image = image if (inplace or not annotate) else image.copy()
+            detections = []
+            try:
+                if results is not None:
+                    detections = self._parse_result(results[i], image, detect_vehicles, detect_plates)
+                else:
+                    for r in self._predict(image, conf_threshold, classes_to_detect):
+                        detections.extend(self._parse_result(r, image, detect_vehicles, detect_plates))
+                if annotate:
+                    for detection in detections:
+                        result_image = self.draw_detection(result_image, detection)
+            except Exception as e:
+                print(f"检测失败: {e}")
+                import traceback
+                traceback.print_exc()
+            outputs.append((result_image, detections))
+        return outputs
+        
+    def draw_detection(self, result_image, detection):
+        """
+        在图像上绘制单个检测结果的边界框和标签
+        
+        参数:
+            result_image: 要绘制的图像
+            detection: 检测结果字典(detect_objects的返回格式)
+            
+        返回:
+            绘制后的图像
+        """
+        x1, y1, x2, y2 = detection["coordinates"]
+        cls_id = detection["class_id"]
+        box_type = detection.get("type", self._determine_box_type(cls_id))
+        
+        # 基于类型设置颜色
+        custom_color = None
+        
+        # 根据类别ID设置不同颜色
+        if cls_id == 0:  # 小汽车
+            custom_color = (0, 255, 0)  # 绿色 (BGR)
+        elif cls_id == 1:  # 公交车
+            custom_color = (255, 128, 0)  # 蓝紫色
+        elif cls_id == 2:  # 油罐车
+            custom_color = (0, 0, 255)  # 红色
+        elif cls_id == 3:  # 集装箱卡车
+            custom_color = (255, 0, 0)  # 蓝色
+        elif cls_id == 4:  # 卡车
+            custom_color = (0, 255, 255)  # 黄色
+        elif cls_id == 5:  # 面包车
+            custom_color = (128, 0, 128)  # 紫色
+        elif cls_id == 6:  # 皮卡
+            custom_color = (255, 128, 128)  # 浅蓝色
+        elif cls_id == 7:  # 特种车辆
+            custom_color = (0, 165, 255)  # 橙色
+        elif cls_id == 8:  # 车牌
+            custom_color = (255, 0, 0)  # 蓝色
+        elif cls_id == 9:  # 事故
+            custom_color = (0, 0, 255)  # 红色
+        elif cls_id == 10:  # 违章停车
+            custom_color = (0, 140, 255)  # 橙色
+        elif cls_id == 11:  # 超速
+            custom_color = (0, 0, 200)  # 暗红色
+            
+        # 如果是车辆，并且颜色识别可用，使用车辆颜色
+        if box_type == "vehicle" and cls_id < 8 and "vehicle_rgb" in detection:
+            # 检查配置选项
+            use_class_color = True  # 默认使用类别颜色
+            # 尝试从全局配置中获取
+            try:
+                # 动态导入避免循环导入
+                import sys
+                if 'detection' in sys.modules and hasattr(sys.modules['detection'], 'CONFIG'):
+                    use_class_color = sys.modules['detection'].CONFIG.get('use_class_color', True)
+            except:
+                pass  # 出错时使用默认值
+                
+            if not use_class_color:
+                rgb = detection["vehicle_rgb"]
+                # 转换RGB到BGR
+                custom_color = (int(rgb[2]), int(rgb[1]), int(rgb[0]))
+        
+        draw_fancy_box(result_image, x1, y1, x2, y2, box_type=box_type, custom_color=custom_color)
+        
+        # 绘制标签
+        label_text = f"{detection['class_name']} ({detection['confidence']:.2f})"
+        if 'plate_text' in detection:
+            label_text = f"{detection['plate_text']} ({detection['plate_conf']:.2f})"
+        
+        # 根据对象类型选择文字颜色
+        if box_type == "vehicle":
+            text_color = (50, 255, 50)  # 车辆：亮绿色
+        elif box_type == "license_plate":
+            text_color = (255, 255, 0)  # 车牌：黄色
+        elif box_type == "accident":
+            text_color = (0, 165, 255)  # 事故：橙色
+        elif box_type in ["illegal_parking", "overspeed", "violation"]:
+            text_color = (0, 0, 255)    # 违章：红色
+        else:
+            text_color = (255, 255, 255)  # 其他：白色
+        
+        # 绘制文本
+        return draw_text_pil(
+            result_image,
+            label_text,
+            (x1, max(y1-30, 10)),
+            font_size=20,
+            text_color=text_color,
+            bg_color=(0, 0, 0, 180),
+            with_background=True
+        )
         
     def _determine_box_type(self, cls_id):
         """根据类别ID确定边界框类型"""
@@ -329,13 +435,15 @@ class Detector:
             
         return None, 0
         
-    def detect_license_plate(self, image, conf_threshold=None):
+    def detect_license_plate(self, image, conf_threshold=None, annotate=True, hires=None):
         """
         专门检测车牌
         
         参数:
             image: 输入图像
             conf_threshold: 置信度阈值
+            annotate: 是否绘制标注(为False时返回原图)
+            hires: image为缩小解码的结果时对应的DecodedImage
             
         返回:
             result_image: 标注后的图像
@@ -347,17 +455,20 @@ class Detector:
             detect_vehicles=False, 
             detect_plates=True, 
             detect_accidents=False, 
-            detect_violations=False
+            detect_violations=False,
+            annotate=annotate,
+            hires=hires
         )
         return result_image, detections
         
-    def detect_accident(self, image, conf_threshold=None):
+    def detect_accident(self, image, conf_threshold=None, annotate=True):
         """
         专门检测事故
         
         参数:
             image: 输入图像
             conf_threshold: 置信度阈值
+            annotate: 是否绘制标注(为False时返回原图)
             
         返回:
             result_image: 标注后的图像
@@ -369,11 +480,13 @@ class Detector:
             detect_vehicles=True,  # 事故检测需要同时检测车辆
             detect_plates=False, 
             detect_accidents=True, 
-            detect_violations=False
+            detect_violations=False,
+            annotate=annotate
         )
         return result_image, detections
         
-    def detect_violation(self, image, conf_threshold=None, detect_illegal_parking=True, detect_overspeed=True):
+    def detect_violation(self, image, conf_threshold=None, detect_illegal_parking=True, detect_overspeed=True,
+                         annotate=True):
         """
         专门检测违章行为
         
@@ -382,6 +495,7 @@ class Detector:
             conf_threshold: 置信度阈值
             detect_illegal_parking: 是否检测违停
             detect_overspeed: 是否检测超速
+            annotate: 是否绘制标注(为False时返回原图)
             
         返回:
             result_image: 标注后的图像
@@ -396,10 +510,10 @@ class Detector:
             
         # 如果没有启用任何违章检测，直接返回
         if not classes_to_detect:
-            return image.copy(), []
+            return (image.copy() if annotate else image), []
             
         # 执行检测
-        result_image = image.copy()
+        result_image = image.copy() if annotate else image
         all_detections = []
         
         try:
@@ -445,34 +559,35 @@ class Detector:
                         "type": violation_type
                     }
                     
-                    # 绘制边界框
-                    draw_fancy_box(result_image, x1, y1, x2, y2, box_type=violation_type)
+                    if annotate:
+                        # 绘制边界框
+                        draw_fancy_box(result_image, x1, y1, x2, y2, box_type=violation_type)
                     
-                    # 绘制标签
-                    label_text = f"{class_name} ({conf:.2f})"
+                        # 绘制标签
+                        label_text = f"{class_name} ({conf:.2f})"
                     
-                    # 根据对象类型选择文字颜色
-                    if violation_type == "vehicle":
-                        text_color = (50, 255, 50)  # 车辆：亮绿色
-                    elif violation_type == "license_plate":
-                        text_color = (255, 255, 0)  # 车牌：黄色
-                    elif violation_type == "accident":
-                        text_color = (0, 165, 255)  # 事故：橙色
-                    elif violation_type in ["illegal_parking", "overspeed", "violation"]:
-                        text_color = (0, 0, 255)    # 违章：红色
-                    else:
-                        text_color = (255, 255, 255)  # 其他：白色
+                        # 根据对象类型选择文字颜色
+                        if violation_type == "vehicle":
+                            text_color = (50, 255, 50)  # 车辆：亮绿色
+                        elif violation_type == "license_plate":
+                            text_color = (255, 255, 0)  # 车牌：黄色
+                        elif violation_type == "accident":
+                            text_color = (0, 165, 255)  # 事故：橙色
+                        elif violation_type in ["illegal_parking", "overspeed", "violation"]:
+                            text_color = (0, 0, 255)    # 违章：红色
+                        else:
+                            text_color = (255, 255, 255)  # 其他：白色
                     
-                    # 绘制文本
-                    result_image = draw_text_pil(
-                        result_image,
-                        label_text,
-                        (x1, max(y1-30, 10)),
-                        font_size=20,
-                        text_color=text_color,
-                        bg_color=(0, 0, 0, 180),
-                        with_background=True
-                    )
+                        # 绘制文本
+                        result_image = draw_text_pil(
+                            result_image,
+                            label_text,
+                            (x1, max(y1-30, 10)),
+                            font_size=20,
+                            text_color=text_color,
+                            bg_color=(0, 0, 0, 180),
+                            with_background=True
+                        )
                     
                     # 添加到检测结果列表
                     all_detections.append(detection)
@@ -484,7 +599,10 @@ class Detector:
         
     def process_video(self, video_path, output_path=None, enable_license_plate=True, enable_speed=False,
                      show_preview=False, skip_frames=2, timestamp_format='%Y-%m-%d %H:%M:%S',
-                     start_time=None, fps_override=None, batch_size=4):
+                     start_time=None, fps_override=None, track_skipped_frames=True,
+                     checkpoint_dir=None, cancel_token=None, timeout=600, progress_callback=None,
+                     fragmented_output=False, speed_calibration=None, detect_accidents=False,
+                     detect_violations=False):
         """
         处理视频文件，检测车辆、车牌和违章行为
         
@@ -498,7 +616,15 @@ class Detector:
             timestamp_format: 时间戳格式
             start_time: 起始时间，用于自定义时间戳
             fps_override: 覆盖视频的FPS设置
-            batch_size: 批处理大小
+            track_skipped_frames: 是否在跳过的帧上绘制跟踪推算的框
+            checkpoint_dir: 检查点目录，提供时可从上次中断处继续处理
+            cancel_token: CancellationToken，用于从其他线程取消任务
+            timeout: 本任务的时间预算(秒)
+            progress_callback: 进度回调，处理过程中接收进度和部分结果事件
+            fragmented_output: 是否输出边处理边可播放的分片MP4
+            speed_calibration: 摄像头的地面标定，提供时按地面坐标测速
+            detect_accidents: 是否检测事故
+            detect_violations: 是否检测违停和超速类别
             
         返回:
             output_path: 处理后的视频路径
@@ -519,7 +645,15 @@ class Detector:
             timestamp_format=timestamp_format,
             start_time=start_time,
             fps_override=fps_override,
-            batch_size=batch_size
+            track_skipped_frames=track_skipped_frames,
+            checkpoint_dir=checkpoint_dir,
+            cancel_token=cancel_token,
+            timeout=timeout,
+            progress_callback=progress_callback,
+            fragmented_output=fragmented_output,
+            speed_calibration=speed_calibration,
+            detect_accidents=detect_accidents,
+            detect_violations=detect_violations
         )
 
 
@@ -0,0 +1,190 @@
+"""
+帧编码模块
+
+实时帧的JPEG/WebP编码在独立的线程池中进行(OpenCV编码时释放GIL，可与下一帧推理并行)，
+并按预设统计每帧的编码耗时和字节数，质量档位可以依据实测成本选择:
+- jpeg: 普通JPEG，最快
+- jpeg_optimized: 优化霍夫曼表的JPEG，体积小约5-10%，编码明显更慢
+- webp: 同等画质下体积最小，编码最慢
+"""
+
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+logger = logging.getLogger("video_processor")
+
+# 编码格式 -> (扩展名, 编码参数生成函数)
+FORMATS = {
+    'jpeg': ('.jpg', lambda q: [int(cv2.IMWRITE_JPEG_QUALITY), q]),
+    'jpeg_optimized': ('.jpg', lambda q: [int(cv2.IMWRITE_JPEG_QUALITY), q, int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]),
+    'webp': ('.webp', lambda q: [int(cv2.IMWRITE_WEBP_QUALITY), q]),
+}
+
+# 质量档位: 分辨率、编码格式和质量
+DEFAULT_PRESETS = {
+    'HIGH': {'width': 1280, 'height': 720, 'format': 'jpeg', 'quality': 85},
+    'MEDIUM': {'width': 854, 'height': 480, 'format': 'jpeg', 'quality': 80},
+    'LOW': {'width': 640, 'height': 360, 'format': 'jpeg', 'quality': 70},
+    'LOW_WEBP': {'width': 640, 'height': 360, 'format': 'webp', 'quality': 70},
+}
+
+# 各格式的MIME类型
+MIME_TYPES = {'jpeg': 'image/jpeg', 'jpeg_optimized': 'image/jpeg', 'webp': 'image/webp'}
+
+
+class FrameEncoderPool:
+    """
+    帧编码线程池
+
+    encode()在调用线程中编码，submit()提交到线程池异步编码，两者都计入统计。
+    submit_latest()用于实时流: 同一key(摄像头)最多一帧在编码，编码期间到达的帧只保留最新一帧，
+    编码慢于推理时丢弃旧帧而不排队，也保证同一key的帧按提交顺序完成。
+    """
+    def __init__(self, workers=2, presets=None):
+        """
+        参数:
+            workers: 编码线程数
+            presets: 质量档位{name: {'width', 'height', 'format', 'quality'}}，默认DEFAULT_PRESETS
+        """
+        self.presets = dict(presets or DEFAULT_PRESETS)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-encoder")
+        self._stats = {}
+        self._slots = {}  # key -> 等待编码的最新帧，None表示有帧在编码但没有等待的帧
+        self._lock = threading.Lock()
+
+    def preset(self, name):
+        """档位设置，档位不存在时返回None"""
+        preset = self.presets.get(name)
+        return dict(preset) if preset else None
+
+    def encode(self, frame, fmt='jpeg', quality=80, size=None, label=None):
+        """
+        编码一帧
+
+        参数:
+            frame: BGR图像
+            fmt: 编码格式(见FORMATS)
+            quality: 编码质量(0-100)
+            size: 输出尺寸(width, height)，与帧尺寸不同时先缩放
+            label: 统计分组名(默认为格式和质量)
+
+        返回:
+            bytes: 编码后的图像，失败时返回None
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的编码格式: {fmt}")
+        ext, params = FORMATS[fmt]
+        start = time.perf_counter()
+        if size and (frame.shape[1], frame.shape[0]) != tuple(size):
+            frame = cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(ext, frame, params(int(quality)))
+        elapsed = time.perf_counter() - start
+        if not ok:
+            logger.error(f"帧编码失败: {fmt}")
+            return None
+        data = buffer.tobytes()
+        self._record(label or f"{fmt}@{int(quality)}", elapsed, len(data), frame.shape)
+        return data
+
+    def encode_preset(self, frame, name):
+        """按档位编码一帧"""
+        preset = self.presets[name]
+        return self.encode(frame, preset['format'], preset['quality'],
+                           (preset['width'], preset['height']), label=name)
+
+    def submit(self, frame, fmt='jpeg', quality=80, size=None, label=None):
+        """
+        异步编码一帧(调用方在future完成前不能修改frame)
+
+        返回:
+            concurrent.futures.Future: 结果为encode()的返回值
+        """
+        return self._executor.submit(self.encode, frame, fmt, quality, size, label)
+
+    def submit_latest(self, key, callback, frame, fmt='jpeg', quality=80, size=None, label=None):
+        """
+        异步编码一帧，同一key最多一帧在编码(调用方在编码完成前不能修改frame)
+
+        该key有帧在编码时，本帧替换之前等待的帧，前一帧编码完成后再编码；被替换的帧不回调。
+
+        参数:
+            key: 分组键(如摄像头ID)
+            callback: 编码完成后在编码线程中调用callback(data)，data为encode()的返回值(失败时为None)
+            其余参数同encode()
+
+        返回:
+            bool: 是否立即开始编码(False表示在等待前一帧)
+        """
+        job = (callback, frame, fmt, quality, size, label)
+        with self._lock:
+            if key in self._slots:
+                replaced = self._slots[key]
+                self._slots[key] = job
+                if replaced is not None:
+                    self._stat(replaced[5] or f"{replaced[2]}@{int(replaced[3])}")['dropped'] += 1
+                return False
+            self._slots[key] = None
+        self._executor.submit(self._run_latest, key, job)
+        return True
+
+    def _run_latest(self, key, job):
+        """编码submit_latest()提交的帧，完成后提交该key等待中的帧"""
+        callback, frame, fmt, quality, size, label = job
+        try:
+            data = self.encode(frame, fmt, quality, size, label)
+        except Exception as e:
+            logger.error(f"帧编码异常: {e}")
+            data = None
+        try:
+            callback(data)
+        except Exception as e:
+            logger.error(f"帧编码回调异常: {e}")
+        with self._lock:
+            pending = self._slots.pop(key, None)
+            if pending is not None:
+                self._slots[key] = None
+        if pending is not None:
+            self._executor.submit(self._run_latest, key, pending)
+
+    def _stat(self, label):
+        """统计分组(调用时需持有锁)"""
+        stats = self._stats.get(label)
+        if stats is None:
+            stats = self._stats[label] = {'frames': 0, 'seconds': 0.0, 'bytes': 0, 'resolution': None,
+                                          'dropped': 0}
+        return stats
+
+    def _record(self, label, elapsed, nbytes, shape):
+        with self._lock:
+            stats = self._stat(label)
+            stats['frames'] += 1
+            stats['seconds'] += elapsed
+            stats['bytes'] += nbytes
+            stats['resolution'] = f"{shape[1]}x{shape[0]}"
+
+    def stats(self):
+        """
+        编码统计
+
+        返回:
+            dict: {label: {'frames', 'avg_encode_ms', 'avg_bytes', 'resolution', 'dropped'}}，
+                  dropped为submit_latest()中被更新的帧替换而未编码的帧数
+        """
+        with self._lock:
+            return {
+                label: {
+                    'frames': s['frames'],
+                    'avg_encode_ms': round(s['seconds'] / s['frames'] * 1000, 2) if s['frames'] else 0.0,
+                    'avg_bytes': int(s['bytes'] / s['frames']) if s['frames'] else 0,
+                    'resolution': s['resolution'],
+                    'dropped': s['dropped']
+                }
+                for label, s in self._stats.items()
+            }
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
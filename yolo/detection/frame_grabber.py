@@ -0,0 +1,181 @@
+"""
+实时流最新帧采集模块
+
+推理比摄像头慢时，如果在推理循环中调用read()，解码器内部缓冲区会逐渐积压，
+画面越来越落后于现实(即使设置了CAP_PROP_BUFFERSIZE)。此模块用独立线程持续读取视频流，
+只保留最新一帧，旧帧直接覆盖并计入丢帧数，推理端每次拿到的都是最新画面，
+端到端延迟不随负载增长。
+"""
+
+import time
+import threading
+import logging
+
+from .frame_source import open_frame_source
+
+logger = logging.getLogger("video_processor")
+
+
+class LatestFrameGrabber:
+    """
+    最新帧采集器
+
+    采集线程持续读取并覆盖最新帧槽位，断开后按退避间隔重连。
+    消费端用take()非阻塞取帧，或用wait_frame()等待下一帧。
+    """
+    def __init__(self, url, target_fps=None, size=None, buffer_size=2,
+                 reconnect_delay=3.0, max_reconnect_delay=60.0, name=None):
+        """
+        参数:
+            url: RTSP/HTTP/RTMP视频流地址
+            target_fps: 消费端的目标帧率，设置后只解码约两倍目标帧率的帧(其余帧只grab)，None表示逐帧解码
+            size: 输出尺寸(width, height)，None表示原始尺寸
+            buffer_size: 解码器缓冲区帧数
+            reconnect_delay: 初始重连间隔(秒)
+            max_reconnect_delay: 最大重连间隔(秒)
+            name: 日志中显示的名称(默认为url)
+        """
+        self.url = url
+        self.target_fps = max(0.1, float(target_fps)) if target_fps else None
+        self.size = tuple(size) if size else None
+        self.buffer_size = buffer_size
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.name = name or url
+
+        self.connected = False
+        self.source_fps = 0.0
+        self.frames_captured = 0
+        self.frames_taken = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.last_frame_age = 0.0
+        self._frame = None
+        self._frame_time = 0.0
+        self._seq = 0
+        self._taken_seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._on_frame = None
+
+    def start(self, on_frame=None):
+        """启动采集线程，on_frame()在有新帧时调用(用于唤醒消费端)"""
+        self._on_frame = on_frame
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._capture_loop, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _capture_loop(self):
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            source = open_frame_source(self.url, size=self.size, buffer_size=self.buffer_size)
+            if source is None:
+                logger.error(f"视频流 {self.name} 无法连接，{delay:.0f}秒后重试")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            delay = self.reconnect_delay
+            self.source_fps = source.fps
+            self.connected = True
+            logger.info(f"视频流 {self.name} 已连接")
+            try:
+                while not self._stop.is_set():
+                    # 按目标帧率跳帧，跳过的帧只grab不解码，但仍被读出，缓冲区不会积压
+                    step = 1
+                    if self.target_fps and source.fps:
+                        step = max(1, int(source.fps / (2 * self.target_fps)))
+                    if step != source.step or self.size != source.size:
+                        source.reconfigure(step=step, size=self.size)
+                    ok, frame = source.read()
+                    if not ok:
+                        logger.error(f"视频流 {self.name} 读取失败，准备重连")
+                        break
+                    with self._cond:
+                        if self._seq > self._taken_seq:
+                            self.frames_dropped += 1
+                        self._frame = frame
+                        self._frame_time = time.time()
+                        self._seq += 1
+                        self.frames_captured += 1
+                        self._cond.notify_all()
+                    if self._on_frame:
+                        self._on_frame()
+            finally:
+                self.connected = False
+                source.release()
+            if not self._stop.is_set():
+                self.reconnects += 1
+                self._stop.wait(self.reconnect_delay)
+
+    def configure(self, target_fps=None, size=None):
+        """修改目标帧率或输出尺寸，采集线程在下一帧生效"""
+        if target_fps:
+            self.target_fps = max(0.1, float(target_fps))
+        if size:
+            self.size = tuple(size)
+
+    def has_new_frame(self):
+        return self._seq > self._taken_seq
+
+    def take(self):
+        """
+        取出最新帧
+
+        返回:
+            tuple: (frame, capture_time)，没有新帧时返回(None, 0)
+        """
+        with self._cond:
+            return self._take()
+
+    def wait_frame(self, timeout=None):
+        """
+        等待并取出比上次更新的帧
+
+        参数:
+            timeout: 最长等待时间(秒)
+
+        返回:
+            tuple: (frame, capture_time)，超时或已停止时返回(None, 0)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > self._taken_seq or self._stop.is_set(), timeout)
+            return self._take()
+
+    def _take(self):
+        """取出最新帧(调用时需持有锁)"""
+        if self._seq <= self._taken_seq:
+            return None, 0.0
+        self._taken_seq = self._seq
+        self.frames_taken += 1
+        self.last_frame_age = time.time() - self._frame_time
+        frame, self._frame = self._frame, None
+        return frame, self._frame_time
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'connected': self.connected,
+            'source_fps': round(self.source_fps, 2),
+            'frames_captured': self.frames_captured,
+            'frames_taken': self.frames_taken,
+            'frames_dropped': self.frames_dropped,
+            'reconnects': self.reconnects,
+            'frame_age_ms': round(self.last_frame_age * 1000, 1)
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
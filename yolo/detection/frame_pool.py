@@ -0,0 +1,96 @@
+"""
+帧缓冲池模块
+
+此模块提供固定尺寸帧缓冲区的复用分配器。视频流水线中解码直接写入池中的缓冲区，
+标注在同一缓冲区上原地完成，编码写出后再归还到池中，避免每帧重新分配整帧内存。
+"""
+
+import queue
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("video_processor")
+
+
+class FramePool:
+    """
+    帧缓冲池
+
+    缓冲区用尽且已达到上限时acquire会等待其他阶段归还，从而对解码形成背压。
+    """
+    def __init__(self, shape, max_buffers=16, dtype=np.uint8):
+        """
+        参数:
+            shape: 缓冲区形状，例如(height, width, 3)
+            max_buffers: 最多分配的缓冲区数量
+            dtype: 数据类型
+        """
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.max_buffers = max_buffers
+        self._free = queue.Queue()
+        self._owned = set()
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, timeout=None):
+        """
+        获取一个缓冲区
+
+        参数:
+            timeout: 池已满时最长等待时间(秒)，None表示一直等待
+
+        返回:
+            numpy数组，超时返回None
+        """
+        try:
+            buffer = self._free.get_nowait()
+            self.reused += 1
+            return buffer
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self.allocated < self.max_buffers:
+                buffer = np.empty(self.shape, dtype=self.dtype)
+                self._owned.add(id(buffer))
+                self.allocated += 1
+                return buffer
+
+        # 已达上限，等待其他阶段归还
+        try:
+            buffer = self._free.get(timeout=timeout)
+            self.reused += 1
+            return buffer
+        except queue.Empty:
+            return None
+
+    def release(self, buffer):
+        """
+        归还缓冲区，不属于本池的数组会被忽略
+
+        返回:
+            bool: 是否归还成功
+        """
+        if buffer is None or id(buffer) not in self._owned:
+            return False
+        self._free.put(buffer)
+        return True
+
+    def owns(self, buffer):
+        """判断数组是否属于本池"""
+        return buffer is not None and id(buffer) in self._owned
+
+    def stats(self):
+        """获取分配统计"""
+        buffer_bytes = int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+        return {
+            'allocated': self.allocated,
+            'reused': self.reused,
+            'free': self._free.qsize(),
+            'buffer_bytes': buffer_bytes,
+            'pool_bytes': buffer_bytes * self.allocated
+        }
@@ -0,0 +1,568 @@
+"""
+视频帧数据源模块
+
+此模块为视频读取提供统一的帧数据源接口，支持三种后端:
+- OpenCV: 兼容所有输入(包括实时流)，跳过的帧只grab不做颜色转换
+- ffmpeg管道: 在解码器中完成抽帧(select)、只解码关键帧(-skip_frame nokey)和缩放
+- PyAV(可选): 进程内解码，支持关键帧模式和按时间定位
+
+抽样类任务(每N帧取一帧、只看关键帧、缩小分辨率)应使用后两种后端，
+避免为永远不会用到的帧付出完整解码和全分辨率转换的代价。
+"""
+
+import os
+import re
+import queue
+import shutil
+import subprocess
+import threading
+import logging
+
+import cv2
+import numpy as np
+
+try:
+    import av
+    HAS_AV = True
+except ImportError:
+    HAS_AV = False
+
+logger = logging.getLogger("video_processor")
+
+# 实时流地址前缀
+STREAM_PREFIXES = ('rtmp://', 'rtsp://', 'http://', 'https://', 'udp://', 'tcp://', 'srt://')
+
+
+def is_stream_url(path):
+    """判断输入是否为实时流地址"""
+    return isinstance(path, str) and path.lower().startswith(STREAM_PREFIXES)
+
+
+def probe_video(path):
+    """
+    读取视频基本信息
+
+    参数:
+        path: 视频文件路径
+
+    返回:
+        dict: width, height, fps, frame_count(未知时为0)，打开失败返回None
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        return {
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': cap.get(cv2.CAP_PROP_FPS),
+            'frame_count': max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        }
+    finally:
+        cap.release()
+
+
+class FrameSource:
+    """
+    帧数据源基类
+
+    read()与cv2.VideoCapture.read()一致返回(ret, frame)，
+    最近一帧在视频中的位置记录在frame_index(从0开始)和timestamp(秒)中。
+    """
+    backend = 'base'
+
+    def __init__(self, path, step=1, keyframes_only=False, size=None, start_time=0.0):
+        """
+        初始化数据源
+
+        参数:
+            path: 视频文件路径或流地址
+            step: 每step帧输出一帧
+            keyframes_only: 只输出关键帧
+            size: 输出尺寸(width, height)，其中一项为-1时按比例计算，None表示原始尺寸
+            start_time: 起始时间(秒)
+        """
+        self.path = path
+        self.step = max(1, int(step or 1))
+        self.keyframes_only = keyframes_only
+        self.size = size
+        self.start_time = float(start_time or 0.0)
+
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.frame_count = 0
+        self.frame_index = -1
+        self.timestamp = 0.0
+
+    @property
+    def output_size(self):
+        """输出帧尺寸(width, height)"""
+        return self._resolve_size(self.size)
+
+    def _resolve_size(self, size):
+        if not size or not self.width or not self.height:
+            return self.width, self.height
+        out_w, out_h = int(size[0]), int(size[1])
+        if out_w <= 0 and out_h <= 0:
+            return self.width, self.height
+        if out_w <= 0:
+            out_w = int(round(self.width * out_h / self.height / 2)) * 2
+        elif out_h <= 0:
+            out_h = int(round(self.height * out_w / self.width / 2)) * 2
+        return out_w, out_h
+
+    def _load_info(self, info):
+        """从probe_video结果填充视频属性"""
+        if info:
+            self.width = info['width']
+            self.height = info['height']
+            self.fps = info['fps']
+            self.frame_count = info['frame_count']
+        # 异常帧率使用默认值
+        if not self.fps or self.fps <= 0 or self.fps > 120:
+            self.fps = 25.0
+
+    def open(self):
+        """打开数据源，返回是否成功"""
+        raise NotImplementedError
+
+    def is_opened(self):
+        raise NotImplementedError
+
+    def read(self, buffer=None):
+        """
+        读取下一帧
+
+        参数:
+            buffer: 可选的输出缓冲区(形状与output_size一致时直接写入，避免分配新数组)
+
+        返回:
+            (ret, frame)
+        """
+        raise NotImplementedError
+
+    def seek(self, seconds, exact=False):
+        """
+        定位到指定时间
+
+        参数:
+            seconds: 目标时间(秒)
+            exact: True时精确到帧，False时定位到该时间之前的关键帧(更快)
+
+        返回:
+            bool: 是否定位成功
+        """
+        raise NotImplementedError
+
+    def reconfigure(self, step=None, size=None):
+        """修改抽帧间隔或输出尺寸"""
+        if step is not None:
+            self.step = max(1, int(step))
+        if size is not None:
+            self.size = size
+
+    def release(self):
+        raise NotImplementedError
+
+    def frames(self):
+        """逐帧迭代，产生(frame_index, timestamp, frame)"""
+        while True:
+            ret, frame = self.read()
+            if not ret:
+                return
+            yield self.frame_index, self.timestamp, frame
+
+    def __iter__(self):
+        return self.frames()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+        return False
+
+
+class OpenCVFrameSource(FrameSource):
+    """
+    OpenCV帧数据源
+
+    支持文件和实时流。跳过的帧只调用grab()，不做retrieve和颜色转换；
+    缩放在读取后用INTER_AREA完成。不支持只解码关键帧。
+    """
+    backend = 'opencv'
+
+    def __init__(self, path, step=1, keyframes_only=False, size=None, start_time=0.0,
+                 buffer_size=None):
+        super().__init__(path, step, keyframes_only, size, start_time)
+        self.buffer_size = buffer_size
+        self.cap = None
+        self._position = 0
+        self._started = False
+        self._decode_buffer = None
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            return False
+        if self.buffer_size:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        self._load_info({
+            'width': int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': self.cap.get(cv2.CAP_PROP_FPS),
+            'frame_count': max(0, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        })
+        if self.keyframes_only:
+            logger.warning("OpenCV后端不支持只解码关键帧，将按step抽帧")
+        if self.start_time > 0:
+            self.seek(self.start_time)
+        return True
+
+    def is_opened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self, buffer=None):
+        if not self.is_opened():
+            return False, None
+        # 第一帧之后，每次先跳过step-1帧
+        if self._started:
+            for _ in range(self.step - 1):
+                if not self.cap.grab():
+                    return False, None
+                self._position += 1
+
+        # 不缩放时直接解码到调用方缓冲区；需要缩放时解码到内部复用的缓冲区再缩放到调用方缓冲区
+        out_w, out_h = self.output_size
+        resize = (out_w, out_h) != (self.width, self.height)
+        if resize:
+            ret, frame = self.cap.read(image=self._decode_buffer)
+            self._decode_buffer = frame if ret else None
+        elif buffer is not None:
+            ret, frame = self.cap.read(image=buffer)
+        else:
+            ret, frame = self.cap.read()
+        if not ret:
+            return False, None
+        self._started = True
+        self.frame_index = self._position
+        self.timestamp = self.frame_index / self.fps
+        self._position += 1
+
+        # 内部解码缓冲区会被下一次读取覆盖，因此resize分支总是输出到新数组或调用方缓冲区
+        if out_w > 0 and out_h > 0 and (resize or frame.shape[:2] != (out_h, out_w)):
+            dst = buffer if buffer is not None and buffer.shape[:2] == (out_h, out_w) else None
+            frame = cv2.resize(frame, (out_w, out_h), dst=dst, interpolation=cv2.INTER_AREA)
+        return True, frame
+
+    def seek(self, seconds, exact=False):
+        if not self.is_opened() or is_stream_url(self.path):
+            return False
+        # OpenCV的ffmpeg后端定位后会解码到目标帧，本身即为精确定位
+        ok = self.cap.set(cv2.CAP_PROP_POS_MSEC, max(0.0, seconds) * 1000.0)
+        self._position = int(round(max(0.0, seconds) * self.fps))
+        self._started = False
+        return ok
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class FFmpegFrameSource(FrameSource):
+    """
+    ffmpeg管道帧数据源
+
+    抽帧、关键帧过滤和缩放都在ffmpeg内部完成，只有需要的帧以BGR原始数据写入管道。
+    每帧的时间戳通过showinfo滤镜从stderr解析。
+    """
+    backend = 'ffmpeg'
+
+    _SHOWINFO_RE = re.compile(r'pts_time:\s*(-?[\d.]+)')
+
+    def __init__(self, path, step=1, keyframes_only=False, size=None, start_time=0.0,
+                 ffmpeg_bin='ffmpeg', accurate_seek=True):
+        super().__init__(path, step, keyframes_only, size, start_time)
+        self.ffmpeg_bin = ffmpeg_bin
+        self.accurate_seek = accurate_seek
+        self.process = None
+        self._timestamps = None
+        self._stderr_thread = None
+        self._frame_bytes = 0
+
+    def _build_command(self):
+        out_w, out_h = self.output_size
+        command = [self.ffmpeg_bin, '-hide_banner', '-nostdin', '-loglevel', 'info']
+        if self.keyframes_only:
+            # 解码器直接丢弃非关键帧
+            command.extend(['-skip_frame', 'nokey'])
+        if self.start_time > 0:
+            if not self.accurate_seek:
+                command.append('-noaccurate_seek')
+            command.extend(['-ss', f'{self.start_time:.3f}'])
+        command.extend(['-i', self.path, '-an', '-sn'])
+
+        filters = []
+        if self.step > 1 and not self.keyframes_only:
+            filters.append(f"select='not(mod(n\\,{self.step}))'")
+        if (out_w, out_h) != (self.width, self.height):
+            filters.append(f'scale={out_w}:{out_h}:flags=area')
+        filters.append('showinfo')
+        command.extend(['-vf', ','.join(filters), '-vsync', '0'])
+        command.extend(['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'])
+        return command
+
+    def _read_stderr(self, stream, timestamps):
+        """解析showinfo输出的帧时间戳"""
+        for raw_line in iter(stream.readline, b''):
+            line = raw_line.decode('utf-8', errors='ignore')
+            if 'Parsed_showinfo' not in line:
+                continue
+            match = self._SHOWINFO_RE.search(line)
+            if match:
+                timestamps.put(float(match.group(1)))
+        stream.close()
+
+    def open(self):
+        info = probe_video(self.path)
+        if info is None or not info['width']:
+            logger.error(f"无法读取视频信息: {self.path}")
+            return False
+        self._load_info(info)
+        return self._start()
+
+    def _start(self):
+        out_w, out_h = self.output_size
+        self._frame_bytes = out_w * out_h * 3
+        self._timestamps = queue.Queue()
+        command = self._build_command()
+        logger.debug(f"启动ffmpeg解码: {' '.join(command)}")
+        try:
+            self.process = subprocess.Popen(
+                command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=self._frame_bytes
+            )
+        except Exception as e:
+            logger.error(f"启动ffmpeg解码失败: {e}")
+            self.process = None
+            return False
+        self._stderr_thread = threading.Thread(
+            target=self._read_stderr, args=(self.process.stderr, self._timestamps), daemon=True)
+        self._stderr_thread.start()
+        self._last_index = -1
+        return True
+
+    def is_opened(self):
+        return self.process is not None
+
+    def read(self, buffer=None):
+        if self.process is None:
+            return False, None
+        out_w, out_h = self.output_size
+        if buffer is not None and buffer.shape == (out_h, out_w, 3) and buffer.flags['C_CONTIGUOUS']:
+            frame = buffer
+        else:
+            frame = np.empty((out_h, out_w, 3), dtype=np.uint8)
+        view = memoryview(frame).cast('B')
+        received = 0
+        while received < self._frame_bytes:
+            count = self.process.stdout.readinto(view[received:])
+            if not count:
+                return False, None
+            received += count
+
+        # showinfo的时间戳相对于起始位置
+        try:
+            relative = self._timestamps.get(timeout=1.0)
+            self.timestamp = self.start_time + max(0.0, relative)
+            self.frame_index = int(round(self.timestamp * self.fps))
+        except queue.Empty:
+            self.frame_index = self._last_index + (1 if self.keyframes_only else self.step)
+            self.timestamp = self.frame_index / self.fps
+        self._last_index = self.frame_index
+        return True, frame
+
+    def seek(self, seconds, exact=False):
+        self._stop()
+        self.start_time = max(0.0, seconds)
+        self.accurate_seek = exact
+        return self._start()
+
+    def reconfigure(self, step=None, size=None):
+        super().reconfigure(step, size)
+        # 滤镜参数在启动时确定，从当前位置重新启动ffmpeg
+        if self.process is not None:
+            self.seek(self.timestamp if self._last_index >= 0 else self.start_time, exact=True)
+
+    def _stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdout.close()
+        except Exception:
+            pass
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        self.process = None
+
+    def release(self):
+        self._stop()
+
+
+class PyAVFrameSource(FrameSource):
+    """
+    PyAV帧数据源
+
+    在进程内解码，关键帧模式下由解码器跳过非关键帧；
+    未选中的帧不做像素格式转换，缩放与转换在一次reformat中完成。
+    """
+    backend = 'pyav'
+
+    def __init__(self, path, step=1, keyframes_only=False, size=None, start_time=0.0):
+        super().__init__(path, step, keyframes_only, size, start_time)
+        self.container = None
+        self.stream = None
+        self._decoder = None
+        self._min_time = None
+
+    def open(self):
+        if not HAS_AV:
+            return False
+        try:
+            self.container = av.open(self.path)
+            self.stream = self.container.streams.video[0]
+        except Exception as e:
+            logger.error(f"PyAV打开视频失败: {e}")
+            self.release()
+            return False
+        self.stream.thread_type = 'AUTO'
+        if self.keyframes_only:
+            self.stream.codec_context.skip_frame = 'NONKEY'
+
+        info = {
+            'width': self.stream.codec_context.width,
+            'height': self.stream.codec_context.height,
+            'fps': float(self.stream.average_rate) if self.stream.average_rate else 0.0,
+            'frame_count': self.stream.frames or 0
+        }
+        self._load_info(info)
+        self._decoder = self.container.decode(self.stream)
+        if self.start_time > 0:
+            self.seek(self.start_time)
+        return True
+
+    def is_opened(self):
+        return self.container is not None
+
+    def read(self, buffer=None):
+        # PyAV每次转换都会生成新数组，忽略buffer
+        if self._decoder is None:
+            return False, None
+        try:
+            for frame in self._decoder:
+                if frame.pts is not None:
+                    timestamp = float(frame.pts * self.stream.time_base)
+                else:
+                    timestamp = (self.frame_index + 1) / self.fps
+                # 精确定位时丢弃目标时间之前的帧
+                if self._min_time is not None and timestamp < self._min_time - 0.5 / self.fps:
+                    continue
+                index = int(round(timestamp * self.fps))
+                if not self.keyframes_only and self.step > 1 and index % self.step != 0:
+                    continue
+
+                self.frame_index = index
+                self.timestamp = timestamp
+                out_w, out_h = self.output_size
+                image = frame.reformat(width=out_w, height=out_h, format='bgr24').to_ndarray()
+                return True, image
+        except Exception as e:
+            logger.error(f"PyAV解码出错: {e}")
+        return False, None
+
+    def seek(self, seconds, exact=False):
+        if self.container is None:
+            return False
+        seconds = max(0.0, seconds)
+        try:
+            offset = int(seconds / self.stream.time_base)
+            self.container.seek(offset, stream=self.stream, backward=True, any_frame=False)
+        except Exception as e:
+            logger.error(f"PyAV定位失败: {e}")
+            return False
+        self._decoder = self.container.decode(self.stream)
+        self._min_time = seconds if exact else None
+        return True
+
+    def release(self):
+        if self.container is not None:
+            try:
+                self.container.close()
+            except Exception:
+                pass
+        self.container = None
+        self.stream = None
+        self._decoder = None
+
+
+def open_frame_source(path, backend='auto', step=1, keyframes_only=False, size=None,
+                      start_time=0.0, **kwargs):
+    """
+    创建并打开帧数据源
+
+    参数:
+        path: 视频文件路径或流地址
+        backend: 'auto'、'opencv'、'ffmpeg'或'pyav'
+        step: 每step帧输出一帧
+        keyframes_only: 只输出关键帧
+        size: 输出尺寸(width, height)
+        start_time: 起始时间(秒)
+        **kwargs: 传给具体后端的额外参数
+
+    返回:
+        已打开的FrameSource，失败时返回None
+
+    auto模式下，实时流和逐帧全量读取使用OpenCV；抽帧、关键帧或缩放任务
+    优先使用PyAV，其次ffmpeg管道，都不可用时退回OpenCV。
+    """
+    if backend == 'auto':
+        sampling = step > 1 or keyframes_only or size is not None
+        if is_stream_url(path) or not sampling:
+            backend = 'opencv'
+        elif HAS_AV:
+            backend = 'pyav'
+        elif shutil.which(kwargs.get('ffmpeg_bin', 'ffmpeg')):
+            backend = 'ffmpeg'
+        else:
+            backend = 'opencv'
+
+    if backend != 'opencv' and not is_stream_url(path) and not os.path.exists(path):
+        logger.error(f"视频文件不存在: {path}")
+        return None
+
+    if backend == 'pyav':
+        source = PyAVFrameSource(path, step, keyframes_only, size, start_time)
+    elif backend == 'ffmpeg':
+        source = FFmpegFrameSource(path, step, keyframes_only, size, start_time,
+                                   ffmpeg_bin=kwargs.get('ffmpeg_bin', 'ffmpeg'))
+    else:
+        source = OpenCVFrameSource(path, step, keyframes_only, size, start_time,
+                                   buffer_size=kwargs.get('buffer_size'))
+
+    if source.open():
+        return source
+
+    source.release()
+    if backend != 'opencv':
+        logger.warning(f"{backend}后端打开失败，改用OpenCV: {path}")
+        return open_frame_source(path, 'opencv', step, keyframes_only, size, start_time, **kwargs)
+    return None
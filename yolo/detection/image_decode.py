@@ -0,0 +1,149 @@
+"""
+缩小解码模块
+
+上传的大图(如1200万像素的手机照片)只用于推理时不需要全分辨率解码。JPEG可以在解码阶段
+按1/2、1/4、1/8缩小(libjpeg的DCT缩放)，比全分辨率解码再缩放快得多:
+- 从文件头读取原图尺寸，按目标尺寸选择不小于目标的最大缩小倍数
+- 车牌OCR等需要高分辨率区域时，再按原分辨率解码一次(只在需要时进行)
+"""
+
+import struct
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("video_processor")
+
+# 缩小倍数 -> 解码标志
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# JPEG的帧开始标记(SOF0-SOF15，不含DHT/JPG/DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_size(data):
+    """
+    从文件头读取图像尺寸(不解码)
+
+    参数:
+        data: 图像文件的字节
+
+    返回:
+        tuple: (width, height)，不支持的格式返回None
+    """
+    data = memoryview(data)
+    if len(data) >= 24 and data[:8] == b'\x89PNG\r\n\x1a\n':
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+    if len(data) < 4 or data[:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1  # 填充字节
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2  # 无长度字段的标记
+            continue
+        (length,) = struct.unpack('>H', data[offset + 2:offset + 4])
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def reduction_factor(size, target_size):
+    """
+    选择缩小倍数: 缩小后长边仍不小于target_size的最大倍数
+
+    参数:
+        size: 原图尺寸(width, height)，未知时为None
+        target_size: 目标长边(像素)，None表示不缩小
+
+    返回:
+        int: 1、2、4或8
+    """
+    if not size or not target_size:
+        return 1
+    long_side = max(size)
+    for factor in (8, 4, 2):
+        if long_side / factor >= target_size:
+            return factor
+    return 1
+
+
+class DecodedImage:
+    """
+    按目标尺寸缩小解码的图像
+
+    image为缩小解码(以及fit()缩放)后的图像，scale为原图与image的尺寸比，full_resolution()按需解码原图。
+    """
+    def __init__(self, data, target_size=None):
+        """
+        参数:
+            data: 图像文件的字节(直接在该缓冲区上解码，不复制)
+            target_size: 推理需要的长边尺寸(像素)，None时按原分辨率解码
+        """
+        self._buffer = np.frombuffer(data, dtype=np.uint8)
+        self.original_size = image_size(data)
+        self.factor = reduction_factor(self.original_size, target_size)
+        self.image = cv2.imdecode(self._buffer, REDUCED_FLAGS[self.factor])
+        if self.image is None and self.factor > 1:
+            # 个别格式不支持缩小解码时退回原分辨率
+            self.factor = 1
+            self.image = cv2.imdecode(self._buffer, cv2.IMREAD_COLOR)
+        self._full = self.image if self.factor == 1 else None
+        if self.image is not None:
+            height, width = self.image.shape[:2]
+            if self.original_size is None or self.factor == 1:
+                self.original_size = (width, height)
+            elif (width > height) != (self.original_size[0] > self.original_size[1]):
+                # 解码时按EXIF方向旋转了图像，原图尺寸按旋转后的方向记录
+                self.original_size = self.original_size[::-1]
+            if self.factor > 1:
+                logger.debug(f"缩小解码: {self.original_size} -> {self.image.shape[1]}x{self.image.shape[0]}")
+
+    @property
+    def scale(self):
+        """原图与image的尺寸比"""
+        if self.image is None or not self.original_size:
+            return 1.0
+        return max(self.original_size) / max(self.image.shape[:2])
+
+    def fit(self, max_size):
+        """image的长边超过max_size时继续缩小(缩小解码的倍数只能是2的幂)"""
+        height, width = self.image.shape[:2]
+        if max(height, width) > max_size:
+            ratio = max_size / max(height, width)
+            self.image = cv2.resize(self.image, (int(width * ratio), int(height * ratio)),
+                                    interpolation=cv2.INTER_AREA)
+        return self.image
+
+    def full_resolution(self):
+        """原分辨率图像(首次调用时解码)"""
+        if self._full is None:
+            self._full = cv2.imdecode(self._buffer, cv2.IMREAD_COLOR)
+        return self._full
+
+    def to_full(self, box):
+        """把缩小图像上的框[x1, y1, x2, y2]换算到原图坐标"""
+        scale = self.scale
+        if scale == 1.0:
+            return [int(v) for v in box]
+        return [int(round(v * scale)) for v in box]
+
+    def full_crop_box(self, box):
+        """缩小图像上的框在原分辨率图像中的区域(裁剪到图像范围内)，会触发原分辨率解码"""
+        height, width = self.full_resolution().shape[:2]
+        x1, y1, x2, y2 = self.to_full(box)
+        return [max(0, x1), max(0, y1), min(width, x2), min(height, y2)]
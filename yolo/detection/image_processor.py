@@ -50,24 +50,19 @@ def process_image(img_path, output_path=None, detector=None, debug=False,
     # 记录处理开始时间
     start_time = time.time()
     
-    # 加载图像
+    # 加载图像，大图在解码阶段直接缩小(不小于max_size)，再缩放到max_size以加快处理速度
     from .utils import draw_text_pil
-    img = cv2.imread(img_path)
-    if img is None:
-        raise ValueError(f"无法读取图像: {img_path}")
-    
-    # 检查图像大小，如果太大则缩小以加快处理速度
+    from .image_decode import DecodedImage
     max_size = 1920  # 最大尺寸
-    h, w = img.shape[:2]
-    original_size = (w, h)
+    with open(img_path, 'rb') as f:
+        decoded = DecodedImage(f.read(), target_size=max_size)
+    if decoded.image is None:
+        raise ValueError(f"无法读取图像: {img_path}")
+    original_size = decoded.original_size
     
-    if max(h, w) > max_size:
-        scale = max_size / max(h, w)
-        new_w = int(w * scale)
-        new_h = int(h * scale)
-        img = cv2.resize(img, (new_w, new_h))
-        if debug:
-            print(f"图像已调整大小为 {new_w}x{new_h}")
+    img = decoded.fit(max_size)
+    if debug and img.shape[1::-1] != tuple(original_size):
+        print(f"图像已调整大小为 {img.shape[1]}x{img.shape[0]}")
     
     # 确保检测器可用
     if detector is None:
@@ -85,7 +80,8 @@ def process_image(img_path, output_path=None, detector=None, debug=False,
             detect_vehicles=detect_vehicles,
             detect_plates=detect_plates,
             detect_accidents=detect_accidents,
-            detect_violations=detect_violations
+            detect_violations=detect_violations,
+            hires=decoded  # 车牌按原分辨率识别
         )
         all_detections.extend(detections)
         
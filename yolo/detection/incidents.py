@@ -0,0 +1,224 @@
+"""
+事件聚合模块
+
+把逐帧的事故、违停、超速检测结果聚合为有开始和结束的事件，每个事件只报警一次:
+- 同一视频源同一类型按跟踪ID区分事件，跟踪ID变化(跟踪丢失后重新分配)时按框的IoU并入原事件
+- 在end_timeout秒内累计检测到min_frames次才开始事件，偶发的单帧误检不会报警
+- 超过end_timeout秒未再检测到时事件结束
+- 事件结束后holdoff秒内再次出现时恢复原事件，不再重复报警
+"""
+
+import time
+import itertools
+import threading
+import logging
+
+from .utils import calculate_iou
+
+logger = logging.getLogger("video_processor")
+
+# 需要聚合为事件的检测类型
+INCIDENT_TYPES = ('accident', 'illegal_parking', 'overspeed')
+
+
+class Incident:
+    """
+    单个事件
+
+    state: pending(尚未达到min_frames)、active(进行中)、ended(已结束，处于hold-off窗口)
+    """
+    def __init__(self, incident_id, source_id, incident_type, track_id, detection, timestamp):
+        self.id = incident_id
+        self.source_id = source_id
+        self.type = incident_type
+        self.track_ids = {track_id} if track_id is not None else set()
+        self.track_id = track_id
+        self.start_time = timestamp
+        self.last_seen = timestamp
+        self.end_time = None
+        self.frames = 0
+        self.max_confidence = 0.0
+        self.coordinates = None
+        self.state = 'pending'
+        self.observe(detection, timestamp)
+
+    def observe(self, detection, timestamp):
+        """记录一次检测"""
+        track_id = detection.get('track_id')
+        if track_id is not None:
+            self.track_ids.add(track_id)
+            self.track_id = track_id
+        self.last_seen = timestamp
+        self.frames += 1
+        self.max_confidence = max(self.max_confidence, float(detection.get('confidence', 0.0)))
+        if detection.get('coordinates'):
+            self.coordinates = list(detection['coordinates'])
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source_id': self.source_id,
+            'type': self.type,
+            'track_id': self.track_id,
+            'start_time': self.start_time,
+            'last_seen': self.last_seen,
+            'end_time': self.end_time,
+            'duration': round(self.last_seen - self.start_time, 3),
+            'frames': self.frames,
+            'max_confidence': round(self.max_confidence, 4),
+            'coordinates': self.coordinates,
+            'state': self.state
+        }
+
+
+class IncidentEngine:
+    """
+    事件聚合引擎
+
+    update()接收一帧的检测结果，返回本次产生的事件变化[(event, incident_dict)]:
+    - ('start', ...): 新事件开始，调用方在此时报警
+    - ('end', ...): 事件结束；hold-off窗口内恢复的事件再次结束时会以相同ID再报告一次
+
+    时间戳由调用方提供，实时流使用墙上时间，离线视频使用视频内时间，同一引擎内需保持一致。
+    """
+    def __init__(self, types=INCIDENT_TYPES, min_frames=2, end_timeout=5.0, holdoff=30.0,
+                 iou_threshold=0.3):
+        """
+        参数:
+            types: 需要聚合的检测类型
+            min_frames: 事件开始前需要的检测次数
+            end_timeout: 超过此时间(秒)未检测到时事件结束
+            holdoff: 事件结束后在此时间(秒)内再次出现时恢复原事件而不是新开事件
+            iou_threshold: 跟踪ID不同的检测并入已有事件所需的最小IoU
+        """
+        self.types = tuple(types)
+        self.min_frames = min_frames
+        self.end_timeout = end_timeout
+        self.holdoff = holdoff
+        self.iou_threshold = iou_threshold
+        self._incidents = {}  # source_id -> [Incident]
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def update(self, source_id, detections, timestamp=None, min_frames=None):
+        """
+        处理一帧的检测结果
+
+        参数:
+            source_id: 视频源ID
+            detections: 检测结果列表(需要type字段，可选track_id、confidence、coordinates)
+            timestamp: 帧时间(秒)，默认当前时间
+            min_frames: 覆盖事件开始前需要的检测次数(单张图片检测时为1)
+
+        返回:
+            list: [(event, incident_dict)]
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        min_frames = self.min_frames if min_frames is None else min_frames
+        events = []
+        with self._lock:
+            incidents = self._incidents.setdefault(source_id, [])
+            for detection in detections:
+                incident_type = detection.get('type')
+                if incident_type not in self.types:
+                    continue
+                incident = self._match(incidents, incident_type, detection)
+                if incident is None:
+                    incident = Incident(f"{source_id}-{next(self._ids)}", source_id,
+                                        incident_type, detection.get('track_id'), detection, timestamp)
+                    incidents.append(incident)
+                elif incident.last_seen != timestamp:
+                    # 同一帧内的多个检测框只计一次
+                    incident.observe(detection, timestamp)
+                if incident.state == 'ended':
+                    incident.state = 'active'
+                    incident.end_time = None
+                    logger.info(f"事件恢复: {incident.id} ({incident.type})")
+                elif incident.state == 'pending' and incident.frames >= min_frames:
+                    incident.state = 'active'
+                    logger.info(f"事件开始: {incident.id} ({incident.type})")
+                    events.append(('start', incident.to_dict()))
+            events.extend(self._expire(timestamp))
+        return events
+
+    def expire(self, now=None):
+        """结束超时的事件并清理hold-off窗口已过的事件，返回[('end', incident_dict)]"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._expire(now)
+
+    def flush(self, source_id=None):
+        """
+        结束视频源的所有事件(视频处理结束或摄像头移除时调用)
+
+        参数:
+            source_id: 视频源ID，None表示所有视频源
+
+        返回:
+            list: [('end', incident_dict)]
+        """
+        events = []
+        with self._lock:
+            sources = list(self._incidents) if source_id is None else [source_id]
+            for source in sources:
+                for incident in self._incidents.pop(source, []):
+                    if incident.state == 'active':
+                        events.append(('end', self._end(incident)))
+        return events
+
+    def active(self, source_id=None):
+        """进行中的事件"""
+        with self._lock:
+            return [incident.to_dict()
+                    for source, incidents in self._incidents.items()
+                    if source_id is None or source == source_id
+                    for incident in incidents if incident.state == 'active']
+
+    def _match(self, incidents, incident_type, detection):
+        """查找检测结果所属的事件(调用时需持有锁)"""
+        track_id = detection.get('track_id')
+        candidates = [i for i in incidents if i.type == incident_type]
+        if track_id is not None:
+            for incident in candidates:
+                if track_id in incident.track_ids:
+                    return incident
+        box = detection.get('coordinates')
+        best, best_iou = None, self.iou_threshold
+        for incident in candidates:
+            if not box or not incident.coordinates:
+                # 没有框时同一视频源同一类型只有一个事件
+                if not incident.track_ids or track_id is None:
+                    return incident
+                continue
+            iou = calculate_iou(box, incident.coordinates)
+            if iou >= best_iou:
+                best, best_iou = incident, iou
+        return best
+
+    def _end(self, incident):
+        """结束事件(调用时需持有锁)"""
+        incident.state = 'ended'
+        incident.end_time = incident.last_seen
+        logger.info(f"事件结束: {incident.id} ({incident.type})，持续{incident.last_seen - incident.start_time:.1f}秒")
+        return incident.to_dict()
+
+    def _expire(self, now):
+        """调用时需持有锁"""
+        events = []
+        for source_id in list(self._incidents):
+            kept = []
+            for incident in self._incidents[source_id]:
+                idle = now - incident.last_seen
+                if incident.state == 'pending':
+                    if idle <= self.end_timeout:
+                        kept.append(incident)
+                    continue
+                if incident.state == 'active' and idle > self.end_timeout:
+                    events.append(('end', self._end(incident)))
+                if incident.state == 'active' or idle <= self.end_timeout + self.holdoff:
+                    kept.append(incident)
+            if kept:
+                self._incidents[source_id] = kept
+            else:
+                del self._incidents[source_id]
+        return events
@@ -0,0 +1,250 @@
+"""
+视频流水线模块
+
+此模块提供由有界队列连接的流水线阶段，使解码、推理和编码在不同线程中重叠执行。
+OpenCV解码与ffmpeg管道写入在C层释放GIL，因此放在独立线程中可以与推理并行。
+"""
+
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger("video_processor")
+
+# 流结束标记
+END_OF_STREAM = object()
+
+
+class StageStats:
+    """
+    流水线阶段统计
+
+    记录处理数量、处理耗时、等待耗时以及输出队列占用率，用于判断瓶颈所在。
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+        self.start_time = None
+        self.end_time = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """标记阶段开始运行"""
+        self.start_time = time.time()
+
+    def stop(self):
+        """标记阶段结束"""
+        self.end_time = time.time()
+
+    def record(self, busy, wait=0.0, count=1):
+        """
+        记录一次处理
+
+        参数:
+            busy: 处理耗时(秒)
+            wait: 等待上下游队列的耗时(秒)
+            count: 本次处理的条目数
+        """
+        with self._lock:
+            self.items += count
+            self.busy_time += busy
+            self.wait_time += wait
+
+    def snapshot(self):
+        """获取统计快照"""
+        with self._lock:
+            end = self.end_time or time.time()
+            elapsed = end - self.start_time if self.start_time else 0.0
+            return {
+                'stage': self.name,
+                'items': self.items,
+                'throughput': self.items / elapsed if elapsed > 0 else 0.0,
+                'avg_ms': self.busy_time / self.items * 1000 if self.items else 0.0,
+                'busy_ratio': self.busy_time / elapsed if elapsed > 0 else 0.0,
+                'wait_time': self.wait_time,
+                'elapsed': elapsed
+            }
+
+
+class PipelineQueue:
+    """
+    有界队列
+
+    在queue.Queue基础上记录占用率（平均值和峰值），put/get支持停止事件，
+    避免某一阶段退出后另一阶段永久阻塞。
+    """
+    def __init__(self, name, maxsize=8):
+        self.name = name
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._samples = 0
+        self._occupancy_sum = 0
+        self.max_occupancy = 0
+
+    def _sample(self):
+        size = self._queue.qsize()
+        self._samples += 1
+        self._occupancy_sum += size
+        if size > self.max_occupancy:
+            self.max_occupancy = size
+
+    def put(self, item, stop_event=None, timeout=0.1):
+        """
+        放入条目，队列满时阻塞
+
+        返回:
+            bool: 是否成功放入（停止事件触发时返回False）
+        """
+        while True:
+            try:
+                self._queue.put(item, timeout=timeout)
+                self._sample()
+                return True
+            except queue.Full:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+
+    def get(self, stop_event=None, timeout=0.1):
+        """
+        取出条目，队列空时阻塞
+
+        返回:
+            条目，停止事件触发时返回END_OF_STREAM
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=timeout)
+                self._sample()
+                return item
+            except queue.Empty:
+                if stop_event is not None and stop_event.is_set():
+                    return END_OF_STREAM
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def snapshot(self):
+        """获取占用率统计"""
+        return {
+            'queue': self.name,
+            'maxsize': self.maxsize,
+            'size': self._queue.qsize(),
+            'avg_occupancy': self._occupancy_sum / self._samples / self.maxsize if self._samples and self.maxsize else 0.0,
+            'max_occupancy': self.max_occupancy
+        }
+
+
+class ProducerStage(threading.Thread):
+    """
+    生产者阶段
+
+    在独立线程中迭代数据源（例如逐帧解码），把结果放入输出队列，结束时放入END_OF_STREAM。
+    """
+    def __init__(self, name, source, output_queue, stop_event):
+        """
+        参数:
+            name: 阶段名称
+            source: 可迭代对象或返回可迭代对象的函数
+            output_queue: 输出PipelineQueue
+            stop_event: 全局停止事件
+        """
+        super().__init__(name=f"Pipeline-{name}", daemon=True)
+        self.source = source
+        self.output_queue = output_queue
+        self.stop_event = stop_event
+        self.stats = StageStats(name)
+        self.error = None
+
+    def run(self):
+        self.stats.start()
+        try:
+            iterable = self.source() if callable(self.source) else self.source
+            iterator = iter(iterable)
+            while not self.stop_event.is_set():
+                t0 = time.time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                t1 = time.time()
+                if not self.output_queue.put(item, self.stop_event):
+                    break
+                self.stats.record(t1 - t0, time.time() - t1)
+        except Exception as e:
+            self.error = e
+            logger.error(f"流水线阶段 {self.stats.name} 出错: {e}")
+            self.stop_event.set()
+        finally:
+            self.stats.stop()
+            # 通知下游结束；停止事件触发且队列已满时下游会通过停止事件退出
+            self.output_queue.put(END_OF_STREAM, self.stop_event)
+
+
+class ConsumerStage(threading.Thread):
+    """
+    消费者阶段
+
+    在独立线程中从输入队列取出条目并交给处理函数（例如写入编码器），直到收到END_OF_STREAM。
+    """
+    def __init__(self, name, func, input_queue, stop_event):
+        """
+        参数:
+            name: 阶段名称
+            func: 处理函数，接收一个条目
+            input_queue: 输入PipelineQueue
+            stop_event: 全局停止事件
+        """
+        super().__init__(name=f"Pipeline-{name}", daemon=True)
+        self.func = func
+        self.input_queue = input_queue
+        self.stop_event = stop_event
+        self.stats = StageStats(name)
+        self.error = None
+
+    def run(self):
+        self.stats.start()
+        try:
+            while True:
+                t0 = time.time()
+                item = self.input_queue.get(self.stop_event)
+                if item is END_OF_STREAM:
+                    break
+                t1 = time.time()
+                self.func(item)
+                self.stats.record(time.time() - t1, t1 - t0)
+        except Exception as e:
+            self.error = e
+            logger.error(f"流水线阶段 {self.stats.name} 出错: {e}")
+            self.stop_event.set()
+        finally:
+            self.stats.stop()
+
+
+def iterate_queue(input_queue, stop_event=None):
+    """逐个取出队列中的条目，直到END_OF_STREAM"""
+    while True:
+        item = input_queue.get(stop_event)
+        if item is END_OF_STREAM:
+            return
+        yield item
+
+
+def log_pipeline_stats(stages, queues):
+    """
+    输出各阶段和队列的统计信息
+
+    参数:
+        stages: StageStats列表
+        queues: PipelineQueue列表
+    """
+    for stats in stages:
+        s = stats.snapshot()
+        logger.info(f"阶段[{s['stage']}]: {s['items']} 项, {s['throughput']:.2f} 项/秒, "
+                    f"平均 {s['avg_ms']:.1f}ms, 繁忙率 {s['busy_ratio']*100:.0f}%")
+    for q in queues:
+        s = q.snapshot()
+        logger.info(f"队列[{s['queue']}]: 平均占用 {s['avg_occupancy']*100:.0f}%, "
+                    f"峰值 {s['max_occupancy']}/{s['maxsize']}")
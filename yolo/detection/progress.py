@@ -0,0 +1,241 @@
+"""
+任务进度模块
+
+此模块提供视频任务进行中的进度和部分结果推送:
+- ProgressReporter: 在流水线中按时间间隔汇总进度(已处理帧数、速率、预计剩余时间)和新产生的结果
+- ProgressHub: 按任务ID分发事件，供Socket.IO广播和NDJSON/SSE接口订阅，
+  晚到的订阅者会先收到最近的历史事件
+"""
+
+import json
+import time
+import queue
+import threading
+import logging
+from collections import deque, OrderedDict
+
+from .checkpoint import json_default
+
+logger = logging.getLogger("video_processor")
+
+
+def dumps_event(event):
+    """把事件序列化为单行JSON"""
+    return json.dumps(event, ensure_ascii=False, default=json_default)
+
+
+class ProgressReporter:
+    """
+    进度汇总器
+
+    update在每帧处理后调用，距离上次上报超过interval秒时通过callback发出
+    progress事件，并把期间新增的结果作为results事件发出。
+    """
+    def __init__(self, callback, total_frames=0, interval=1.0, start_frame=0):
+        """
+        参数:
+            callback: 事件回调callback(event)
+            total_frames: 总帧数(未知时为0)
+            interval: 上报间隔(秒)
+            start_frame: 起始帧(从检查点恢复时不为0)
+        """
+        self.callback = callback
+        self.total_frames = total_frames
+        self.interval = interval
+        self.start_frame = start_frame
+        self.started = time.time()
+        self._last_time = self.started
+        self._last_frame = start_frame
+        self._fps = 0.0
+        self._emitted_results = 0
+
+    def _emit(self, event):
+        try:
+            self.callback(event)
+        except Exception as e:
+            logger.error(f"进度回调出错: {e}")
+
+    def update(self, frames_done, processed_frames, results=None, force=False):
+        """
+        更新进度
+
+        参数:
+            frames_done: 已输出的帧数
+            processed_frames: 已推理的帧数
+            results: 当前全部结果列表，新增部分会随progress事件发出
+            force: 是否忽略上报间隔立即发出
+        """
+        now = time.time()
+        elapsed = now - self._last_time
+        if not force and elapsed < self.interval:
+            return
+        if elapsed > 0:
+            instant_fps = (frames_done - self._last_frame) / elapsed
+            # 指数平滑，避免速率和剩余时间跳动
+            self._fps = instant_fps if self._fps == 0 else 0.7 * self._fps + 0.3 * instant_fps
+        self._last_time = now
+        self._last_frame = frames_done
+
+        eta = None
+        percent = None
+        if self.total_frames > 0:
+            percent = round(min(100.0, frames_done * 100.0 / self.total_frames), 1)
+            if self._fps > 0:
+                eta = round(max(0, self.total_frames - frames_done) / self._fps, 1)
+        self._emit({
+            'type': 'progress',
+            'frames_done': frames_done,
+            'total_frames': self.total_frames,
+            'processed_frames': processed_frames,
+            'percent': percent,
+            'fps': round(self._fps, 2),
+            'eta_seconds': eta,
+            'elapsed': round(now - self.started, 1)
+        })
+
+        if results is not None and len(results) > self._emitted_results:
+            self._emit({
+                'type': 'results',
+                'results': results[self._emitted_results:]
+            })
+            self._emitted_results = len(results)
+
+    def start(self, **info):
+        """发出开始事件(视频信息)"""
+        self._emit(dict(type='started', **info))
+
+    def finish(self, **summary):
+        """发出结束事件"""
+        self._emit(dict(type='done', elapsed=round(time.time() - self.started, 1), **summary))
+
+
+class ProgressChannel:
+    """单个任务的事件通道"""
+    def __init__(self, job_id, history_size=200):
+        self.job_id = job_id
+        self.closed = False
+        self.closed_at = None
+        self.last_activity = time.time()
+        self._history = deque(maxlen=history_size)
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        with self._lock:
+            self._history.append(event)
+            self.last_activity = time.time()
+            subscribers = list(self._subscribers)
+            if event.get('type') == 'done':
+                self.closed = True
+                self.closed_at = time.time()
+        for q in subscribers:
+            q.put(event)
+
+    def subscribe(self, keepalive=15.0):
+        """
+        订阅事件
+
+        先产生历史事件，再产生新事件，收到done事件后结束；
+        keepalive秒内没有事件时产生None，调用方可据此发送心跳。
+        """
+        q = queue.Queue()
+        with self._lock:
+            history = list(self._history)
+            closed = self.closed
+            if not closed:
+                self._subscribers.append(q)
+        try:
+            for event in history:
+                yield event
+            if closed:
+                return
+            while True:
+                try:
+                    event = q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield None
+                    continue
+                yield event
+                if event.get('type') == 'done':
+                    return
+        finally:
+            with self._lock:
+                if q in self._subscribers:
+                    self._subscribers.remove(q)
+
+
+class ProgressHub:
+    """
+    进度事件中心
+
+    listener(event)会收到所有任务的事件(例如转发为Socket.IO消息)，
+    已结束的任务保留最近max_finished个，供晚到的订阅者读取结果；
+    超过max_idle秒没有事件的未结束通道(例如订阅了不存在的任务)会以expired结束并移除。
+    """
+    def __init__(self, max_finished=50, history_size=200, max_idle=3600.0):
+        self.max_finished = max_finished
+        self.history_size = history_size
+        self.max_idle = max_idle
+        self._channels = OrderedDict()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """添加全局事件监听器"""
+        self._listeners.append(listener)
+
+    def create(self, job_id, reset=False):
+        """创建任务通道(已存在时返回原通道，reset为True时替换已结束的通道)"""
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None or (reset and channel.closed):
+                channel = ProgressChannel(job_id, self.history_size)
+                self._channels[job_id] = channel
+            self._prune()
+            return channel
+
+    def get(self, job_id):
+        with self._lock:
+            return self._channels.get(job_id)
+
+    def publish(self, job_id, event):
+        """发布任务事件，事件中会加入job_id和时间"""
+        event = dict(event, job_id=job_id, time=time.time())
+        channel = self.create(job_id)
+        channel.publish(event)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"进度监听器出错: {e}")
+
+    def close(self, job_id, **summary):
+        """
+        通道尚未结束时发布done事件(任务在流水线发出done之前失败时使用)
+
+        返回:
+            bool: 是否发布了done事件
+        """
+        channel = self.get(job_id)
+        if channel is not None and channel.closed:
+            return False
+        self.publish(job_id, dict(type='done', **summary))
+        return True
+
+    def callback(self, job_id):
+        """创建向本中心发布事件的回调，用作流水线的progress_callback"""
+        self.create(job_id)
+        return lambda event: self.publish(job_id, event)
+
+    def _prune(self):
+        """结束空闲过久的通道，移除最早结束的通道(调用时需持有锁)"""
+        deadline = time.time() - self.max_idle
+        for job_id, channel in list(self._channels.items()):
+            if not channel.closed and channel.last_activity < deadline:
+                logger.info(f"进度通道 {job_id} 超过 {self.max_idle:.0f} 秒没有事件，已结束")
+                channel.publish({'type': 'done', 'job_id': job_id, 'time': time.time(),
+                                 'completed': False, 'expired': True})
+                self._channels.pop(job_id, None)
+        finished = [job_id for job_id, c in self._channels.items() if c.closed]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            self._channels.pop(job_id, None)
@@ -0,0 +1,241 @@
+"""
+视频抽样模块
+
+此模块提供按时间定位抽帧和场景变化检测，用于缩略图、关键帧提取和摘要类任务:
+- interval: 顺序读取，由帧数据源在解码器中抽帧
+- seek: 直接定位到每个采样时间点(关键帧精度或精确到帧)，中间的帧完全不解码
+- scene: 以低分辨率只解码关键帧做场景变化分析，仅在内容变化处读取全分辨率帧
+"""
+
+import logging
+
+import cv2
+
+from .frame_source import open_frame_source, probe_video, HAS_AV
+
+logger = logging.getLogger("video_processor")
+
+SAMPLE_MODES = ('interval', 'seek', 'scene')
+
+
+class SceneChangeDetector:
+    """
+    场景变化检测器
+
+    比较当前帧与上一个被选中帧的HSV颜色直方图(巴氏距离)，
+    距离超过阈值且与上一个选中帧间隔足够时判定为场景变化。
+    """
+    def __init__(self, threshold=0.35, min_interval=1.0, analysis_width=160):
+        """
+        参数:
+            threshold: 巴氏距离阈值(0-1)，越小越敏感
+            min_interval: 两个场景帧之间的最小间隔(秒)
+            analysis_width: 分析时缩放到的宽度
+        """
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.analysis_width = analysis_width
+        self.reset()
+
+    def reset(self):
+        """清除状态"""
+        self._last_hist = None
+        self._last_time = None
+        self.last_score = 0.0
+
+    def _histogram(self, frame):
+        height, width = frame.shape[:2]
+        if width > self.analysis_width:
+            scale = self.analysis_width / width
+            frame = cv2.resize(frame, (self.analysis_width, max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+        cv2.normalize(hist, hist)
+        return hist
+
+    def update(self, frame, timestamp):
+        """
+        输入一帧并判断是否为场景变化
+
+        参数:
+            frame: BGR图像
+            timestamp: 帧时间(秒)
+
+        返回:
+            bool: 是否为新场景(第一帧总是返回True)
+        """
+        hist = self._histogram(frame)
+        if self._last_hist is None:
+            self.last_score = 1.0
+        else:
+            self.last_score = cv2.compareHist(self._last_hist, hist, cv2.HISTCMP_BHATTACHARYYA)
+            if self.last_score < self.threshold:
+                return False
+            if self._last_time is not None and timestamp - self._last_time < self.min_interval:
+                return False
+        self._last_hist = hist
+        self._last_time = timestamp
+        return True
+
+
+def sample_times(duration, interval_seconds, start_time=0.0, end_time=None):
+    """
+    生成采样时间点
+
+    参数:
+        duration: 视频时长(秒)
+        interval_seconds: 采样间隔(秒)
+        start_time: 开始时间
+        end_time: 结束时间(None表示视频结尾)
+
+    返回:
+        list: 采样时间点(秒)
+    """
+    end = duration if end_time is None else min(end_time, duration)
+    interval = max(interval_seconds, 1e-3)
+    times = []
+    t = max(0.0, start_time)
+    while t < end:
+        times.append(t)
+        t += interval
+    return times
+
+
+def iter_video_samples(video_path, mode='interval', interval_frames=None, interval_seconds=None,
+                       exact=False, start_time=0.0, end_time=None, max_samples=None, size=None,
+                       scene_threshold=0.35, scene_min_interval=1.0, backend='auto'):
+    """
+    按指定模式从视频中抽取帧
+
+    参数:
+        video_path: 视频文件路径
+        mode: 'interval'、'seek'或'scene'
+        interval_frames: 采样间隔(帧)
+        interval_seconds: 采样间隔(秒)，优先于interval_frames
+        exact: seek/scene模式下是否精确到帧(否则取目标时间之前的关键帧，速度最快)
+        start_time: 开始时间(秒)
+        end_time: 结束时间(秒)
+        max_samples: 最多返回的帧数
+        size: 输出尺寸(width, height)
+        scene_threshold: 场景变化阈值
+        scene_min_interval: 场景帧最小间隔(秒)
+        backend: 帧数据源后端
+
+    返回:
+        生成器，产生(frame_index, timestamp, frame)
+    """
+    if mode not in SAMPLE_MODES:
+        raise ValueError(f"不支持的抽样模式: {mode}")
+
+    info = probe_video(video_path)
+    if info is None:
+        logger.error(f"无法打开视频: {video_path}")
+        return
+    fps = info['fps'] if 0 < info['fps'] <= 120 else 25.0
+    duration = info['frame_count'] / fps if info['frame_count'] else None
+
+    if interval_seconds is not None:
+        interval_frames = max(1, int(round(fps * interval_seconds)))
+    interval_frames = max(1, int(interval_frames or 1))
+    interval_seconds = interval_frames / fps
+
+    if mode == 'seek' and duration is None:
+        logger.warning("无法获取视频时长，改为顺序抽帧")
+        mode = 'interval'
+
+    if mode == 'interval':
+        samples = _iter_interval(video_path, backend, interval_frames, size, start_time, end_time)
+    elif mode == 'seek':
+        times = sample_times(duration, interval_seconds, start_time, end_time)
+        samples = _iter_seek(video_path, backend, times, exact, size)
+    else:
+        detector = SceneChangeDetector(scene_threshold, scene_min_interval)
+        samples = _iter_scene(video_path, backend, detector, interval_frames, exact, size,
+                              start_time, end_time)
+
+    count = 0
+    for sample in samples:
+        yield sample
+        count += 1
+        if max_samples is not None and count >= max_samples:
+            return
+
+
+def _iter_interval(video_path, backend, interval_frames, size, start_time, end_time):
+    """顺序读取，抽帧由数据源完成"""
+    source = open_frame_source(video_path, backend, step=interval_frames, size=size,
+                               start_time=start_time)
+    if source is None:
+        return
+    try:
+        for frame_index, timestamp, frame in source.frames():
+            if end_time is not None and timestamp > end_time:
+                return
+            yield frame_index, timestamp, frame
+    finally:
+        source.release()
+
+
+def _open_seek_source(video_path, backend, size):
+    """打开用于随机定位的数据源，PyAV定位到关键帧时无需再向后解码"""
+    if backend == 'auto':
+        backend = 'pyav' if HAS_AV else 'opencv'
+    return open_frame_source(video_path, backend, size=size)
+
+
+def _iter_seek(video_path, backend, times, exact, size):
+    """逐个定位到采样时间点读取一帧"""
+    source = _open_seek_source(video_path, backend, size)
+    if source is None:
+        return
+    last_index = None
+    failures = 0
+    try:
+        for t in times:
+            if not source.seek(t, exact=exact):
+                failures += 1
+                if failures >= 3:
+                    logger.error("定位连续失败，停止抽帧")
+                    return
+                continue
+            ret, frame = source.read()
+            if not ret:
+                failures += 1
+                if failures >= 3:
+                    return
+                continue
+            failures = 0
+            # 关键帧精度下，多个采样点可能落在同一个关键帧上
+            if source.frame_index == last_index:
+                continue
+            last_index = source.frame_index
+            yield source.frame_index, source.timestamp, frame
+    finally:
+        source.release()
+
+
+def _iter_scene(video_path, backend, detector, interval_frames, exact, size, start_time, end_time):
+    """低分辨率分析关键帧，场景变化时读取对应的全分辨率帧"""
+    analysis = open_frame_source(video_path, backend, step=interval_frames, keyframes_only=True,
+                                 size=(detector.analysis_width, -1), start_time=start_time)
+    if analysis is None:
+        return
+    source = _open_seek_source(video_path, backend, size)
+    if source is None:
+        analysis.release()
+        return
+    try:
+        for _, timestamp, small in analysis.frames():
+            if end_time is not None and timestamp > end_time:
+                return
+            if not detector.update(small, timestamp):
+                continue
+            if not source.seek(timestamp, exact=exact):
+                continue
+            ret, frame = source.read()
+            if ret:
+                yield source.frame_index, source.timestamp, frame
+    finally:
+        analysis.release()
+        source.release()
@@ -0,0 +1,278 @@
+"""
+车速估计模块
+
+此模块按视频源维护测速状态，不同视频源(摄像头、视频任务)之间互不干扰:
+- 车辆位置按跟踪ID保存在NumPy环形缓冲区中，每帧对所有轨迹一次性计算
+- 速度取滑动时间窗口内地面位置对时间的最小二乘斜率，比两帧差分更稳定
+- 提供摄像头的地面单应矩阵时，框底边中点映射为地面坐标(米)；否则按针孔模型由框宽估计距离
+"""
+
+import json
+import threading
+import logging
+
+import numpy as np
+
+from .tracking import BoxTracker
+
+logger = logging.getLogger("video_processor")
+
+
+def homography_from_points(image_points, world_points):
+    """
+    由至少4对对应点计算图像到地面的单应矩阵(DLT)
+
+    参数:
+        image_points: 图像坐标[(u, v), ...]
+        world_points: 对应的地面坐标[(x, y), ...]，单位为米
+
+    返回:
+        numpy.ndarray: 3x3单应矩阵
+    """
+    src = np.asarray(image_points, dtype=np.float64)
+    dst = np.asarray(world_points, dtype=np.float64)
+    if src.shape != dst.shape or src.ndim != 2 or src.shape[1] != 2 or len(src) < 4:
+        raise ValueError("至少需要4对图像坐标和地面坐标")
+    u, v = src[:, 0], src[:, 1]
+    x, y = dst[:, 0], dst[:, 1]
+    zeros, ones = np.zeros_like(u), np.ones_like(u)
+    rows_x = np.stack([u, v, ones, zeros, zeros, zeros, -x * u, -x * v, -x], axis=1)
+    rows_y = np.stack([zeros, zeros, zeros, u, v, ones, -y * u, -y * v, -y], axis=1)
+    _, _, vt = np.linalg.svd(np.concatenate([rows_x, rows_y]))
+    matrix = vt[-1].reshape(3, 3)
+    return matrix / matrix[2, 2]
+
+
+def parse_calibration(calibration):
+    """
+    解析摄像头标定
+
+    参数:
+        calibration: {'homography': 3x3矩阵} 或 {'image_points': [...], 'world_points': [...]}
+
+    返回:
+        numpy.ndarray: 3x3单应矩阵，未提供标定时返回None
+    """
+    if not calibration:
+        return None
+    if 'homography' in calibration:
+        matrix = np.asarray(calibration['homography'], dtype=np.float64)
+        if matrix.shape != (3, 3):
+            raise ValueError("单应矩阵必须是3x3")
+        return matrix
+    return homography_from_points(calibration['image_points'], calibration['world_points'])
+
+
+class SpeedEstimator:
+    """
+    单个视频源的车速估计器
+
+    update()传入当前帧所有车辆的跟踪ID和框，返回与之对齐的速度数组(km/h，未知为NaN)。
+    """
+    def __init__(self, homography=None, vehicle_width=1.8, focal_length=800,
+                 window_seconds=1.0, min_span_seconds=0.2, min_samples=3,
+                 speed_range=(1, 150), max_age_seconds=10.0, history=32, capacity=64):
+        """
+        参数:
+            homography: 图像到地面(米)的3x3单应矩阵，None时使用针孔模型
+            vehicle_width: 针孔模型假设的车宽(米)
+            focal_length: 针孔模型的焦距(像素)
+            window_seconds: 计算速度的滑动窗口长度(秒)
+            min_span_seconds: 窗口内样本的最短时间跨度(秒)
+            min_samples: 窗口内的最少样本数
+            speed_range: 合理速度范围(km/h)，超出时沿用上一次的速度
+            max_age_seconds: 轨迹多久未出现后释放
+            history: 每条轨迹保留的样本数
+            capacity: 初始轨迹容量(不足时自动扩容)
+        """
+        self.homography = None if homography is None else np.asarray(homography, dtype=np.float64)
+        self.vehicle_width = vehicle_width
+        self.focal_length = focal_length
+        self.window_seconds = window_seconds
+        self.min_span_seconds = min_span_seconds
+        self.min_samples = min_samples
+        self.speed_range = speed_range
+        self.max_age_seconds = max_age_seconds
+        self.history = history
+        self.reset(capacity)
+
+    def reset(self, capacity=64):
+        """清除所有轨迹"""
+        self._positions = np.zeros((capacity, self.history, 2), dtype=np.float64)
+        self._times = np.full((capacity, self.history), -np.inf)
+        self._heads = np.zeros(capacity, dtype=np.int64)
+        self._last_seen = np.full(capacity, -np.inf)
+        self._speeds = np.full(capacity, np.nan)
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+
+    @property
+    def track_count(self):
+        return len(self._slots)
+
+    def _grow(self):
+        """轨迹容量翻倍"""
+        capacity = len(self._heads)
+        self._positions = np.concatenate([self._positions, np.zeros_like(self._positions)])
+        self._times = np.concatenate([self._times, np.full_like(self._times, -np.inf)])
+        self._heads = np.concatenate([self._heads, np.zeros_like(self._heads)])
+        self._last_seen = np.concatenate([self._last_seen, np.full_like(self._last_seen, -np.inf)])
+        self._speeds = np.concatenate([self._speeds, np.full_like(self._speeds, np.nan)])
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _slot(self, track_id):
+        slot = self._slots.get(track_id)
+        if slot is None:
+            if not self._free:
+                self._grow()
+            slot = self._free.pop()
+            self._slots[track_id] = slot
+            self._times[slot] = -np.inf
+            self._heads[slot] = 0
+            self._speeds[slot] = np.nan
+        return slot
+
+    def ground_points(self, boxes, frame_width=None):
+        """
+        框对应的地面位置(米)
+
+        参数:
+            boxes: (N, 4)的框坐标x1, y1, x2, y2
+            frame_width: 画面宽度，针孔模型用于确定光轴位置
+
+        返回:
+            numpy.ndarray: (N, 2)的地面坐标
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if self.homography is not None:
+            # 框底边中点视为车辆与地面的接触点
+            points = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, boxes[:, 3], np.ones(len(boxes))], axis=1)
+            mapped = points @ self.homography.T
+            return mapped[:, :2] / mapped[:, 2:3]
+        widths = np.maximum(boxes[:, 2] - boxes[:, 0], 1.0)
+        depth = self.vehicle_width * self.focal_length / widths
+        center = frame_width / 2 if frame_width else 0.0
+        lateral = ((boxes[:, 0] + boxes[:, 2]) / 2 - center) * depth / self.focal_length
+        return np.stack([lateral, depth], axis=1)
+
+    def update(self, track_ids, boxes, timestamp, frame_width=None):
+        """
+        加入一帧的观测并计算速度
+
+        参数:
+            track_ids: 跟踪ID列表
+            boxes: 与track_ids对齐的框坐标(N, 4)
+            timestamp: 帧时间(秒)
+            frame_width: 画面宽度(针孔模型使用)
+
+        返回:
+            numpy.ndarray: 与track_ids对齐的速度(km/h)，无法估计时为NaN
+        """
+        if len(track_ids) == 0:
+            self._expire(timestamp)
+            return np.empty(0)
+
+        slots = np.fromiter((self._slot(t) for t in track_ids), dtype=np.int64, count=len(track_ids))
+        heads = self._heads[slots]
+        self._positions[slots, heads] = self.ground_points(boxes, frame_width)
+        self._times[slots, heads] = timestamp
+        self._heads[slots] = (heads + 1) % self.history
+        self._last_seen[slots] = timestamp
+
+        # 窗口内样本对时间做最小二乘，斜率即速度向量
+        times = self._times[slots]
+        mask = times >= timestamp - self.window_seconds
+        counts = mask.sum(axis=1)
+        safe_times = np.where(mask, times, 0.0)
+        mean_t = safe_times.sum(axis=1) / np.maximum(counts, 1)
+        dt = np.where(mask, times - mean_t[:, None], 0.0)
+        positions = self._positions[slots]
+        mean_p = (positions * mask[:, :, None]).sum(axis=1) / np.maximum(counts, 1)[:, None]
+        dp = (positions - mean_p[:, None, :]) * mask[:, :, None]
+        denom = (dt ** 2).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            velocity = (dt[:, :, None] * dp).sum(axis=1) / denom[:, None]
+            speeds = np.linalg.norm(velocity, axis=1) * 3.6
+        span = np.where(mask, times, -np.inf).max(axis=1) - np.where(mask, times, np.inf).min(axis=1)
+
+        valid = ((counts >= self.min_samples) & (span >= self.min_span_seconds)
+                 & (speeds >= self.speed_range[0]) & (speeds <= self.speed_range[1]))
+        self._speeds[slots[valid]] = speeds[valid]
+        self._expire(timestamp)
+        return self._speeds[slots].copy()
+
+    def _expire(self, timestamp):
+        """释放长时间未出现的轨迹"""
+        stale = [t for t, slot in self._slots.items()
+                 if timestamp - self._last_seen[slot] > self.max_age_seconds]
+        for track_id in stale:
+            self._free.append(self._slots.pop(track_id))
+
+
+class SpeedEstimatorRegistry:
+    """
+    按视频源ID管理车速估计器
+
+    每个视频源有独立的估计器、标定和跟踪器(为没有跟踪ID的检测结果分配稳定的ID)，
+    多路视频源并发测速时状态互不冲突。
+    """
+    def __init__(self, calibrations=None, **defaults):
+        """
+        参数:
+            calibrations: {source_id: 标定}，标定格式见parse_calibration
+            **defaults: 创建SpeedEstimator时的默认参数
+        """
+        self.calibrations = dict(calibrations or {})
+        self.defaults = defaults
+        self._estimators = {}
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **defaults):
+        """从JSON文件读取各视频源的标定"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), **defaults)
+
+    def homography(self, source_id):
+        """视频源的单应矩阵，没有标定时返回None"""
+        try:
+            return parse_calibration(self.calibrations.get(source_id))
+        except (ValueError, KeyError) as e:
+            logger.error(f"视频源 {source_id} 的标定无效: {e}")
+            return None
+
+    def get(self, source_id, **options):
+        """
+        获取(必要时创建)视频源的估计器
+
+        参数:
+            source_id: 视频源ID
+            **options: 创建时覆盖默认参数
+        """
+        with self._lock:
+            estimator = self._estimators.get(source_id)
+            if estimator is None:
+                estimator = SpeedEstimator(homography=self.homography(source_id),
+                                           **dict(self.defaults, **options))
+                self._estimators[source_id] = estimator
+            return estimator
+
+    def tracker(self, source_id):
+        """获取(必要时创建)视频源的跟踪器"""
+        with self._lock:
+            tracker = self._trackers.get(source_id)
+            if tracker is None:
+                tracker = BoxTracker()
+                self._trackers[source_id] = tracker
+            return tracker
+
+    def release(self, source_id):
+        """视频源结束后释放其状态"""
+        with self._lock:
+            self._estimators.pop(source_id, None)
+            self._trackers.pop(source_id, None)
+
+    def sources(self):
+        with self._lock:
+            return list(self._estimators)
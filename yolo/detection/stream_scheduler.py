@@ -0,0 +1,319 @@
+"""
+多路视频流调度模块
+
+多路摄像头共用一个检测器:
+- 每路视频流由LatestFrameGrabber独立采集，只保留最新一帧(旧帧直接覆盖)，采集不会被推理阻塞
+- 调度线程在各路已就绪的新帧中按落后程度选取(公平且遵守各路的目标帧率)，
+  凑成一批送入检测器的detect_batch，一次推理处理多路画面
+- 检测结果在回调线程池中按摄像头分发，编码和推送不占用推理线程；同一摄像头的结果按帧顺序串行回调
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .frame_grabber import LatestFrameGrabber
+
+logger = logging.getLogger("video_processor")
+
+
+class CameraStream:
+    """
+    单路视频流
+
+    采集由LatestFrameGrabber在独立线程中完成，此类只记录调度状态(下一次到期时间、实际帧率、延迟)。
+    """
+    def __init__(self, camera_id, url, target_fps=5.0, size=None, priority=1.0,
+                 reconnect_delay=3.0, max_reconnect_delay=60.0):
+        """
+        参数:
+            camera_id: 摄像头ID
+            url: RTSP/HTTP/RTMP视频流地址
+            target_fps: 目标检测帧率
+            size: 输出尺寸(width, height)，None表示原始尺寸
+            priority: 调度权重，权重高的摄像头在落后程度相同时优先
+            reconnect_delay: 初始重连间隔(秒)
+            max_reconnect_delay: 最大重连间隔(秒)
+        """
+        self.camera_id = camera_id
+        self.url = url
+        self.priority = priority
+        self.grabber = LatestFrameGrabber(url, target_fps=max(0.1, float(target_fps)), size=size,
+                                          reconnect_delay=reconnect_delay,
+                                          max_reconnect_delay=max_reconnect_delay, name=camera_id)
+
+        self.fps = 0.0
+        self.next_due = 0.0
+        self.frames_processed = 0
+        self.last_latency = 0.0
+        self.last_processed = 0.0
+        self.results_dropped = 0
+        self._pending = deque()
+        self._delivering = False
+        self._pending_lock = threading.Lock()
+
+    @property
+    def target_fps(self):
+        return self.grabber.target_fps
+
+    @property
+    def source_fps(self):
+        return self.grabber.source_fps
+
+    @property
+    def connected(self):
+        return self.grabber.connected
+
+    def start(self, on_frame=None):
+        """启动采集线程，on_frame()在有新帧时调用(用于唤醒调度线程)"""
+        self.grabber.start(on_frame)
+
+    def stop(self, timeout=None):
+        self.grabber.stop(timeout)
+
+    def configure(self, target_fps=None, size=None):
+        """修改目标帧率或输出尺寸，采集线程在下一帧生效"""
+        self.grabber.configure(target_fps=target_fps, size=size)
+
+    def has_new_frame(self):
+        return self.grabber.has_new_frame()
+
+    def take(self):
+        """
+        取出最新帧
+
+        返回:
+            tuple: (frame, capture_time)，没有新帧时返回(None, 0)
+        """
+        return self.grabber.take()
+
+    def stats(self):
+        grabber = self.grabber.stats()
+        return {
+            'camera_id': self.camera_id,
+            'url': self.url,
+            'connected': grabber['connected'],
+            'target_fps': round(self.target_fps, 2),
+            'fps': round(self.fps, 2),
+            'frames_captured': grabber['frames_captured'],
+            'frames_processed': self.frames_processed,
+            'frames_dropped': grabber['frames_dropped'],
+            'results_dropped': self.results_dropped,
+            'reconnects': grabber['reconnects'],
+            'latency_ms': round(self.last_latency * 1000, 1)
+        }
+
+
+class StreamScheduler:
+    """
+    多路视频流调度器
+
+    on_result(camera_id, frame, detections, info)在回调线程池中调用，
+    info包含capture_time、latency、fps、frame_index和frame_size。同一摄像头的回调不会并发执行。
+    """
+    def __init__(self, detector, on_result, batch_size=8, max_batch_wait=0.01,
+                 detect_options=None, callback_workers=4, max_pending=2):
+        """
+        参数:
+            detector: 提供detect_batch的检测器
+            on_result: 检测结果回调
+            batch_size: 每批最多的帧数
+            max_batch_wait: 第一帧就绪后等待凑批的最长时间(秒)
+            detect_options: 传给detect_batch的检测参数(如conf_threshold)，可随时修改
+            callback_workers: 结果回调线程数
+            max_pending: 每路摄像头等待回调的最大结果数，超出时丢弃最旧的结果
+        """
+        self.detector = detector
+        self.on_result = on_result
+        self.batch_size = max(1, batch_size)
+        self.max_batch_wait = max_batch_wait
+        self.detect_options = detect_options if detect_options is not None else {}
+        self.max_pending = max(1, max_pending)
+        self.cameras = {}
+        self.batches = 0
+        self.batch_frames = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._callbacks = ThreadPoolExecutor(max_workers=callback_workers,
+                                             thread_name_prefix="stream-result")
+
+    def add_camera(self, camera_id, url, target_fps=5.0, **options):
+        """
+        添加摄像头(调度器运行中也可添加)
+
+        返回:
+            CameraStream
+        """
+        camera = CameraStream(camera_id, url, target_fps, **options)
+        with self._cond:
+            if camera_id in self.cameras:
+                raise ValueError(f"摄像头已存在: {camera_id}")
+            self.cameras[camera_id] = camera
+            running = self._running
+        if running:
+            camera.start(self._wake)
+        logger.info(f"添加摄像头 {camera_id}: {url} ({target_fps} FPS)")
+        return camera
+
+    def configure_all(self, size=None, frame_step=None):
+        """
+        修改所有摄像头的设置
+
+        参数:
+            size: 输出尺寸(width, height)
+            frame_step: 每多少帧检测一帧，按各路视频流的原始帧率换算为目标帧率
+        """
+        with self._cond:
+            cameras = list(self.cameras.values())
+        for camera in cameras:
+            target_fps = camera.source_fps / frame_step if frame_step and camera.source_fps else None
+            camera.configure(target_fps=target_fps, size=size)
+
+    def remove_camera(self, camera_id):
+        """移除摄像头，返回是否存在"""
+        with self._cond:
+            camera = self.cameras.pop(camera_id, None)
+        if camera is None:
+            return False
+        camera.stop(timeout=5)
+        logger.info(f"移除摄像头 {camera_id}")
+        return True
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            cameras = list(self.cameras.values())
+        for camera in cameras:
+            camera.start(self._wake)
+        self._thread = threading.Thread(target=self._schedule_loop, name="stream-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            cameras = list(self.cameras.values())
+        for camera in cameras:
+            camera.stop(timeout)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._callbacks.shutdown(wait=False)
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def _ready_cameras(self, now):
+        """已有新帧且到达目标帧率间隔的摄像头，按落后程度(乘以权重)从大到小排序"""
+        ready = [c for c in self.cameras.values() if c.has_new_frame() and now >= c.next_due]
+        ready.sort(key=lambda c: (now - c.next_due) * c.target_fps * c.priority, reverse=True)
+        return ready
+
+    def _next_batch(self):
+        """等待并选出下一批摄像头"""
+        with self._cond:
+            deadline = None
+            while self._running:
+                now = time.time()
+                ready = self._ready_cameras(now)
+                if len(ready) >= self.batch_size or (ready and deadline is not None and now >= deadline):
+                    return ready[:self.batch_size]
+                if ready and deadline is None:
+                    # 第一帧就绪后短暂等待其他摄像头，凑成更大的批次
+                    deadline = now + self.max_batch_wait
+                # 等待新帧或最近一路摄像头到达帧率间隔
+                waits = [c.next_due - now for c in self.cameras.values()
+                         if c.has_new_frame() and c.next_due > now]
+                if deadline is not None:
+                    waits.append(deadline - now)
+                self._cond.wait(min(waits) if waits else 0.5)
+        return []
+
+    def _schedule_loop(self):
+        while True:
+            cameras = self._next_batch()
+            if not cameras:
+                if not self._running:
+                    return
+                continue
+            frames = []
+            selected = []
+            now = time.time()
+            for camera in cameras:
+                frame, capture_time = camera.take()
+                if frame is None:
+                    continue
+                # 下一次到期时间从计划时间推进，落后超过一个周期时从当前时间重新计算
+                period = 1.0 / camera.target_fps
+                camera.next_due += period
+                if camera.next_due < now:
+                    camera.next_due = now + period
+                frames.append(frame)
+                selected.append((camera, capture_time))
+            if not frames:
+                continue
+
+            try:
+                results = self.detector.detect_batch(frames, annotate=False, **self.detect_options)
+            except Exception as e:
+                logger.error(f"批量检测失败: {e}")
+                time.sleep(0.2)
+                continue
+            self.batches += 1
+            self.batch_frames += len(frames)
+
+            done = time.time()
+            for (camera, capture_time), frame, (_, detections) in zip(selected, frames, results):
+                if camera.last_processed > 0 and done > camera.last_processed:
+                    instant_fps = 1.0 / (done - camera.last_processed)
+                    camera.fps = instant_fps if camera.fps == 0 else 0.8 * camera.fps + 0.2 * instant_fps
+                camera.frames_processed += 1
+                camera.last_latency = done - capture_time
+                camera.last_processed = done
+                info = {'capture_time': capture_time, 'latency': camera.last_latency,
+                        'fps': camera.fps, 'batch_size': len(frames),
+                        'frame_index': camera.frames_processed,
+                        'frame_size': (frame.shape[1], frame.shape[0])}
+                self._dispatch(camera, (frame, detections, info))
+
+    def _dispatch(self, camera, item):
+        """把结果加入摄像头的待回调队列，该摄像头没有正在执行的回调时提交到线程池"""
+        with camera._pending_lock:
+            camera._pending.append(item)
+            # 回调跟不上时只保留最新的结果，避免积压增加延迟
+            while len(camera._pending) > self.max_pending:
+                camera._pending.popleft()
+                camera.results_dropped += 1
+            if camera._delivering:
+                return
+            camera._delivering = True
+        self._callbacks.submit(self._deliver, camera)
+
+    def _deliver(self, camera):
+        """按顺序执行摄像头的待回调结果，保证同一摄像头的回调串行且有序"""
+        while True:
+            with camera._pending_lock:
+                if not camera._pending:
+                    camera._delivering = False
+                    return
+                frame, detections, info = camera._pending.popleft()
+            try:
+                self.on_result(camera.camera_id, frame, detections, info)
+            except Exception as e:
+                logger.error(f"摄像头 {camera.camera_id} 结果处理失败: {e}")
+
+    def stats(self):
+        """调度统计"""
+        with self._cond:
+            cameras = [c.stats() for c in self.cameras.values()]
+        return {
+            'cameras': cameras,
+            'batches': self.batches,
+            'avg_batch_size': round(self.batch_frames / self.batches, 2) if self.batches else 0.0
+        }
@@ -0,0 +1,159 @@
+"""
+目标跟踪模块
+
+此模块提供基于IoU匹配和匀速运动模型的轻量跟踪器。推理只在部分帧上运行时，
+跟踪器根据每条轨迹的速度推算跳过帧上的框位置，使标注框跟随目标移动而不是停在旧位置。
+"""
+
+import logging
+
+from .utils import calculate_iou
+
+logger = logging.getLogger("video_processor")
+
+
+class Track:
+    """
+    单条轨迹
+
+    保存最近一次检测结果，以及框四个坐标每帧的变化量(匀速模型)。
+    """
+    def __init__(self, track_id, detection, frame_index):
+        self.track_id = track_id
+        self.detection = detection
+        self.box = [float(v) for v in detection['coordinates']]
+        self.velocity = [0.0, 0.0, 0.0, 0.0]
+        self.last_frame = frame_index
+        self.hits = 1
+
+    def predict(self, frame_index):
+        """推算指定帧上的框位置"""
+        dt = frame_index - self.last_frame
+        return [v + dv * dt for v, dv in zip(self.box, self.velocity)]
+
+    def update(self, detection, frame_index, smoothing=0.5):
+        """
+        用新的检测结果更新轨迹
+
+        参数:
+            detection: 检测结果字典
+            frame_index: 检测所在帧号
+            smoothing: 速度平滑系数，越大越依赖新观测
+        """
+        box = [float(v) for v in detection['coordinates']]
+        dt = frame_index - self.last_frame
+        if dt > 0:
+            measured = [(new - old) / dt for new, old in zip(box, self.box)]
+            if self.hits == 1:
+                self.velocity = measured
+            else:
+                self.velocity = [smoothing * m + (1 - smoothing) * v
+                                 for m, v in zip(measured, self.velocity)]
+        self.box = box
+        self.detection = detection
+        self.last_frame = frame_index
+        self.hits += 1
+
+
+class BoxTracker:
+    """
+    IoU跟踪器
+
+    update()在推理帧上把检测结果与轨迹关联，predict()为跳过的帧生成推算的检测结果。
+    """
+    def __init__(self, iou_threshold=0.3, max_age=30, max_predict_frames=None, smoothing=0.5):
+        """
+        参数:
+            iou_threshold: 检测框与轨迹推算框匹配的最小IoU
+            max_age: 轨迹多少帧未被匹配后删除
+            max_predict_frames: 距离最近一次观测超过多少帧后不再推算显示(None表示与max_age相同)
+            smoothing: 速度平滑系数
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.max_predict_frames = max_age if max_predict_frames is None else max_predict_frames
+        self.smoothing = smoothing
+        self.tracks = []
+        self._next_id = 1
+
+    def reset(self):
+        """清除所有轨迹"""
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, detections, frame_index):
+        """
+        用推理结果更新轨迹
+
+        参数:
+            detections: detect_objects返回的检测结果列表，匹配后会写入track_id
+            frame_index: 当前帧号
+
+        返回:
+            list: 当前活跃轨迹
+        """
+        # 按IoU从大到小贪心匹配，只在同类别之间匹配
+        candidates = []
+        for t_idx, track in enumerate(self.tracks):
+            predicted = track.predict(frame_index)
+            for d_idx, detection in enumerate(detections):
+                if detection.get('class_id') != track.detection.get('class_id'):
+                    continue
+                iou = calculate_iou(predicted, detection['coordinates'])
+                if iou >= self.iou_threshold:
+                    candidates.append((iou, t_idx, d_idx))
+        candidates.sort(reverse=True)
+
+        matched_tracks = set()
+        matched_detections = set()
+        for _, t_idx, d_idx in candidates:
+            if t_idx in matched_tracks or d_idx in matched_detections:
+                continue
+            track = self.tracks[t_idx]
+            track.update(detections[d_idx], frame_index, self.smoothing)
+            detections[d_idx]['track_id'] = track.track_id
+            matched_tracks.add(t_idx)
+            matched_detections.add(d_idx)
+
+        # 未匹配的检测结果创建新轨迹
+        for d_idx, detection in enumerate(detections):
+            if d_idx in matched_detections:
+                continue
+            track = Track(self._next_id, detection, frame_index)
+            detection['track_id'] = track.track_id
+            self._next_id += 1
+            self.tracks.append(track)
+
+        # 删除长时间未匹配的轨迹
+        self.tracks = [t for t in self.tracks if frame_index - t.last_frame <= self.max_age]
+        return self.tracks
+
+    def predict(self, frame_index, frame_size=None):
+        """
+        推算跳过帧上的检测结果
+
+        参数:
+            frame_index: 帧号
+            frame_size: (width, height)，用于把框裁剪到画面内
+
+        返回:
+            list: 与detect_objects格式相同的检测结果，带有predicted=True
+        """
+        predictions = []
+        for track in self.tracks:
+            age = frame_index - track.last_frame
+            if age < 0 or age > self.max_predict_frames:
+                continue
+            x1, y1, x2, y2 = track.predict(frame_index)
+            if frame_size is not None:
+                width, height = frame_size
+                x1, x2 = max(0.0, x1), min(float(width - 1), x2)
+                y1, y2 = max(0.0, y1), min(float(height - 1), y2)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            detection = dict(track.detection)
+            detection['coordinates'] = [int(x1), int(y1), int(x2), int(y2)]
+            detection['track_id'] = track.track_id
+            detection['predicted'] = True
+            predictions.append(detection)
+        return predictions
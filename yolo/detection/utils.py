@@ -1,14 +1,41 @@
 import cv2
 import numpy as np
 import os
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 
+@lru_cache(maxsize=32)
+def _load_font(font_path, font_size):
+    """加载字体并缓存，避免每次绘制文本都重新读取字体文件"""
+    try:
+        if font_path and os.path.exists(font_path):
+            return ImageFont.truetype(font_path, font_size)
+        # 尝试常见中文字体
+        font_candidates = [
+            os.path.join(os.environ.get('WINDIR', ''), 'Fonts', 'simhei.ttf'),  # Windows
+            os.path.join(os.environ.get('WINDIR', ''), 'Fonts', 'msyh.ttc'),    # Windows
+            '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',        # Linux
+            '/System/Library/Fonts/PingFang.ttc',                               # macOS
+            '/System/Library/Fonts/STHeiti Light.ttc'                           # macOS
+        ]
+        for candidate in font_candidates:
+            if os.path.exists(candidate):
+                return ImageFont.truetype(candidate, font_size)
+        # 如果找不到中文字体，使用默认字体
+        return ImageFont.load_default()
+    except Exception as e:
+        print(f"加载字体失败: {e}，使用默认字体")
+        return ImageFont.load_default()
+
 def draw_text_pil(img, text, pos, font_size=24, text_color=(255, 255, 255), bg_color=(0, 0, 255, 128), font_path=None, with_background=False):
     """
     使用PIL绘制支持中文的文本
     
+    只把文本所在的区域转换为PIL图像绘制后写回，直接修改输入图像，
+    不再对整帧做颜色转换和复制。
+    
     参数:
-        img: OpenCV格式图像
+        img: OpenCV格式图像(会被原地修改)
         text: 要绘制的文本
         pos: 文本位置 (x, y)
         font_size: 字体大小
@@ -18,57 +45,84 @@ def draw_text_pil(img, text, pos, font_size=24, text_color=(255, 255, 255), bg_c
         with_background: 是否绘制文本背景
         
     返回:
-        添加文本后的图像
+        添加文本后的图像(即输入图像)
     """
-    # OpenCV图像转PIL图像
-    img_pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    
-    # 创建绘图对象
-    draw = ImageDraw.Draw(img_pil, 'RGBA')
-    
-    # 加载字体，如果没有指定字体，尝试使用系统默认字体
-    try:
-        if font_path and os.path.exists(font_path):
-            font = ImageFont.truetype(font_path, font_size)
-        else:
-            # 尝试常见中文字体
-            font_candidates = [
-                os.path.join(os.environ.get('WINDIR', ''), 'Fonts', 'simhei.ttf'),  # Windows
-                os.path.join(os.environ.get('WINDIR', ''), 'Fonts', 'msyh.ttc'),    # Windows
-                '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf',        # Linux
-                '/System/Library/Fonts/PingFang.ttc',                               # macOS
-                '/System/Library/Fonts/STHeiti Light.ttc'                           # macOS
-            ]
-            
-            for font_path in font_candidates:
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, font_size)
-                    # print(f"使用字体: {font_path}")  # 注释掉打印信息
-                    break
-            else:
-                # 如果找不到中文字体，使用默认字体
-                font = ImageFont.load_default()
-                # print("使用默认字体，可能不支持中文")  # 注释掉打印信息
-    except Exception as e:
-        print(f"加载字体失败: {e}，使用默认字体")
-        font = ImageFont.load_default()
+    font = _load_font(font_path, font_size)
     
     # 计算文本大小
-    text_width, text_height = draw.textbbox((0, 0), text, font=font)[2:4]
+    text_width, text_height = font.getbbox(text)[2:4]
+    
+    # 文本(及背景)覆盖的区域
+    x, y = int(pos[0]), int(pos[1])
+    img_h, img_w = img.shape[:2]
+    rx1, ry1 = max(0, x), max(0, y)
+    rx2 = min(img_w, x + text_width + 12)
+    ry2 = min(img_h, y + text_height + 7)
+    if rx2 <= rx1 or ry2 <= ry1:
+        return img
+    
+    # 只转换文本区域
+    roi = img[ry1:ry2, rx1:rx2]
+    roi_pil = Image.fromarray(cv2.cvtColor(roi, cv2.COLOR_BGR2RGB))
+    draw = ImageDraw.Draw(roi_pil, 'RGBA')
+    ox, oy = x - rx1, y - ry1
     
     # 如果需要背景，绘制背景矩形
-    x, y = pos
     if with_background:
         draw.rectangle(
-            [(x, y), (x + text_width + 10, y + text_height + 5)],
+            [(ox, oy), (ox + text_width + 10, oy + text_height + 5)],
             fill=bg_color
         )
     
     # 绘制文本
-    draw.text((x + 5 if with_background else x, y), text, fill=text_color, font=font)
+    draw.text((ox + 5 if with_background else ox, oy), text, fill=text_color, font=font)
+    
+    # 写回原图
+    roi[:] = cv2.cvtColor(np.asarray(roi_pil), cv2.COLOR_RGB2BGR)
+    return img
+
+def draw_fancy_text(img, text, position, font_size=24, text_color=(255, 255, 255), 
+                   bg_color=None, add_shadow=True):
+    """
+    在图像上绘制美观的文本
+    
+    参数:
+        img: 输入图像
+        text: 要绘制的文本
+        position: 文本位置 (x, y)
+        font_size: 字体大小
+        text_color: 文本颜色
+        bg_color: 背景颜色，None表示无背景
+        add_shadow: 是否添加阴影
+        
+    返回:
+        添加文本后的图像
+    """
+    x, y = position
+    
+    # 绘制文本阴影（如果需要），直接画在原图上
+    if add_shadow:
+        img = draw_text_pil(
+            img, 
+            text, 
+            (x+2, y+2), 
+            font_size=font_size,
+            text_color=(0, 0, 0),  # 黑色阴影
+            with_background=False
+        )
+    
+    # 绘制主文本
+    result = draw_text_pil(
+        img, 
+        text, 
+        position, 
+        font_size=font_size,
+        text_color=text_color,
+        bg_color=bg_color if bg_color is not None else (0, 0, 0, 180),
+        with_background=bg_color is not None
+    )
     
-    # PIL图像转回OpenCV格式
-    return cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
+    return result
 
 def draw_fancy_box(img, x1, y1, x2, y2, thickness=2, alpha=0.2, box_type='vehicle', custom_color=None):
     """
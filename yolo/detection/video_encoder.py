@@ -0,0 +1,345 @@
+"""
+视频编码模块
+
+此模块提供把标注后的原始帧直接通过管道送入ffmpeg进行一次性H.264编码的功能，
+避免先写临时文件再多次转码。
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("video_processor")
+
+
+def ffmpeg_available(ffmpeg_bin='ffmpeg'):
+    """检查系统中是否可以调用ffmpeg"""
+    return shutil.which(ffmpeg_bin) is not None
+
+
+class FFmpegPipeEncoder:
+    """
+    ffmpeg管道编码器
+
+    将BGR原始帧通过stdin写入单个ffmpeg libx264进程，直接生成带faststart的MP4，
+    整个视频只编码一次。
+    """
+    def __init__(self, output_path, width, height, fps, preset='fast', crf=22,
+                 faststart=True, ffmpeg_bin='ffmpeg', extra_args=None, fragmented=False,
+                 fragment_seconds=2.0):
+        """
+        初始化编码器
+
+        参数:
+            output_path: 输出MP4路径
+            width: 帧宽度
+            height: 帧高度
+            fps: 输出帧率
+            preset: libx264编码预设
+            crf: libx264质量参数(越小质量越高)
+            faststart: 是否把moov移到文件头部，便于浏览器边下边播
+            ffmpeg_bin: ffmpeg可执行文件
+            extra_args: 追加到输出参数中的额外ffmpeg参数列表
+            fragmented: 是否输出分片MP4(fMP4)，编码过程中已写出的部分即可播放，与faststart互斥
+            fragment_seconds: 分片MP4的关键帧间隔(秒)，决定可播放部分的更新粒度
+        """
+        self.output_path = output_path
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = float(fps)
+        self.preset = preset
+        self.crf = crf
+        self.faststart = faststart
+        self.ffmpeg_bin = ffmpeg_bin
+        self.extra_args = list(extra_args or [])
+        self.fragmented = fragmented
+        self.fragment_seconds = fragment_seconds
+
+        self.process = None
+        self.frames_written = 0
+        self.failed = False
+        self._stderr = None
+
+    def _build_command(self):
+        """构建ffmpeg命令行"""
+        command = [
+            self.ffmpeg_bin,
+            '-hide_banner', '-loglevel', 'error', '-y',
+            # 输入: stdin上的BGR原始帧
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', f'{self.fps:.6f}',
+            '-i', '-',
+            # 输出: H.264 + yuv420p，兼容所有浏览器
+            '-an',
+            '-c:v', 'libx264',
+            '-preset', self.preset,
+            '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+        ]
+        if self.fragmented:
+            # 每个关键帧开始一个分片，moov放在文件头部且不依赖结尾的索引
+            keyint = max(1, int(round(self.fps * self.fragment_seconds)))
+            command.extend(['-g', str(keyint),
+                            '-movflags', 'frag_keyframe+empty_moov+default_base_moof'])
+        elif self.faststart:
+            command.extend(['-movflags', '+faststart'])
+        command.extend(self.extra_args)
+        command.append(self.output_path)
+        return command
+
+    def open(self):
+        """启动ffmpeg进程"""
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        # stderr写入临时文件，避免管道写满导致ffmpeg阻塞
+        self._stderr = tempfile.TemporaryFile()
+        command = self._build_command()
+        logger.info(f"启动ffmpeg管道编码: {' '.join(command)}")
+        try:
+            self.process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=self._stderr
+            )
+        except Exception as e:
+            logger.error(f"启动ffmpeg失败: {e}")
+            self.failed = True
+            self.process = None
+        return self.is_opened()
+
+    def is_opened(self):
+        """编码器是否可用"""
+        return self.process is not None and not self.failed and self.process.poll() is None
+
+    def write(self, frame):
+        """
+        写入一帧
+
+        参数:
+            frame: BGR图像，尺寸不一致时会自动缩放
+
+        返回:
+            bool: 是否写入成功
+        """
+        if not self.is_opened():
+            return False
+
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height))
+
+        try:
+            # 直接写入连续内存，不额外生成bytes副本
+            self.process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8))
+            self.frames_written += 1
+            return True
+        except (BrokenPipeError, OSError) as e:
+            logger.error(f"写入ffmpeg管道失败: {e}")
+            logger.error(self._read_stderr())
+            self.failed = True
+            return False
+
+    def close(self, timeout=None):
+        """
+        结束编码并等待ffmpeg写完文件
+
+        返回:
+            bool: 输出文件是否成功生成
+        """
+        if self.process is None:
+            return False
+
+        try:
+            if self.process.stdin and not self.process.stdin.closed:
+                self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            self.failed = True
+
+        try:
+            return_code = self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.error("等待ffmpeg结束超时，强制终止")
+            self.process.kill()
+            return_code = self.process.wait()
+
+        if return_code != 0:
+            logger.error(f"ffmpeg编码失败，退出码: {return_code}")
+            logger.error(self._read_stderr())
+            self.failed = True
+
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+        self.process = None
+
+        return not self.failed and os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0
+
+    def _read_stderr(self):
+        """读取ffmpeg错误输出"""
+        if self._stderr is None:
+            return ""
+        try:
+            self._stderr.seek(0)
+            return self._stderr.read().decode('utf-8', errors='ignore').strip()
+        except Exception:
+            return ""
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class OpenCVVideoEncoder:
+    """
+    OpenCV编码器
+
+    系统中没有ffmpeg时的备选方案，接口与FFmpegPipeEncoder一致。
+    """
+    def __init__(self, output_path, width, height, fps, fourcc='mp4v'):
+        self.output_path = output_path
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = float(fps)
+        self.fourcc = fourcc
+        self.writer = None
+        self.frames_written = 0
+
+    def open(self):
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.writer = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                      self.fps, (self.width, self.height))
+        return self.is_opened()
+
+    def is_opened(self):
+        return self.writer is not None and self.writer.isOpened()
+
+    def write(self, frame):
+        if not self.is_opened():
+            return False
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height))
+        self.writer.write(frame)
+        self.frames_written += 1
+        return True
+
+    def close(self, timeout=None):
+        if self.writer is None:
+            return False
+        self.writer.release()
+        self.writer = None
+        return os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def create_video_encoder(output_path, width, height, fps, **kwargs):
+    """
+    创建视频编码器，优先使用ffmpeg管道编码
+
+    参数:
+        output_path: 输出文件路径
+        width: 帧宽度
+        height: 帧高度
+        fps: 帧率
+        **kwargs: 传递给FFmpegPipeEncoder的参数
+
+    返回:
+        已打开的编码器实例，失败时返回None
+    """
+    ffmpeg_bin = kwargs.get('ffmpeg_bin', 'ffmpeg')
+    if ffmpeg_available(ffmpeg_bin):
+        encoder = FFmpegPipeEncoder(output_path, width, height, fps, **kwargs)
+        if encoder.open():
+            return encoder
+        logger.warning("ffmpeg管道编码器启动失败，改用OpenCV编码")
+    else:
+        logger.warning("未找到ffmpeg，改用OpenCV编码(输出可能无法在浏览器中直接播放)")
+
+    encoder = OpenCVVideoEncoder(output_path, width, height, fps)
+    if encoder.open():
+        return encoder
+
+    logger.error(f"无法创建输出视频: {output_path}")
+    return None
+
+
+def concat_videos(segment_paths, output_path, ffmpeg_bin='ffmpeg'):
+    """
+    按顺序拼接编码参数相同的视频片段
+
+    有ffmpeg时使用concat demuxer直接复制码流(不重新编码)，否则用OpenCV逐帧重写。
+
+    参数:
+        segment_paths: 片段文件路径列表
+        output_path: 输出文件路径
+        ffmpeg_bin: ffmpeg可执行文件
+
+    返回:
+        bool: 是否拼接成功
+    """
+    segment_paths = [p for p in segment_paths if os.path.exists(p) and os.path.getsize(p) > 0]
+    if not segment_paths:
+        logger.error("没有可拼接的视频片段")
+        return False
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if ffmpeg_available(ffmpeg_bin):
+        list_file = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8')
+        try:
+            with list_file:
+                for path in segment_paths:
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    list_file.write(f"file '{escaped}'\n")
+            command = [ffmpeg_bin, '-hide_banner', '-loglevel', 'error', '-y',
+                       '-f', 'concat', '-safe', '0', '-i', list_file.name,
+                       '-c', 'copy', '-movflags', '+faststart', output_path]
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if result.returncode == 0 and os.path.exists(output_path):
+                return True
+            logger.error(f"ffmpeg拼接失败: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+        finally:
+            os.remove(list_file.name)
+
+    # 备选方案: 逐帧读取片段重新写出
+    first = cv2.VideoCapture(segment_paths[0])
+    width = int(first.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(first.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = first.get(cv2.CAP_PROP_FPS) or 25
+    first.release()
+    encoder = OpenCVVideoEncoder(output_path, width, height, fps)
+    if not encoder.open():
+        logger.error(f"无法创建输出视频: {output_path}")
+        return False
+    for path in segment_paths:
+        cap = cv2.VideoCapture(path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            encoder.write(frame)
+        cap.release()
+    return encoder.close()
@@ -0,0 +1,938 @@
+"""
+视频处理流水线引擎
+
+此模块把视频处理拆分为可组合的阶段，由VideoPipeline统一驱动:
+source(解码) -> gate(抽帧) -> detect(检测) -> track(跟踪) -> ocr(车牌识别)
+-> speed(测速) -> annotate(标注) -> encode(编码) -> sink(结果汇总)
+
+解码和编码各自运行在独立线程中，中间的阶段在调用线程中按帧顺序执行，
+每个阶段单独计时。各种视频处理入口只是用不同的阶段组合构造的预设。
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import cv2
+import torch
+import numpy as np
+from tqdm import tqdm
+
+from .class_mapper import get_vehicle_class_name
+from .vehicle_analyzer import identify_vehicle_color
+from .utils import draw_fancy_box, draw_fancy_text
+from .video_encoder import create_video_encoder
+from .frame_source import open_frame_source
+from .tracking import BoxTracker
+from .speed_estimator import SpeedEstimator
+from .frame_pool import FramePool
+from .checkpoint import CheckpointMarker, SegmentWriter
+from .cancellation import CancellationToken, REASON_TIMEOUT, REASON_CANCELLED
+from .progress import ProgressReporter
+from .pipeline import (PipelineQueue, ProducerStage, ConsumerStage, StageStats,
+                       iterate_queue, log_pipeline_stats, END_OF_STREAM)
+
+logger = logging.getLogger("video_processor")
+
+# 车辆类型统计使用的键，顺序与类别ID 0-7 对应
+VEHICLE_TYPE_KEYS = ['car', 'bus', 'tank_truck', 'container_truck',
+                     'truck', 'van', 'pickup', 'special_vehicle']
+
+
+def _box_type(cls_id):
+    """根据类别ID确定边界框类型，与Detector保持一致"""
+    if cls_id < 8:
+        return "vehicle"
+    elif cls_id == 8:
+        return "license_plate"
+    elif cls_id == 9:
+        return "accident"
+    elif cls_id == 10:
+        return "illegal_parking"
+    elif cls_id == 11:
+        return "overspeed"
+    return "other"
+
+
+def _report_failure(progress_callback, error):
+    """处理开始前失败时发出done事件，订阅者不会一直等待"""
+    if progress_callback is None:
+        return
+    try:
+        progress_callback({'type': 'done', 'completed': False, 'error': error})
+    except Exception as e:
+        logger.error(f"进度回调出错: {e}")
+
+
+class PipelineInfo:
+    """视频和输出的基本信息，在各阶段setup时传入"""
+    def __init__(self, video_path, output_path, width, height, fps, total_frames, start_time):
+        self.video_path = video_path
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.total_frames = total_frames
+        self.start_time = start_time
+
+    @property
+    def duration(self):
+        """视频时长(秒)，总帧数未知时为0"""
+        return self.total_frames / self.fps if self.total_frames and self.fps else 0
+
+
+class FrameContext:
+    """
+    单帧在流水线中的上下文
+
+    index从1开始计数；infer由gate阶段决定，inferred表示detections来自本帧推理
+    (否则为空或由跟踪器推算)。耗时较长的阶段可以在内部检查cancel_token。
+    """
+    def __init__(self, index, image, info, cancel_token=None):
+        self.index = index
+        self.cancel_token = cancel_token
+        self.image = image
+        self.buffer = image
+        self.timestamp = index / info.fps
+        self.wall_time = info.start_time + timedelta(seconds=self.timestamp)
+        self.infer = True
+        self.inferred = False
+        self.detections = []
+
+
+class Stage:
+    """
+    流水线阶段基类
+
+    子类实现process(ctx)，在ctx上读写检测结果或图像；setup在处理开始前调用，close在结束后调用。
+    需要跨检查点保留的状态通过state_dict/load_state保存和恢复。
+    """
+    name = 'stage'
+
+    def setup(self, info):
+        self.info = info
+
+    def process(self, ctx):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def state_dict(self):
+        """返回可JSON序列化的阶段状态，无状态时返回None"""
+        return None
+
+    def load_state(self, state):
+        """从检查点恢复阶段状态"""
+        pass
+
+
+class ResultSink(Stage):
+    """
+    结果汇总阶段基类
+
+    results中保存逐帧结果，启用检查点时新增的结果会随检查点一起提交。
+    """
+    name = 'sink'
+
+    def setup(self, info):
+        super().setup(info)
+        self.results = []
+
+
+class GateStage(Stage):
+    """
+    抽帧阶段，决定哪些帧运行推理
+
+    帧号满足(index - phase) % interval == 0时推理，include_first为True时第一帧总是推理。
+    """
+    name = 'gate'
+
+    def __init__(self, interval=1, phase=0, include_first=False):
+        self.interval = max(1, int(interval))
+        self.phase = phase
+        self.include_first = include_first
+
+    def process(self, ctx):
+        ctx.infer = ((ctx.index - self.phase) % self.interval == 0
+                     or (self.include_first and ctx.index == 1))
+
+
+class DetectStage(Stage):
+    """使用Detector检测，标注交给annotate阶段统一绘制"""
+    name = 'detect'
+
+    def __init__(self, detector, conf_threshold=None, detect_vehicles=True, detect_plates=True,
+                 detect_accidents=False, detect_violations=False):
+        self.detector = detector
+        self.options = dict(conf_threshold=conf_threshold, detect_vehicles=detect_vehicles,
+                            detect_plates=detect_plates, detect_accidents=detect_accidents,
+                            detect_violations=detect_violations)
+
+    def process(self, ctx):
+        if not ctx.infer:
+            return
+        try:
+            _, detections = self.detector.detect_objects(ctx.image, annotate=False, **self.options)
+        except torch.cuda.OutOfMemoryError:
+            logger.warning("警告: CUDA内存不足，尝试清理缓存")
+            torch.cuda.empty_cache()
+            detections = []
+        ctx.detections = [d for d in detections if isinstance(d, dict)]
+        ctx.inferred = True
+
+
+class ModelDetectStage(Stage):
+    """直接使用YOLO模型检测，输出与Detector相同格式的检测结果"""
+    name = 'detect'
+
+    def __init__(self, model, conf_threshold=0.4, detect_plates=True):
+        self.model = model
+        self.conf_threshold = conf_threshold
+        self.detect_plates = detect_plates
+
+    def process(self, ctx):
+        if not ctx.infer:
+            return
+        detections = []
+        try:
+            results = self.model(ctx.image)
+        except torch.cuda.OutOfMemoryError:
+            logger.warning("警告: CUDA内存不足，尝试清理缓存")
+            torch.cuda.empty_cache()
+            results = []
+        for r in results:
+            for box in r.boxes:
+                try:
+                    cls_id = int(box.cls.item())
+                    conf = box.conf.item()
+                    if conf < self.conf_threshold:
+                        continue
+                    if cls_id == 8 and not self.detect_plates:
+                        continue
+                    x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+                    detection = {
+                        "coordinates": [x1, y1, x2, y2],
+                        "confidence": conf,
+                        "class_id": cls_id,
+                        "class_name": get_vehicle_class_name(cls_id),
+                        "type": _box_type(cls_id)
+                    }
+                    if cls_id < 8:
+                        color_name, rgb_color = identify_vehicle_color(ctx.image[y1:y2, x1:x2])
+                        detection["vehicle_color"] = color_name
+                        detection["vehicle_rgb"] = rgb_color
+                    detections.append(detection)
+                except Exception as box_error:
+                    logger.error(f"处理检测框出错: {box_error}")
+        ctx.detections = detections
+        ctx.inferred = True
+
+
+class TrackStage(Stage):
+    """
+    跟踪阶段
+
+    推理帧上更新轨迹并写入track_id；propagate为True时在跳过的帧上使用推算的框。
+    """
+    name = 'track'
+
+    def __init__(self, tracker=None, propagate=True, max_age=30, max_predict_frames=None):
+        self.tracker = tracker
+        self.propagate = propagate
+        self.max_age = max_age
+        self.max_predict_frames = max_predict_frames
+
+    def setup(self, info):
+        super().setup(info)
+        if self.tracker is None:
+            self.tracker = BoxTracker(max_age=self.max_age, max_predict_frames=self.max_predict_frames)
+        self.tracker.reset()
+
+    def process(self, ctx):
+        if ctx.inferred:
+            self.tracker.update(ctx.detections, ctx.index)
+        elif self.propagate:
+            ctx.detections = self.tracker.predict(ctx.index, (self.info.width, self.info.height))
+
+
+class OCRStage(Stage):
+    """
+    车牌识别阶段
+
+    对检测阶段未识别的车牌(没有plate_text)扩展边缘后裁剪识别，
+    置信度不足的车牌从结果中移除。
+    """
+    name = 'ocr'
+
+    def __init__(self, recognizer, padding=5, min_confidence=0.4):
+        """
+        参数:
+            recognizer: 识别函数，输入车牌图像，返回(文本, 置信度, 颜色, 背景色)
+            padding: 裁剪时向外扩展的像素
+            min_confidence: 保留结果的最低置信度
+        """
+        self.recognizer = recognizer
+        self.padding = padding
+        self.min_confidence = min_confidence
+
+    def process(self, ctx):
+        if not ctx.inferred:
+            return
+        height, width = ctx.image.shape[:2]
+        kept = []
+        for detection in ctx.detections:
+            if detection.get('class_id') != 8 or 'plate_text' in detection:
+                kept.append(detection)
+                continue
+            x1, y1, x2, y2 = detection['coordinates']
+            x1, y1 = max(x1 - self.padding, 0), max(y1 - self.padding, 0)
+            x2, y2 = min(x2 + self.padding, width), min(y2 + self.padding, height)
+            plate_text, confidence, plate_color, bg_color = self.recognizer(ctx.image[y1:y2, x1:x2])
+            if confidence <= self.min_confidence:
+                continue
+            detection.update({
+                "coordinates": [x1, y1, x2, y2],
+                "plate_text": plate_text,
+                "plate_conf": confidence,
+                "plate_color": plate_color,
+                "plate_bg_color": bg_color
+            })
+            kept.append(detection)
+        ctx.detections = kept
+
+
+class SpeedStage(Stage):
+    """
+    测速阶段
+
+    每次运行使用独立的SpeedEstimator，按跟踪ID对当前帧的所有车辆一次性计算速度，结果写入speed_kmh。
+    提供摄像头的地面单应矩阵时按地面坐标测速，否则按针孔模型(距离 = 车宽 * 焦距 / 像素宽度)估计。
+    """
+    name = 'speed'
+
+    def __init__(self, vehicle_width=1.8, focal_length=800, min_frame_gap=5, speed_range=(1, 150),
+                 homography=None, window_seconds=1.0):
+        """
+        参数:
+            vehicle_width: 针孔模型假设的车宽(米)
+            focal_length: 针孔模型的焦距(像素)
+            min_frame_gap: 计算速度所需样本的最小帧跨度
+            speed_range: 合理速度范围(km/h)
+            homography: 图像到地面(米)的3x3单应矩阵
+            window_seconds: 滑动窗口长度(秒)
+        """
+        self.vehicle_width = vehicle_width
+        self.focal_length = focal_length
+        self.min_frame_gap = min_frame_gap
+        self.speed_range = speed_range
+        self.homography = homography
+        self.window_seconds = window_seconds
+
+    def setup(self, info):
+        super().setup(info)
+        self.estimator = SpeedEstimator(
+            homography=self.homography, vehicle_width=self.vehicle_width,
+            focal_length=self.focal_length, speed_range=self.speed_range,
+            window_seconds=max(self.window_seconds, self.min_frame_gap / info.fps),
+            min_span_seconds=self.min_frame_gap / info.fps, min_samples=2)
+
+    def process(self, ctx):
+        if not ctx.inferred:
+            return
+        vehicles = [d for d in ctx.detections
+                    if d.get('track_id') is not None and d.get('class_id', 99) < 8]
+        speeds = self.estimator.update([d['track_id'] for d in vehicles],
+                                       [d['coordinates'] for d in vehicles],
+                                       ctx.timestamp, frame_width=self.info.width)
+        for detection, speed in zip(vehicles, speeds):
+            if not np.isnan(speed):
+                detection['speed_kmh'] = round(float(speed), 1)
+
+
+def draw_original_style(image, detection):
+    """
+    按原始车牌识别流程的样式绘制检测结果
+
+    车辆使用识别出的车身颜色画框，车牌使用蓝色边框和绿色背景的文字。
+    """
+    x1, y1, x2, y2 = detection['coordinates']
+    if detection.get('class_id') == 8:
+        draw_fancy_box(image, x1, y1, x2, y2, thickness=2, box_type='plate',
+                       custom_color=(255, 0, 0))
+        text_position = (x1, max(0, y1 - 40))
+        if text_position[1] < 10:
+            text_position = (x1, y2 + 10)
+        text = (f"{detection.get('plate_text', '未识别')} [{detection.get('plate_color', '未知')}] "
+                f"{detection.get('plate_conf', 0.0):.2f}")
+        return draw_fancy_text(image, text, text_position, font_size=24,
+                               text_color=(255, 255, 255), bg_color=(0, 120, 0), add_shadow=True)
+
+    rgb = detection.get('vehicle_rgb', (100, 100, 100))
+    draw_fancy_box(image, x1, y1, x2, y2, thickness=2, box_type='normal',
+                   custom_color=(int(rgb[2]), int(rgb[1]), int(rgb[0])))
+    return draw_fancy_text(image, f"{detection['class_name']} {detection['confidence']:.2f}",
+                           (x1, max(0, y1 - 30)), font_size=24, text_color=(255, 255, 255),
+                           bg_color=None, add_shadow=True)
+
+
+class AnnotateStage(Stage):
+    """
+    标注阶段
+
+    使用renderer绘制检测结果(包括推算的框)，再叠加测速、时间戳和进度信息。
+    """
+    name = 'annotate'
+
+    def __init__(self, renderer, timestamp_format=None, timestamp_style='cv2',
+                 show_progress=False, show_speed=True):
+        """
+        参数:
+            renderer: 绘制函数renderer(image, detection) -> image
+            timestamp_format: 时间戳格式，None表示不绘制
+            timestamp_style: 'cv2'(左上角绿色小字)或'fancy'(中文字体)
+            show_progress: 是否绘制帧号和检测数
+            show_speed: 是否在车辆框下方绘制速度
+        """
+        self.renderer = renderer
+        self.timestamp_format = timestamp_format
+        self.timestamp_style = timestamp_style
+        self.show_progress = show_progress
+        self.show_speed = show_speed
+
+    def process(self, ctx):
+        image = ctx.image
+        for detection in ctx.detections:
+            image = self.renderer(image, detection)
+            if self.show_speed and 'speed_kmh' in detection:
+                x1, _, _, y2 = detection['coordinates']
+                cv2.putText(image, f"{detection['speed_kmh']:.1f} km/h", (x1, y2 + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+
+        if self.timestamp_format:
+            time_str = ctx.wall_time.strftime(self.timestamp_format)
+            if self.timestamp_style == 'fancy':
+                image = draw_fancy_text(image, time_str, (20, 30))
+            else:
+                cv2.putText(image, time_str, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+        if self.show_progress:
+            progress_text = f"帧: {ctx.index}/{self.info.total_frames} 检测数: {len(ctx.detections)}"
+            image = draw_fancy_text(image, progress_text, (20, 70))
+        ctx.image = image
+
+
+# 事故和违章类别 -> 事件类型
+ALERT_TYPES = {9: 'accident', 10: 'illegal_parking', 11: 'overspeed'}
+
+
+class VehiclePlateSink(ResultSink):
+    """
+    按车辆/车牌分组汇总推理帧的结果
+
+    结果格式: {'frame', 'timestamp', 'vehicles': [...], 'license_plates': [...], 'alerts': [...]}，
+    alerts为事故、违停、超速类别的检测框(type为accident/illegal_parking/overspeed)
+    """
+    def __init__(self, timestamp_format='%Y-%m-%d %H:%M:%S', include_plates=True):
+        self.timestamp_format = timestamp_format
+        self.include_plates = include_plates
+        self.results = []
+
+    def process(self, ctx):
+        if not ctx.inferred:
+            return
+        frame_result = {
+            'frame': ctx.index,
+            'timestamp': ctx.wall_time.strftime(self.timestamp_format),
+            'vehicles': [],
+            'license_plates': [],
+            'alerts': []
+        }
+        for detection in ctx.detections:
+            box = detection.get('coordinates', [0, 0, 0, 0])
+            cls_id = detection.get('class_id', -1)
+            class_name = detection.get('class_name', '未知')
+            conf = detection.get('confidence', 0.0)
+            if 0 <= cls_id < 8:
+                vehicle = {
+                    'type': class_name,
+                    'class': class_name,  # 兼容前端
+                    'class_name': class_name,
+                    'box': box,
+                    'conf': float(conf),
+                    'color': detection.get('vehicle_color', '未知'),
+                    'rgb': (0, 0, 255)
+                }
+                if 'track_id' in detection:
+                    vehicle['track_id'] = detection['track_id']
+                if 'speed_kmh' in detection:
+                    vehicle['speed'] = detection['speed_kmh']
+                frame_result['vehicles'].append(vehicle)
+            elif cls_id == 8 and self.include_plates:
+                frame_result['license_plates'].append({
+                    'text': detection.get('plate_text', '未识别'),
+                    'class': '车牌',
+                    'class_name': '车牌',
+                    'box': box,
+                    'conf': float(detection.get('plate_conf') or conf),
+                    'color': detection.get('plate_color', '蓝色')
+                })
+            elif cls_id in ALERT_TYPES:
+                alert = {
+                    'type': ALERT_TYPES[cls_id],
+                    'class_id': cls_id,
+                    'class_name': class_name,
+                    'box': box,
+                    'conf': float(conf)
+                }
+                if 'track_id' in detection:
+                    alert['track_id'] = detection['track_id']
+                frame_result['alerts'].append(alert)
+        self.results.append(frame_result)
+
+
+class DetectionListSink(ResultSink):
+    """
+    按帧保存原始检测结果并生成统计摘要
+
+    结果格式: {"frame_index", "timestamp"(ISO格式), "detections"}，
+    count_vehicle_types为True时摘要中包含各车型数量。
+    """
+    def __init__(self, count_vehicle_types=False):
+        self.count_vehicle_types = count_vehicle_types
+        self.results = []
+
+    def setup(self, info):
+        super().setup(info)
+        self.frames_with_detections = 0
+        self.vehicle_types = {key: 0 for key in VEHICLE_TYPE_KEYS}
+
+    def state_dict(self):
+        return {'frames_with_detections': self.frames_with_detections,
+                'vehicle_types': dict(self.vehicle_types)}
+
+    def load_state(self, state):
+        self.frames_with_detections = state.get('frames_with_detections', 0)
+        self.vehicle_types.update(state.get('vehicle_types', {}))
+
+    def process(self, ctx):
+        if not ctx.inferred:
+            return
+        if ctx.detections:
+            self.frames_with_detections += 1
+        for detection in ctx.detections:
+            cls_id = detection.get('class_id', -1)
+            if 0 <= cls_id < 8:
+                self.vehicle_types[VEHICLE_TYPE_KEYS[cls_id]] += 1
+        self.results.append({
+            "frame_index": ctx.index,
+            "timestamp": ctx.wall_time.isoformat(),
+            "detections": ctx.detections
+        })
+
+    def summary(self, run):
+        """
+        生成处理摘要
+
+        参数:
+            run: VideoPipeline.run返回的PipelineResult
+        """
+        processed = run.processed_count
+        elapsed = run.elapsed
+        avg_fps = processed / elapsed if elapsed > 0 else 0
+        if self.count_vehicle_types:
+            total_frames = self.info.total_frames if self.info.total_frames > 0 else run.frame_count
+            return {
+                "total_frames": total_frames,
+                "processed_frames": processed,
+                "frames_with_detections": self.frames_with_detections,
+                "detection_rate": self.frames_with_detections / processed if processed > 0 else 0,
+                "processing_time": elapsed,
+                "avg_fps": avg_fps,
+                "total_vehicles": sum(self.vehicle_types.values()),
+                "vehicle_types": dict(self.vehicle_types)
+            }
+        return {
+            "frames_with_detections": self.frames_with_detections,
+            "total_frames_processed": processed,
+            "processing_time": elapsed,
+            "average_fps": avg_fps,
+            "video_size": {
+                "width": self.info.width,
+                "height": self.info.height,
+                "total_frames": self.info.total_frames,
+                "duration": self.info.duration
+            }
+        }
+
+
+class PipelineResult:
+    """一次流水线运行的结果"""
+    def __init__(self):
+        self.output_path = None
+        self.info = None
+        self.completed = False
+        self.timed_out = False
+        self.cancelled = False
+        self.resumed_from = 0
+        self.frame_count = 0
+        self.processed_count = 0
+        self.elapsed = 0.0
+        self.encode_ok = None
+        self.stage_stats = []
+
+    @property
+    def ok(self):
+        """视频是否成功打开并处理(输出文件已写出)"""
+        return self.info is not None and (self.info.output_path is None or bool(self.encode_ok))
+
+
+class VideoPipeline:
+    """
+    视频处理流水线
+
+    解码线程 -> 各阶段(调用线程，按帧顺序) -> 编码线程。帧缓冲区来自FramePool，
+    标注原地完成，编码写出后归还。
+    """
+    def __init__(self, stages, show_preview=False, preview_title='Video Processing', timeout=0,
+                 queue_size=8, open_retries=3, encoder_options=None):
+        """
+        参数:
+            stages: 阶段列表，按顺序对每一帧执行
+            show_preview: 是否显示预览窗口
+            preview_title: 预览窗口标题
+            timeout: 超时时间(秒)，0表示不限制；每次run使用独立的截止时间
+            queue_size: 解码/编码队列长度
+            open_retries: 打开视频的重试次数
+            encoder_options: 传给create_video_encoder的额外参数
+        """
+        self.stages = list(stages)
+        self.show_preview = show_preview
+        self.preview_title = preview_title
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.open_retries = open_retries
+        self.encoder_options = encoder_options or {}
+
+    def get_stage(self, name):
+        """按名称获取阶段，不存在时返回None"""
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def _export_checkpoint(self, checkpoint, output_path, result):
+        """拼接已提交的片段作为输出；完成时删除检查点，否则保留以便恢复"""
+        ok = checkpoint.export(output_path)
+        if result.completed and ok:
+            checkpoint.clear()
+        elif checkpoint.state is not None:
+            logger.info(f"任务未完成，已输出前 {checkpoint.state['last_frame']} 帧，"
+                        f"检查点保存在 {checkpoint.directory}")
+        return ok
+
+    def _open_source(self, video_path):
+        """打开视频，失败时重试"""
+        for attempt in range(self.open_retries):
+            try:
+                # 输出需要每一帧，逐帧读取使用OpenCV后端
+                source = open_frame_source(video_path, backend='opencv')
+                if source is not None:
+                    return source
+                logger.warning(f"尝试 {attempt+1}/{self.open_retries}: 无法打开视频文件 {video_path}")
+            except Exception as e:
+                logger.error(f"尝试 {attempt+1}/{self.open_retries} 打开视频失败: {str(e)}")
+            time.sleep(1)
+        logger.error(f"无法打开视频文件 {video_path}，已达到最大重试次数")
+        return None
+
+    def run(self, video_path, output_path=None, start_time=None, fps_override=None, checkpoint=None,
+            cancel_token=None, progress_callback=None, progress_interval=1.0):
+        """
+        处理视频
+
+        参数:
+            video_path: 视频文件路径
+            output_path: 输出视频路径，None表示只分析不输出视频
+            start_time: 视频开始时间(用于时间戳)，None表示当前时间
+            fps_override: 覆盖视频帧率
+            checkpoint: JobCheckpoint实例，提供时按片段编码并定期保存进度，
+                        存在可恢复的检查点时从中断处继续，未完成时输出已完成部分
+            cancel_token: CancellationToken，取消后在当前帧结束处停止并输出已完成部分
+            progress_callback: 进度回调callback(event)，处理过程中发出started/progress/results事件，
+                               结束时发出done事件
+            progress_interval: 进度事件的最小间隔(秒)
+
+        返回:
+            PipelineResult
+        """
+        result = PipelineResult()
+        if checkpoint is not None and not output_path:
+            raise ValueError("启用检查点时必须指定输出路径")
+        if not os.path.exists(video_path):
+            logger.error(f"错误: 视频文件不存在 {video_path}")
+            _report_failure(progress_callback, '视频文件不存在')
+            return result
+
+        logger.info(f"开始处理视频: {video_path}")
+        source = self._open_source(video_path)
+        if source is None:
+            _report_failure(progress_callback, '无法打开视频')
+            return result
+
+        # 异常帧率已由数据源替换为默认值25
+        width, height = source.output_size
+        fps = source.fps
+        if fps_override and fps_override > 0:
+            fps = fps_override
+            logger.info(f"帧率已覆盖为: {fps}")
+        total_frames = source.frame_count
+        if total_frames <= 0:
+            logger.warning("警告: 无法获取总帧数，将尝试处理至视频结束")
+        logger.info(f"视频信息: {width}x{height}, {fps:.2f}fps, 总帧数: {total_frames}")
+
+        # 恢复检查点: 定位到最后提交的帧之后，沿用原任务的开始时间
+        state = None
+        interval_frames = 0
+        if checkpoint is not None:
+            video_info = {'width': width, 'height': height, 'frame_count': total_frames}
+            state = checkpoint.load(video_info)
+            if state and state['last_frame'] > 0 and not source.seek(state['last_frame'] / source.fps, exact=True):
+                logger.warning("无法定位到检查点位置，重新开始处理")
+                state = None
+            if state:
+                start_time = datetime.fromisoformat(state['start_time'])
+                result.resumed_from = state['last_frame']
+                logger.info(f"从检查点恢复: 第 {state['last_frame']} 帧, 已完成 {len(state['segments'])} 个片段")
+            else:
+                start_time = start_time or datetime.now()
+                checkpoint.begin(video_info, start_time)
+            interval_frames = max(1, int(round(checkpoint.interval_seconds * fps)))
+
+        encoder = None
+        if output_path:
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            if checkpoint is not None:
+                encoder = SegmentWriter(checkpoint, width, height, fps, self.encoder_options)
+            else:
+                # 标注帧通过管道直接送入ffmpeg，一次编码生成faststart的H.264 MP4
+                encoder = create_video_encoder(output_path, width, height, fps, **self.encoder_options)
+                if encoder is None:
+                    logger.error("所有编码器都失败，无法创建输出视频")
+                    source.release()
+                    _report_failure(progress_callback, '无法创建输出视频')
+                    return result
+
+        info = PipelineInfo(video_path, output_path, width, height, fps, total_frames,
+                            start_time or datetime.now())
+        result.info = info
+        result.frame_count = result.resumed_from
+        sink = next((stage for stage in self.stages if isinstance(stage, ResultSink)), None)
+        committed_results = 0
+        reporter = None
+        if progress_callback is not None:
+            reporter = ProgressReporter(progress_callback, max(0, total_frames), progress_interval,
+                                        start_frame=result.resumed_from)
+            reporter.start(width=width, height=height, fps=fps, total_frames=max(0, total_frames),
+                           resumed_from=result.resumed_from)
+        stage_stats = [StageStats(stage.name) for stage in self.stages]
+
+        # stop_event停止解码，encode_failed表示编码线程异常退出或需要丢弃剩余帧
+        stop_event = threading.Event()
+        encode_failed = threading.Event()
+        decode_queue = PipelineQueue('decode', maxsize=self.queue_size)
+        encode_queue = PipelineQueue('encode', maxsize=self.queue_size)
+        # 容量覆盖两个队列、正在处理和正在编码的帧
+        frame_pool = FramePool((height, width, 3), max_buffers=self.queue_size * 2 + 4)
+        threads = []
+        show_preview = self.show_preview
+        pbar = tqdm(total=total_frames if total_frames > 0 else None, initial=result.resumed_from,
+                    desc="处理视频", unit="帧")
+        processing_start = time.time()
+        # 每个任务使用自己的截止时间，不依赖进程级的信号，可以在任意线程中运行
+        token = CancellationToken(self.timeout, parent=cancel_token)
+
+        def read_frames():
+            while not stop_event.is_set() and not token.cancelled:
+                buffer = frame_pool.acquire(timeout=0.1)
+                if buffer is None:
+                    continue
+                ret, frame = source.read(buffer)
+                if frame is not buffer:
+                    frame_pool.release(buffer)
+                if not ret:
+                    return
+                yield frame
+
+        def encode_frame(item):
+            if isinstance(item, CheckpointMarker):
+                encoder.commit(item)
+                return
+            image, buffer = item
+            if encoder is not None:
+                encoder.write(image)
+            # 编码器同步写出后缓冲区即可复用
+            frame_pool.release(buffer)
+
+        def make_marker(last_frame):
+            """在处理线程中截取检查点内容，由编码线程写完之前的帧后提交"""
+            nonlocal committed_results
+            new_results = []
+            if sink is not None:
+                new_results = sink.results[committed_results:]
+                committed_results = len(sink.results)
+            stage_state = {}
+            for stage in self.stages:
+                stage_state_dict = stage.state_dict()
+                if stage_state_dict is not None:
+                    stage_state[stage.name] = stage_state_dict
+            return CheckpointMarker(last_frame, new_results, stage_state)
+
+        try:
+            for stage in self.stages:
+                stage.setup(info)
+            if state:
+                if sink is not None:
+                    sink.results = checkpoint.load_results()
+                    committed_results = len(sink.results)
+                for stage in self.stages:
+                    if stage.name in state.get('stages', {}):
+                        stage.load_state(state['stages'][stage.name])
+            last_marker = result.frame_count
+
+            decoder = ProducerStage('decode', read_frames, decode_queue, stop_event)
+            writer = ConsumerStage('encode', encode_frame, encode_queue, encode_failed)
+            threads = [decoder, writer]
+            decoder.start()
+            writer.start()
+            for stats in stage_stats:
+                stats.start()
+
+            for frame in iterate_queue(decode_queue, stop_event):
+                if encode_failed.is_set():
+                    break
+                if token.cancelled:
+                    frame_pool.release(frame)
+                    break
+
+                result.frame_count += 1
+                pbar.update(1)
+                ctx = FrameContext(result.frame_count, frame, info, token)
+                for stage, stats in zip(self.stages, stage_stats):
+                    if token.cancelled:
+                        break
+                    stage_start = time.time()
+                    try:
+                        stage.process(ctx)
+                    except Exception as e:
+                        # 单个阶段出错不影响输出，该帧保持已有的处理结果
+                        logger.error(f"阶段[{stage.name}]处理帧 {ctx.index} 出错: {e}")
+                    stats.record(time.time() - stage_start)
+                if token.cancelled:
+                    # 该帧没有处理完，不输出；从检查点恢复时会重新处理
+                    frame_pool.release(ctx.buffer)
+                    result.frame_count -= 1
+                    break
+                if ctx.inferred:
+                    result.processed_count += 1
+                if reporter is not None:
+                    reporter.update(result.frame_count, result.processed_count,
+                                    sink.results if sink is not None else None)
+
+                if show_preview:
+                    try:
+                        cv2.imshow(self.preview_title, ctx.image)
+                        if cv2.waitKey(1) & 0xFF == ord('q'):  # 按q退出
+                            stop_event.set()
+                    except Exception as preview_error:
+                        logger.error(f"显示预览出错: {preview_error}")
+                        show_preview = False
+                encode_queue.put((ctx.image, ctx.buffer), encode_failed)
+                if checkpoint is not None and ctx.index - last_marker >= interval_frames:
+                    encode_queue.put(make_marker(ctx.index), encode_failed)
+                    last_marker = ctx.index
+            else:
+                result.completed = (not stop_event.is_set() and not token.cancelled
+                                    and decoder.error is None)
+
+            for stats in stage_stats:
+                stats.stop()
+
+            # 正常结束、超时或手动停止时提交最后一段，已处理的帧都不会丢失
+            if checkpoint is not None and result.frame_count > last_marker and not encode_failed.is_set():
+                encode_queue.put(make_marker(result.frame_count), encode_failed)
+
+            # 停止解码线程，通知编码线程写完队列中剩余的帧
+            stop_event.set()
+            decoder.join()
+            encode_queue.put(END_OF_STREAM, encode_failed)
+            writer.join()
+            threads = []
+            log_pipeline_stats([decoder.stats] + stage_stats + [writer.stats],
+                               [decode_queue, encode_queue])
+            pool_stats = frame_pool.stats()
+            logger.info(f"帧缓冲池: 分配 {pool_stats['allocated']} 个({pool_stats['pool_bytes']/1024/1024:.1f} MB), "
+                        f"复用 {pool_stats['reused']} 次")
+            if decoder.error or writer.error:
+                logger.error(f"流水线异常: 解码={decoder.error}, 编码={writer.error}")
+            result.stage_stats = [s.snapshot() for s in [decoder.stats] + stage_stats + [writer.stats]]
+        except KeyboardInterrupt:
+            logger.info("处理被用户中断")
+        except Exception as e:
+            logger.error(f"视频处理出错: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+        finally:
+            stop_event.set()
+            encode_failed.set()
+            for thread in threads:
+                thread.join(timeout=5)
+            pbar.close()
+            source.release()
+            if encoder is not None:
+                # 结束编码，等待ffmpeg写完faststart的MP4
+                result.encode_ok = encoder.close()
+                if checkpoint is not None:
+                    result.encode_ok = self._export_checkpoint(checkpoint, output_path, result)
+                if not result.encode_ok:
+                    logger.error("视频编码失败，输出文件可能不完整")
+            for stage in self.stages:
+                try:
+                    stage.close()
+                except Exception as e:
+                    logger.error(f"关闭阶段[{stage.name}]出错: {e}")
+            if self.show_preview:
+                try:
+                    cv2.destroyAllWindows()
+                except Exception:
+                    pass
+
+        result.elapsed = time.time() - processing_start
+        result.output_path = output_path
+        result.timed_out = token.reason == REASON_TIMEOUT
+        result.cancelled = token.reason == REASON_CANCELLED
+        if result.timed_out:
+            logger.error(f"视频处理超时 ({self.timeout}秒)，已输出完成的部分")
+        elif result.cancelled:
+            logger.info("视频处理已取消，已输出完成的部分")
+        fps_rate = result.processed_count / result.elapsed if result.elapsed > 0 else 0
+        logger.info(f"视频处理完成! 共 {result.frame_count} 帧, 推理 {result.processed_count} 帧, "
+                    f"用时 {result.elapsed:.2f}秒, 推理速率: {fps_rate:.2f} 帧/秒")
+        if output_path:
+            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                logger.info(f"输出视频: {output_path} ({os.path.getsize(output_path)/1024/1024:.2f} MB)")
+            else:
+                logger.warning(f"警告: 输出视频可能有问题，请检查 {output_path}")
+        if reporter is not None:
+            # 先补发最后一批结果，再发结束事件
+            reporter.update(result.frame_count, result.processed_count,
+                            sink.results if sink is not None else None, force=True)
+            reporter.finish(completed=result.completed, timed_out=result.timed_out,
+                            cancelled=result.cancelled, frames_done=result.frame_count,
+                            processed_frames=result.processed_count,
+                            output_ok=bool(result.encode_ok) if output_path else None)
+        return result
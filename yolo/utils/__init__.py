@@ -7,4 +7,9 @@ YOLO工具包
 __version__ = '1.0.0'
 
 # 导出模块
-from .mqtt_module import MQTTModule 
\ No newline at end of file
+from .mqtt_module import MQTTModule
+from .job_queue import JobQueue, JobQueueFull
+from .result_cache import ResultCache
+from .frame_payload import pack_frame, unpack_frame
+from .mqtt_policy import SnapshotPolicy
+from .disk_queue import DiskQueue
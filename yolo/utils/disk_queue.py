@@ -0,0 +1,271 @@
+"""
+磁盘消息队列模块
+
+追加写入的有界磁盘队列，用于在网络中断期间暂存待发送的消息(store-and-forward):
+- 消息依次追加到段文件(<序号>.seg)，写满segment_bytes后换新段
+- 读取位置保存在cursor.json中，消息确认(ack)后才前移，进程重启后从上次位置继续
+- 总大小超过max_bytes或段文件超过max_age时整段删除最旧的消息
+
+记录格式:
+
+    [4字节大端长度][4字节大端CRC32][数据]
+
+打开队列时总是新建写入段，旧段尾部写入中断的不完整记录会被跳过。
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+
+RECORD_HEADER = struct.Struct('>II')
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor.json'
+
+
+class DiskQueue:
+    """
+    有界的追加写入磁盘队列
+
+    peek()读取队首消息，发送成功后调用ack()出队；未确认的消息重启后会再次读出(至少一次)。
+    """
+    def __init__(self, directory, segment_bytes=4 * 1024 ** 2, max_bytes=64 * 1024 ** 2,
+                 max_age=24 * 3600, fsync=False):
+        """
+        参数:
+            directory: 队列目录
+            segment_bytes: 单个段文件的大小上限(字节)
+            max_bytes: 队列占用的磁盘上限(字节)，超出时删除最旧的段
+            max_age: 段文件的最长保留时间(秒)，按段的最后写入时间计算
+            fsync: 每条消息写入后是否fsync(更可靠，但写入明显更慢)
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._sizes = {}   # 段序号 -> 字节数
+        self._counts = {}  # 段序号 -> 完整记录数
+        for name in os.listdir(directory):
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit():
+                seq = int(name[:-len(SEGMENT_SUFFIX)])
+                self._sizes[seq], self._counts[seq] = self._scan(seq)
+
+        # 读取位置: (段序号, 偏移, 该段已读记录数)
+        self._read_seq, self._read_offset, self._read_index = self._load_cursor()
+        for seq in [s for s in self._sizes if s < self._read_seq]:
+            self._delete_segment(seq)
+        if self._read_seq not in self._sizes:
+            self._read_seq = min(self._sizes) if self._sizes else 0
+            self._read_offset = self._read_index = 0
+        self._pending = sum(count for seq, count in self._counts.items()) - self._read_index
+        self._next_offset = None
+        self._reader = None  # (段序号, 文件)
+
+        self._write_seq = max(self._sizes) + 1 if self._sizes else self._read_seq
+        self._writer = None
+        self.written = 0
+        self.acked = 0
+        self.dropped = 0
+
+    def put(self, data):
+        """
+        追加一条消息
+
+        参数:
+            data: 消息字节
+
+        返回:
+            bool: 是否写入成功
+        """
+        data = bytes(data)
+        record = RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data
+        with self._lock:
+            if self._writer is None or self._sizes[self._write_seq] >= self.segment_bytes:
+                self._rotate()
+            self._writer.write(record)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._sizes[self._write_seq] += len(record)
+            self._counts[self._write_seq] += 1
+            self._pending += 1
+            self.written += 1
+            self._enforce_limits()
+        return True
+
+    def peek(self):
+        """
+        读取队首消息(不出队)
+
+        返回:
+            bytes: 消息，队列为空时返回None
+        """
+        with self._lock:
+            self._expire()
+            while self._pending > 0:
+                data, next_offset = self._read_record(self._read_seq, self._read_offset)
+                if data is not None:
+                    self._next_offset = next_offset
+                    return data
+                if self._read_seq == self._write_seq:
+                    return None
+                # 当前段已读完(或尾部记录不完整)，转到下一段
+                self._advance_segment()
+            return None
+
+    def ack(self):
+        """确认peek()读出的消息，使其出队"""
+        with self._lock:
+            if self._next_offset is None:
+                return
+            self._read_offset = self._next_offset
+            self._read_index += 1
+            self._next_offset = None
+            self._pending -= 1
+            self.acked += 1
+            self._save_cursor()
+
+    def __len__(self):
+        with self._lock:
+            return self._pending
+
+    def stats(self):
+        """
+        队列统计
+
+        返回:
+            dict: {'pending', 'segments', 'bytes', 'written', 'acked', 'dropped'}
+        """
+        with self._lock:
+            return {
+                'pending': self._pending,
+                'segments': len(self._sizes),
+                'bytes': sum(self._sizes.values()),
+                'written': self.written,
+                'acked': self.acked,
+                'dropped': self.dropped
+            }
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._close_reader()
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _scan(self, seq):
+        """统计段文件的大小和完整记录数"""
+        count = 0
+        offset = 0
+        size = os.path.getsize(self._path(seq))
+        with open(self._path(seq), 'rb') as f:
+            while offset + RECORD_HEADER.size <= size:
+                length, _ = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                if offset + RECORD_HEADER.size + length > size:
+                    break
+                f.seek(length, os.SEEK_CUR)
+                offset += RECORD_HEADER.size + length
+                count += 1
+        return size, count
+
+    def _read_record(self, seq, offset):
+        """读取一条记录，返回(数据, 下一条记录的偏移)，没有完整的记录时返回(None, offset)(调用时需持有锁)"""
+        if self._reader is None or self._reader[0] != seq:
+            self._close_reader()
+            self._reader = (seq, open(self._path(seq), 'rb'))
+        f = self._reader[1]
+        f.seek(offset)
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None, offset
+        length, crc = RECORD_HEADER.unpack(header)
+        data = f.read(length)
+        if len(data) < length or zlib.crc32(data) != crc:
+            return None, offset
+        return data, offset + RECORD_HEADER.size + length
+
+    def _rotate(self):
+        """开始新的写入段(调用时需持有锁)"""
+        if self._writer is not None:
+            self._writer.close()
+            self._write_seq += 1
+        self._writer = open(self._path(self._write_seq), 'ab')
+        self._sizes[self._write_seq] = 0
+        self._counts[self._write_seq] = 0
+
+    def _advance_segment(self):
+        """当前读取段处理完毕，删除并转到下一段(调用时需持有锁)"""
+        # 跳过的不完整记录不再计入待发送数
+        self._pending -= self._counts.get(self._read_seq, 0) - self._read_index
+        self._delete_segment(self._read_seq)
+        later = [s for s in self._sizes if s > self._read_seq]
+        self._read_seq = min(later) if later else self._write_seq
+        self._read_offset = self._read_index = 0
+        self._next_offset = None
+        self._save_cursor()
+
+    def _drop_oldest(self):
+        """删除最旧的段(调用时需持有锁)"""
+        oldest = min(self._sizes)
+        if oldest == self._read_seq:
+            dropped = self._counts[oldest] - self._read_index
+            self._advance_segment()
+        else:
+            dropped = self._counts[oldest]
+            self._pending -= dropped
+            self._delete_segment(oldest)
+        self.dropped += dropped
+
+    def _enforce_limits(self):
+        """超过容量上限时删除最旧的段，写入段除外(调用时需持有锁)"""
+        while sum(self._sizes.values()) > self.max_bytes and len(self._sizes) > 1:
+            self._drop_oldest()
+
+    def _expire(self):
+        """删除超过保留时间的段，写入段除外(调用时需持有锁)"""
+        deadline = time.time() - self.max_age
+        while len(self._sizes) > 1:
+            oldest = min(self._sizes)
+            if oldest == self._write_seq or os.path.getmtime(self._path(oldest)) >= deadline:
+                break
+            self._drop_oldest()
+
+    def _delete_segment(self, seq):
+        if self._reader is not None and self._reader[0] == seq:
+            self._close_reader()
+        self._sizes.pop(seq, None)
+        self._counts.pop(seq, None)
+        try:
+            os.remove(self._path(seq))
+        except OSError:
+            pass
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader[1].close()
+            self._reader = None
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), 'r', encoding='utf-8') as f:
+                cursor = json.load(f)
+            return int(cursor['segment']), int(cursor['offset']), int(cursor['index'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0, 0
+
+    def _save_cursor(self):
+        """原子地保存读取位置(调用时需持有锁)"""
+        path = os.path.join(self.directory, CURSOR_FILE)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'segment': self._read_seq, 'offset': self._read_offset, 'index': self._read_index}, f)
+        os.replace(temp_path, path)
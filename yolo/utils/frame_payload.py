@@ -0,0 +1,49 @@
+"""
+二进制帧消息模块
+
+检测帧以二进制消息传输，避免Base64编码(体积增加约1/3)和大段JSON字符串的编解码开销:
+
+    [4字节大端头部长度][UTF-8 JSON头部][JPEG字节]
+
+头部只包含时间戳、检测结果等小字段，图像原样附在其后。
+"""
+
+import json
+import struct
+
+HEADER_LENGTH = struct.Struct('>I')
+
+
+def pack_frame(header, image_bytes=b''):
+    """
+    打包二进制帧消息
+
+    参数:
+        header: 可JSON序列化的头部(如检测结果)
+        image_bytes: 编码后的图像字节
+
+    返回:
+        bytes: 消息
+    """
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return b''.join((HEADER_LENGTH.pack(len(header_bytes)), header_bytes, bytes(image_bytes)))
+
+
+def unpack_frame(payload):
+    """
+    解析二进制帧消息
+
+    参数:
+        payload: pack_frame生成的字节
+
+    返回:
+        tuple: (header, image_bytes)
+    """
+    if len(payload) < HEADER_LENGTH.size:
+        raise ValueError("消息长度不足")
+    (length,) = HEADER_LENGTH.unpack_from(payload)
+    end = HEADER_LENGTH.size + length
+    if end > len(payload):
+        raise ValueError("头部长度超出消息长度")
+    header = json.loads(bytes(payload[HEADER_LENGTH.size:end]).decode('utf-8'))
+    return header, bytes(payload[end:])
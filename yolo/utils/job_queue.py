@@ -0,0 +1,395 @@
+"""
+异步任务队列模块
+
+此模块提供进程内的任务队列和工作线程池，用于把耗时的视频处理从HTTP请求中移出:
+- 提交任务立即返回任务ID，之后通过状态/结果/取消接口查询和控制
+- 工作线程数即并发上限；按优先级调度，同优先级先进先出
+- 结果和输出文件保留到被取走或过期，过期后删除记录和文件
+- 可选SQLite持久化，服务重启后未完成的任务重新排队(不依赖外部服务)
+"""
+
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+import itertools
+import traceback
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class Job:
+    """任务记录"""
+    def __init__(self, job_id, kind, payload, priority=0, seq=0, files=None):
+        self.job_id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.priority = priority
+        self.seq = seq
+        self.files = list(files or [])
+        self.status = STATUS_QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.expires_at = None
+        self.fetched = False
+        self.cancel_requested = False
+
+    def to_dict(self, include_result=False):
+        """任务状态(可选包含结果)"""
+        info = {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'expires_at': self.expires_at,
+            'error': self.error
+        }
+        if include_result:
+            info['result'] = self.result
+        return info
+
+
+class SQLiteJobStore:
+    """
+    任务记录的SQLite持久化
+
+    运行时以内存中的记录为准，每次状态变化时写入数据库，启动时读回。
+    """
+    COLUMNS = ('job_id', 'kind', 'payload', 'priority', 'seq', 'files', 'status', 'result', 'error',
+               'submitted_at', 'started_at', 'finished_at', 'expires_at', 'fetched')
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, kind TEXT, payload TEXT, priority INTEGER, seq INTEGER, "
+                "files TEXT, status TEXT, result TEXT, error TEXT, submitted_at REAL, started_at REAL, "
+                "finished_at REAL, expires_at REAL, fetched INTEGER)")
+
+    def save(self, job):
+        row = (job.job_id, job.kind, json.dumps(job.payload, ensure_ascii=False), job.priority, job.seq,
+               json.dumps(job.files), job.status, json.dumps(job.result, ensure_ascii=False), job.error,
+               job.submitted_at, job.started_at, job.finished_at, job.expires_at, int(job.fetched))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))})", row)
+
+    def delete(self, job_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def load_all(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs ORDER BY seq").fetchall()
+        jobs = []
+        for row in rows:
+            data = dict(zip(self.COLUMNS, row))
+            job = Job(data['job_id'], data['kind'], json.loads(data['payload']),
+                      data['priority'], data['seq'], json.loads(data['files']))
+            job.status = data['status']
+            job.result = json.loads(data['result']) if data['result'] else None
+            job.error = data['error']
+            job.submitted_at = data['submitted_at']
+            job.started_at = data['started_at']
+            job.finished_at = data['finished_at']
+            job.expires_at = data['expires_at']
+            job.fetched = bool(data['fetched'])
+            jobs.append(job)
+        return jobs
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """
+    任务队列和工作线程池
+
+    处理函数按任务类型注册: handler(job)，返回值作为任务结果(需可JSON序列化)；
+    处理函数应定期检查job.cancel_requested，或通过on_cancel回调接入自己的取消机制。
+    """
+    def __init__(self, workers=2, db_path=None, result_ttl=3600, fetched_ttl=300,
+                 max_pending=100, on_cancel=None, logger=None):
+        """
+        参数:
+            workers: 工作线程数(并发上限)
+            db_path: SQLite数据库路径，None时只保存在内存中
+            result_ttl: 完成后结果和文件的保留时间(秒)
+            fetched_ttl: 结果被取走后的保留时间(秒)，便于客户端重试
+            max_pending: 最大排队任务数
+            on_cancel: 取消运行中任务时的回调on_cancel(job_id)
+            logger: 日志函数(默认print)
+        """
+        self.workers = max(1, workers)
+        self.result_ttl = result_ttl
+        self.fetched_ttl = fetched_ttl
+        self.max_pending = max_pending
+        self.on_cancel = on_cancel
+        self.log = logger or print
+
+        self._handlers = {}
+        self._jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._store = SQLiteJobStore(db_path) if db_path else None
+        if self._store:
+            self._restore()
+
+    def register_handler(self, kind, handler):
+        """注册任务类型的处理函数"""
+        self._handlers[kind] = handler
+
+    def _restore(self):
+        """读回持久化的任务，中断的任务重新排队"""
+        jobs = self._store.load_all()
+        max_seq = -1
+        for job in jobs:
+            max_seq = max(max_seq, job.seq)
+            if job.status in (STATUS_QUEUED, STATUS_RUNNING):
+                job.status = STATUS_QUEUED
+                job.started_at = None
+                heapq.heappush(self._heap, (-job.priority, job.seq, job.job_id))
+            self._jobs[job.job_id] = job
+        self._seq = itertools.count(max_seq + 1)
+        if self._heap:
+            self.log(f"恢复 {len(self._heap)} 个未完成的任务")
+
+    def start(self):
+        """启动工作线程和过期清理线程"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        janitor = threading.Thread(target=self._janitor, name="job-janitor", daemon=True)
+        janitor.start()
+        self._threads.append(janitor)
+
+    def stop(self, timeout=None):
+        """停止工作线程(运行中的任务会执行完)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, kind, payload, job_id, priority=0, files=None):
+        """
+        提交任务
+
+        参数:
+            kind: 任务类型
+            payload: 任务参数(需可JSON序列化)
+            job_id: 任务ID
+            priority: 优先级，数值大的先执行
+            files: 与任务关联的文件，任务记录过期时一并删除
+
+        返回:
+            Job
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        with self._cond:
+            if job_id in self._jobs:
+                raise ValueError(f"任务ID已存在: {job_id}")
+            pending = sum(1 for j in self._jobs.values() if j.status == STATUS_QUEUED)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"排队任务数已达上限: {self.max_pending}")
+            job = Job(job_id, kind, payload, priority, next(self._seq), files)
+            self._jobs[job_id] = job
+            heapq.heappush(self._heap, (-priority, job.seq, job_id))
+            self._save(job)
+            self._cond.notify_all()
+        return job
+
+    def add_completed(self, kind, job_id, result, files=None):
+        """
+        登记一个无需执行的已完成任务(如结果来自缓存)，使其可以通过状态/结果接口查询
+
+        返回:
+            Job
+        """
+        with self._cond:
+            if job_id in self._jobs:
+                raise ValueError(f"任务ID已存在: {job_id}")
+            job = Job(job_id, kind, None, seq=next(self._seq), files=files)
+            job.started_at = job.submitted_at
+            self._jobs[job_id] = job
+            self._finish(job, STATUS_DONE, result)
+        return job
+
+    def status(self, job_id):
+        """
+        查询任务状态
+
+        返回:
+            dict: 任务状态(排队中的任务包含position)，不存在时返回None
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            info = job.to_dict()
+            if job.status == STATUS_QUEUED:
+                info['position'] = sum(1 for p, s, jid in self._heap
+                                       if self._jobs.get(jid) is not None
+                                       and self._jobs[jid].status == STATUS_QUEUED
+                                       and (p, s) < (-job.priority, job.seq))
+        return info
+
+    def result(self, job_id):
+        """
+        获取任务结果，取走后记录在fetched_ttl秒后过期
+
+        返回:
+            dict: 包含结果的任务状态，不存在时返回None
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status in FINISHED_STATUSES and not job.fetched:
+                job.fetched = True
+                job.expires_at = min(job.expires_at or float('inf'), time.time() + self.fetched_ttl)
+                self._save(job)
+            return job.to_dict(include_result=True)
+
+    def cancel(self, job_id):
+        """
+        取消任务: 排队中的任务直接取消，运行中的任务通知处理函数停止
+
+        返回:
+            str: 取消后的任务状态，任务不存在时返回None
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.status == STATUS_QUEUED:
+                self._finish(job, STATUS_CANCELLED)
+                return job.status
+            if job.status != STATUS_RUNNING:
+                return job.status
+            job.cancel_requested = True
+        if self.on_cancel:
+            try:
+                self.on_cancel(job_id)
+            except Exception as e:
+                self.log(f"取消任务回调出错 {job_id}: {e}")
+        return STATUS_RUNNING
+
+    def list(self):
+        """列出所有任务的状态"""
+        with self._cond:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.seq)
+            return [job.to_dict() for job in jobs]
+
+    def retained_files(self):
+        """未过期任务关联的文件，临时文件清理时应跳过"""
+        with self._cond:
+            return {path for job in self._jobs.values() for path in job.files}
+
+    def _save(self, job):
+        if self._store:
+            try:
+                self._store.save(job)
+            except Exception as e:
+                self.log(f"保存任务记录失败 {job.job_id}: {e}")
+
+    def _finish(self, job, status, result=None, error=None):
+        """记录任务结束(调用时需持有锁)"""
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.expires_at = job.finished_at + self.result_ttl
+        self._save(job)
+
+    def _next_job(self):
+        """取出下一个排队的任务，队列为空时等待"""
+        with self._cond:
+            while self._running:
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(job_id)
+                    # 已取消的任务留在堆中，取出时跳过
+                    if job is not None and job.status == STATUS_QUEUED:
+                        job.status = STATUS_RUNNING
+                        job.started_at = time.time()
+                        self._save(job)
+                        return job
+                self._cond.wait()
+        return None
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self.log(f"开始执行任务 {job.job_id} ({job.kind})")
+            try:
+                result = self._handlers[job.kind](job)
+                status, error = (STATUS_CANCELLED if job.cancel_requested else STATUS_DONE), None
+            except Exception as e:
+                traceback.print_exc()
+                result, status, error = None, STATUS_FAILED, str(e)
+            with self._cond:
+                self._finish(job, status, result, error)
+            self.log(f"任务 {job.job_id} 结束: {status}")
+
+    def _janitor(self, interval=30.0):
+        """定期删除过期的任务记录和文件"""
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.time()
+                expired = [job for job in self._jobs.values()
+                           if job.status in FINISHED_STATUSES and job.expires_at and job.expires_at <= now]
+                for job in expired:
+                    del self._jobs[job.job_id]
+                    if self._store:
+                        self._store.delete(job.job_id)
+            for job in expired:
+                for path in job.files:
+                    try:
+                        if os.path.exists(path):
+                            os.remove(path)
+                    except OSError as e:
+                        self.log(f"删除任务文件失败 {path}: {e}")
+            with self._cond:
+                if self._running:
+                    self._cond.wait(interval)
@@ -5,13 +5,44 @@ MQTT通信模块
 """
 
 import paho.mqtt.client as mqtt
+import os
 import json
 import time
 import threading
-from queue import Queue, Empty
+from collections import deque, OrderedDict
+
+from .frame_payload import pack_frame, unpack_frame
+from .disk_queue import DiskQueue
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import cbor2
+    HAS_CBOR = True
+except ImportError:
+    HAS_CBOR = False
+
+# 发布通道，按优先级从高到低
+LANE_ALARM = 'alarm'    # 报警命令: 不丢弃，最先发布
+LANE_NORMAL = 'normal'  # 普通消息: 有界队列，满时丢弃最旧的消息
+LANE_FRAME = 'frame'    # 检测帧: 同一主题(和摄像头)只保留最新一条
+
+# 断开期间暂存到磁盘的消息: 报警单独一个队列，重连后先于其他消息重放；
+# 检测帧在断开期间留在内存中按主题(和摄像头)合并，只在进程退出时把每个主题最新的一帧写入单独的队列，
+# 不占用普通消息的容量
+SPOOL_ALARM = 'alarm'
+SPOOL_DATA = 'data'
+SPOOL_FRAME = 'frame'
 
 class MQTTModule:
-    def __init__(self, client_id, broker="117.72.120.52", port=1883, topic="alarm/command", qos=0, max_queue_size=100, keep_alive=60, reconnect_delay=5, clean_session=True):
+    def __init__(self, client_id, broker="117.72.120.52", port=1883, topic="alarm/command", qos=0, max_queue_size=100, keep_alive=60, reconnect_delay=5, clean_session=True, lane_qos=None, payload_format='json',
+                 spool_dir=None, spool_max_bytes=64 * 1024 ** 2, spool_max_age=24 * 3600, replay_rate=20.0,
+                 spool_lanes=(LANE_ALARM, LANE_NORMAL, LANE_FRAME), frame_spool_max_bytes=8 * 1024 ** 2,
+                 client=None):
         """
         初始化MQTT客户端
         
@@ -21,10 +52,20 @@ class MQTTModule:
             port: MQTT代理服务器端口
             topic: 发布主题
             qos: 服务质量级别(0, 1, 2)
-            max_queue_size: 最大队列大小
+            max_queue_size: 普通通道的最大队列大小
             keep_alive: 保持连接时间(秒)
             reconnect_delay: 重连延迟时间(秒)
             clean_session: 是否使用干净的会话
+            lane_qos: 各通道的QoS{'alarm': 1, 'normal': qos, 'frame': qos}
+            payload_format: 对象消息的编码'json'、'msgpack'或'cbor'(后两者需要安装对应的包，图像以原始字节嵌入)
+            spool_dir: 断开期间暂存消息的磁盘目录，None时不暂存(断开期间只有报警命令在内存中排队)
+            spool_max_bytes: 每个磁盘队列的容量上限(字节)，超出时丢弃最旧的消息
+            spool_max_age: 暂存消息的最长保留时间(秒)
+            replay_rate: 重连后每秒最多重放的暂存消息数，避免重放挤占实时消息
+            spool_lanes: 断开期间需要保留的通道(检测帧在内存中合并，重连后发布每个主题和摄像头最新的一帧)
+            frame_spool_max_bytes: 检测帧磁盘队列的容量上限(字节)，只在进程退出时写入
+            client: 替代paho客户端的对象(需实现connect、loop_start、loop_stop、disconnect、publish、
+                    reconnect_delay_set和on_connect/on_disconnect回调)，用于接入进程内的代理替身
         """
         self.client_id = client_id
         self.broker = broker
@@ -38,19 +79,56 @@ class MQTTModule:
         if self.broker.startswith("mqtt://"):
             self.broker = self.broker[7:]
         
-        try:
-            # 尝试使用新版paho-mqtt 2.0+的参数
-            self.client = mqtt.Client(client_id=client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
-        except (AttributeError, TypeError):
-            # 回退到旧版paho-mqtt的参数
-            self.client = mqtt.Client(client_id)
+        if client is not None:
+            self.client = client
+        else:
+            try:
+                # 尝试使用新版paho-mqtt 2.0+的参数
+                self.client = mqtt.Client(client_id=client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION1)
+            except (AttributeError, TypeError):
+                # 回退到旧版paho-mqtt的参数
+                self.client = mqtt.Client(client_id)
         self.connected = False
         self.paused = False
         self.log_info = print
         self.log_error = print
         
-        # 添加消息队列和处理线程
-        self.message_queue = Queue(maxsize=max_queue_size)
+        # 对象消息的编码格式，缺少对应的包时退回JSON
+        if payload_format == 'msgpack' and not HAS_MSGPACK:
+            self.log_error("未安装msgpack，MQTT消息改用JSON编码")
+            payload_format = 'json'
+        elif payload_format == 'cbor' and not HAS_CBOR:
+            self.log_error("未安装cbor2，MQTT消息改用JSON编码")
+            payload_format = 'json'
+        self.payload_format = payload_format
+        
+        # 分通道的消息队列: 报警命令优先且不丢弃，检测帧按主题合并只保留最新，其余消息有界
+        self.max_queue_size = max_queue_size
+        self.lane_qos = {LANE_ALARM: 1, LANE_NORMAL: qos, LANE_FRAME: qos}
+        self.lane_qos.update(lane_qos or {})
+        self.lane_stats = {lane: {'enqueued': 0, 'published': 0, 'dropped': 0, 'coalesced': 0, 'requeued': 0,
+                                  'spooled': 0, 'replayed': 0}
+                           for lane in (LANE_ALARM, LANE_NORMAL, LANE_FRAME)}
+        self._alarm_queue = deque()
+        self._normal_queue = deque()
+        self._frame_slots = OrderedDict()
+        self._queue_cond = threading.Condition()
+        
+        # 断开期间的消息写入磁盘队列，重连后按replay_rate限速重放(报警优先)
+        self.spool = None
+        self.spool_lanes = tuple(spool_lanes)
+        self.replay_interval = 1.0 / replay_rate if replay_rate else 0.0
+        self._next_replay = 0.0
+        if spool_dir:
+            spool_limits = {SPOOL_ALARM: spool_max_bytes, SPOOL_DATA: spool_max_bytes,
+                            SPOOL_FRAME: frame_spool_max_bytes}
+            self.spool = {
+                name: DiskQueue(os.path.join(spool_dir, name), max_bytes=max_bytes, max_age=spool_max_age)
+                for name, max_bytes in spool_limits.items()
+            }
+            pending = sum(len(q) for q in self.spool.values())
+            if pending:
+                self.log_info(f"MQTT磁盘队列中有 {pending} 条待重放的消息")
         self.worker_thread = None
         self.should_stop = False
         
@@ -76,8 +154,9 @@ class MQTTModule:
             
             # 启动消息处理线程
             self.should_stop = False
-            self.worker_thread = threading.Thread(target=self._message_worker, daemon=True)
-            self.worker_thread.start()
+            if not (self.worker_thread and self.worker_thread.is_alive()):
+                self.worker_thread = threading.Thread(target=self._message_worker, daemon=True)
+                self.worker_thread.start()
             
             return True
         except Exception as e:
@@ -90,6 +169,9 @@ class MQTTModule:
         if rc == 0:
             self.connected = True
             self.log_info(f"MQTT客户端已成功连接到 {self.broker}:{self.port}")
+            # 唤醒消息线程，开始发布排队的报警和重放磁盘队列
+            with self._queue_cond:
+                self._queue_cond.notify()
         else:
             error_messages = {
                 1: "连接被拒绝 - 协议版本错误",
@@ -109,6 +191,9 @@ class MQTTModule:
         else:
             self.log_info("MQTT客户端已正常断开连接")
         self.connected = False
+        if self.spool is not None:
+            # 检测帧留在内存中继续合并，重连后只发布最新的一帧
+            self._spool_pending(include_frames=False)
             
     def disconnect(self):
         """断开MQTT连接"""
@@ -122,6 +207,11 @@ class MQTTModule:
             self.client.disconnect()
             self.connected = False
             self.log_info("MQTT客户端已断开连接")
+        if self.spool is not None:
+            # 未发布的消息留到下次启动后重放
+            self._spool_pending()
+            for queue in self.spool.values():
+                queue.close()
             
     def is_connected(self):
         """检查是否已连接"""
@@ -141,45 +231,50 @@ class MQTTModule:
         """检查是否已暂停"""
         return self.paused
         
-    def publish(self, message_str):
+    def publish(self, message_str, topic=None):
         """
-        发布简单字符串消息
+        发布简单字符串消息(普通通道，队列满时丢弃最旧的消息)
         
         参数:
             message_str: 要发布的字符串消息
+            topic: 发布主题(默认为self.topic)
         """
-        if not self.connected or self.paused:
+        if not self._accepting(LANE_NORMAL):
             return False
-            
-        try:
-            # 将消息添加到队列
-            try:
-                self.message_queue.put_nowait({"topic": self.topic, "message": message_str, "qos": self.qos})
-                self.log_info(f"已将消息 '{message_str}' 加入MQTT发布队列")
-                return True
-            except Queue.Full:
-                self.log_error("MQTT消息队列已满，消息被丢弃")
-                return False
-        except Exception as e:
-            self.log_error(f"MQTT发布失败: {e}")
+        return self._enqueue(LANE_NORMAL, topic or self.topic, message_str)
+    
+    def publish_command(self, command, topic=None):
+        """
+        发布报警命令(报警通道)
+        
+        报警命令不会被丢弃，总是先于其他消息发布；MQTT断开期间保留在队列(或磁盘队列)中，重连后发出。
+        
+        参数:
+            command: 命令字符串，如'accident'
+            topic: 发布主题(默认为self.topic)
+        """
+        if self.paused:
             return False
+        queued = self._enqueue(LANE_ALARM, topic or self.topic, command)
+        if queued:
+            self.log_info(f"已将报警命令 '{command}' 加入MQTT发布队列")
+        return queued
         
-    def publish_detection(self, detections, image_base64=None):
+    def publish_detection(self, detections, image_base64=None, image_bytes=None, **fields):
         """
-        发布检测结果
+        发布检测结果(帧通道，同一主题和摄像头只保留最新一条)
         
         参数:
             detections: 检测结果列表
             image_base64: 可选的Base64编码图像
+            image_bytes: 可选的JPEG图像字节，提供时以二进制消息发布(格式见frame_payload)
+            **fields: 附加到消息中的其他字段(如camera_id)
         """
-        if not self.connected or self.paused:
+        if not self._accepting(LANE_FRAME):
             return False
             
         try:
-            # 精简消息数据，减少传输量
-            # 1. 对于image_base64，如果长度超过一定限制，可以减小图像质量或尺寸
-            # 2. 对于detections，可以过滤掉低置信度的结果
-            
+            # 精简消息数据，减少传输量，只保留置信度较高的检测结果
             filtered_detections = []
             if detections and len(detections) > 0:
                 # 只保留置信度大于0.4的检测结果
@@ -194,46 +289,33 @@ class MQTTModule:
                 "timestamp": time.time(),
                 "detections": filtered_detections
             }
+            message.update(fields)
             
             # 可选地发送图像（较大的数据）
-            if image_base64:
+            if image_bytes is not None and self.payload_format != 'json':
+                # MessagePack/CBOR可以直接嵌入字节
+                message["image"] = bytes(image_bytes)
+            elif image_bytes is not None:
+                # 二进制消息: 检测结果放在头部，JPEG原样附在后面
+                message = pack_frame(message, image_bytes)
+            elif image_base64:
                 message["image"] = image_base64
             
-            # 将消息添加到队列
-            try:
-                self.message_queue.put_nowait({"topic": self.topic, "message": message, "qos": self.qos})
-                return True
-            except Queue.Full:
-                self.log_error("MQTT消息队列已满，消息被丢弃")
-                # 尝试清理队列
-                try:
-                    # 移除一半的旧消息
-                    half_size = self.message_queue.qsize() // 2
-                    for _ in range(half_size):
-                        try:
-                            self.message_queue.get_nowait()
-                            self.message_queue.task_done()
-                        except Empty:
-                            break
-                    # 重新尝试添加最新消息
-                    self.message_queue.put_nowait({"topic": self.topic, "message": message, "qos": self.qos})
-                    self.log_info("已清理消息队列并添加新消息")
-                    return True
-                except:
-                    return False
+            # 同一主题、同一摄像头的帧只保留最新一条，旧帧被覆盖
+            return self._enqueue(LANE_FRAME, self.topic, message, key=(self.topic, fields.get("camera_id")))
         except Exception as e:
             self.log_error(f"MQTT发布失败: {e}")
             return False
     
     def publish_batch(self, batch_detections, batch_images=None):
         """
-        批量发布多组检测结果
+        批量发布多组检测结果(普通通道)
         
         参数:
             batch_detections: 多组检测结果列表
             batch_images: 可选的多组Base64编码图像
         """
-        if not self.connected or self.paused:
+        if not self._accepting(LANE_NORMAL):
             return False
         
         success_count = 0
@@ -249,12 +331,8 @@ class MQTTModule:
                 if batch_images and i < len(batch_images):
                     message["image"] = batch_images[i]
                 
-                try:
-                    self.message_queue.put_nowait({"topic": self.topic, "message": message, "qos": self.qos})
+                if self._enqueue(LANE_NORMAL, self.topic, message):
                     success_count += 1
-                except Queue.Full:
-                    self.log_error("MQTT消息队列已满，剩余消息被丢弃")
-                    break
             
             if success_count > 0:
                 self.log_info(f"批量发布: 已将 {success_count}/{total_count} 条消息加入队列")
@@ -264,61 +342,237 @@ class MQTTModule:
             self.log_error(f"MQTT批量发布失败: {e}")
             return False
     
+    def _accepting(self, lane):
+        """通道当前是否接收消息: 已连接，或断开期间该通道会暂存到磁盘"""
+        if self.paused:
+            return False
+        return self.connected or (self.spool is not None and lane in self.spool_lanes)
+    
+    def _enqueue(self, lane, topic, message, key=None):
+        """
+        把消息加入通道
+        
+        报警通道不限长度；帧通道按key合并，只保留最新一条；普通通道满时丢弃最旧的消息。
+        断开期间启用了磁盘队列的报警和普通通道直接写入磁盘，帧通道仍在内存中合并。
+        """
+        if (lane != LANE_FRAME and not self.connected
+                and self.spool is not None and lane in self.spool_lanes):
+            return self._spool_message(lane, topic, message)
+        with self._queue_cond:
+            counters = self.lane_stats[lane]
+            item = (topic, message)
+            if lane == LANE_ALARM:
+                self._alarm_queue.append(item)
+            elif lane == LANE_FRAME:
+                if key in self._frame_slots:
+                    counters['coalesced'] += 1
+                    del self._frame_slots[key]  # 重新插入到末尾，保持按更新时间轮转发布
+                self._frame_slots[key] = item
+            else:
+                if len(self._normal_queue) >= self.max_queue_size:
+                    self._normal_queue.popleft()
+                    counters['dropped'] += 1
+                self._normal_queue.append(item)
+            counters['enqueued'] += 1
+            self._queue_cond.notify()
+        return True
+    
+    def _dequeue(self, timeout):
+        """
+        按优先级取出下一条消息: 报警 > 暂存的报警 > 普通 > 暂存的其他消息 > 帧
+        
+        暂存消息按replay_rate限速重放，由调用方在发布成功后确认。
+        
+        返回:
+            tuple: (lane, topic, message, spool)，spool为消息所在的磁盘队列(内存消息为None)，超时返回None
+        """
+        with self._queue_cond:
+            # 断开期间报警命令和检测帧保留在内存中，等待重连
+            alarm_ready = lambda: self._alarm_queue and self.connected
+            frame_ready = lambda: self._frame_slots and self.connected
+            if not (alarm_ready() or self._normal_queue or frame_ready()):
+                wait = timeout
+                if self._replay_pending():
+                    wait = min(timeout, max(0.0, self._next_replay - time.time()))
+                if wait > 0:
+                    self._queue_cond.wait(wait)
+            if alarm_ready():
+                return (LANE_ALARM,) + self._alarm_queue.popleft() + (None,)
+            replay = self._replay_ready()
+            if replay and replay[3] is self.spool[SPOOL_ALARM]:
+                return replay
+            if self._normal_queue:
+                return (LANE_NORMAL,) + self._normal_queue.popleft() + (None,)
+            if replay:
+                return replay
+            if frame_ready():
+                key = next(iter(self._frame_slots))
+                return (LANE_FRAME,) + self._frame_slots.pop(key) + (None,)
+            return None
+    
+    def _replay_pending(self):
+        """是否有等待重放的暂存消息"""
+        return self.connected and self.spool is not None and any(len(q) for q in self.spool.values())
+    
+    def _replay_ready(self):
+        """
+        到达重放间隔时读取下一条暂存消息(报警优先，调用时需持有_queue_cond)
+        
+        返回:
+            tuple: (lane, topic, payload, spool)，没有可重放的消息时返回None
+        """
+        if not self._replay_pending() or time.time() < self._next_replay:
+            return None
+        for name in (SPOOL_ALARM, SPOOL_DATA, SPOOL_FRAME):
+            queue = self.spool[name]
+            while True:
+                record = queue.peek()
+                if record is None:
+                    break
+                try:
+                    header, payload = unpack_frame(record)
+                except ValueError:
+                    self.log_error("MQTT磁盘队列中的消息已损坏，跳过")
+                    queue.ack()
+                    continue
+                self._next_replay = time.time() + self.replay_interval
+                return (header['lane'], header['topic'], payload, queue)
+        return None
+    
+    def _spool_message(self, lane, topic, message):
+        """把消息写入磁盘队列"""
+        try:
+            payload = self._serialize(message)
+            if isinstance(payload, str):
+                payload = payload.encode('utf-8')
+            queue = self.spool[{LANE_ALARM: SPOOL_ALARM, LANE_FRAME: SPOOL_FRAME}.get(lane, SPOOL_DATA)]
+            queue.put(pack_frame({'lane': lane, 'topic': topic, 'ts': time.time()}, payload))
+            self.lane_stats[lane]['spooled'] += 1
+            return True
+        except Exception as e:
+            self.log_error(f"MQTT消息写入磁盘队列失败: {e}")
+            self.lane_stats[lane]['dropped'] += 1
+            return False
+    
+    def _spool_pending(self, include_frames=True):
+        """
+        把内存中排队的消息按原顺序转存到磁盘队列
+
+        参数:
+            include_frames: 是否转存检测帧(每个主题和摄像头只有最新一帧)，连接断开时不转存，
+                            留在内存中继续合并；进程退出时转存
+        """
+        with self._queue_cond:
+            items = [(LANE_ALARM,) + item for item in self._alarm_queue]
+            items += [(LANE_NORMAL,) + item for item in self._normal_queue]
+            if include_frames:
+                items += [(LANE_FRAME,) + item for item in self._frame_slots.values()]
+            items = [item for item in items if item[0] in self.spool_lanes]
+            kept_lanes = {item[0] for item in items}
+            if LANE_ALARM in kept_lanes:
+                self._alarm_queue.clear()
+            if LANE_NORMAL in kept_lanes:
+                self._normal_queue.clear()
+            if include_frames and LANE_FRAME in kept_lanes:
+                self._frame_slots.clear()
+        for lane, topic, message in items:
+            self._spool_message(lane, topic, message)
+    
+    def _pending_count(self):
+        return len(self._alarm_queue) + len(self._normal_queue) + len(self._frame_slots)
+    
     def _message_worker(self):
-        """消息处理线程：从队列读取消息并发布"""
-        retry_count = 0
+        """消息处理线程：按通道优先级从队列读取消息并发布"""
         max_retries = 3
         
         while not self.should_stop:
             try:
-                msg_data = self.message_queue.get(block=True, timeout=0.5)
+                item = self._dequeue(timeout=0.5)
+                if item is None:
+                    continue
+                lane, topic, message, spool = item
+                counters = self.lane_stats[lane]
                 
-                if self.connected and not self.paused:
-                    topic = msg_data["topic"]
-                    message = msg_data["message"]
-                    qos = msg_data.get("qos", 0)
-                    
-                    # 处理不同类型的消息
-                    if isinstance(message, str):
-                        # 字符串消息直接发布
-                        payload = message
+                if spool is not None:
+                    # 暂存消息发布成功后才出队，失败时留在磁盘队列中下次再试
+                    if self.connected and not self.paused and self._publish_once(topic, message, lane):
+                        spool.ack()
+                        counters['replayed'] += 1
                     else:
-                        # 对象转换为JSON
-                        payload = json.dumps(message)
-                    
-                    # 添加发布重试逻辑
-                    publish_success = False
-                    retry_attempt = 0
-                    
-                    while not publish_success and retry_attempt < max_retries:
-                        try:
-                            self.client.publish(topic, payload, qos=qos)
-                            publish_success = True
-                        except Exception as e:
-                            retry_attempt += 1
-                            if retry_attempt < max_retries:
-                                self.log_error(f"MQTT发布失败，尝试重试 ({retry_attempt}/{max_retries}): {e}")
-                                time.sleep(0.5)  # 短暂延迟后重试
-                            else:
-                                self.log_error(f"MQTT发布多次失败，放弃: {e}")
+                        time.sleep(0.5)
+                    continue
                 
-                self.message_queue.task_done()
-                retry_count = 0  # 成功一次后重置重试计数
+                if not self.connected or self.paused:
+                    # 检测帧不转存，断开期间新的帧会在内存中合并
+                    if lane != LANE_FRAME and self.spool is not None and lane in self.spool_lanes:
+                        self._spool_message(lane, topic, message)
+                    elif lane == LANE_ALARM:
+                        self._requeue_alarm(topic, message)
+                        time.sleep(0.5)
+                    else:
+                        counters['dropped'] += 1
+                    continue
                 
-            except Empty:
-                # 队列为空，继续等待
-                pass
-            except Exception as e:
-                retry_count += 1
-                self.log_error(f"消息处理线程错误: {e}")
+                # 处理不同类型的消息
+                payload = self._serialize(message)
+                
+                # 添加发布重试逻辑
+                qos = self.lane_qos.get(lane, self.qos)
+                publish_success = False
+                retry_attempt = 0
                 
-                if retry_count > 10:
-                    self.log_error("检测到多次持续错误，线程将休眠5秒后继续")
-                    time.sleep(5)
-                    retry_count = 0
+                while not publish_success and retry_attempt < max_retries:
+                    try:
+                        info = self.client.publish(topic, payload, qos=qos)
+                        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                            raise RuntimeError(mqtt.error_string(info.rc))
+                        publish_success = True
+                    except Exception as e:
+                        retry_attempt += 1
+                        if retry_attempt < max_retries:
+                            self.log_error(f"MQTT发布失败，尝试重试 ({retry_attempt}/{max_retries}): {e}")
+                            time.sleep(0.5)  # 短暂延迟后重试
+                        else:
+                            self.log_error(f"MQTT发布多次失败: {e}")
+                
+                if publish_success:
+                    counters['published'] += 1
+                elif lane == LANE_ALARM:
+                    # 报警命令不丢弃，放回队首等待下一次发布
+                    self._requeue_alarm(topic, message)
+                elif lane != LANE_FRAME and self.spool is not None and lane in self.spool_lanes:
+                    self._spool_message(lane, topic, message)
                 else:
-                    # 短暂休眠，避免在错误情况下CPU使用率过高
-                    time.sleep(0.1)
+                    counters['dropped'] += 1
+                
+            except Exception as e:
+                self.log_error(f"消息处理线程错误: {e}")
+                # 短暂休眠，避免在错误情况下CPU使用率过高
+                time.sleep(0.1)
+    
+    def _publish_once(self, topic, payload, lane):
+        """发布一条消息，返回是否成功"""
+        try:
+            info = self.client.publish(topic, payload, qos=self.lane_qos.get(lane, self.qos))
+            return info.rc == mqtt.MQTT_ERR_SUCCESS
+        except Exception as e:
+            self.log_error(f"MQTT重放消息失败: {e}")
+            return False
+    
+    def _serialize(self, message):
+        """字符串和二进制消息直接发布，对象按payload_format编码"""
+        if isinstance(message, (str, bytes, bytearray)):
+            return message
+        if self.payload_format == 'msgpack':
+            return msgpack.packb(message, use_bin_type=True)
+        if self.payload_format == 'cbor':
+            return cbor2.dumps(message)
+        return json.dumps(message)
+    
+    def _requeue_alarm(self, topic, message):
+        with self._queue_cond:
+            self._alarm_queue.appendleft((topic, message))
+            self.lane_stats[LANE_ALARM]['requeued'] += 1
     
     def set_topic(self, topic):
         """设置发布主题"""
@@ -326,13 +580,41 @@ class MQTTModule:
         self.log_info(f"MQTT主题已更改为: {topic}")
     
     def get_queue_size(self):
-        """获取当前队列大小"""
-        return self.message_queue.qsize()
+        """获取当前队列大小(包括磁盘队列中待重放的消息)"""
+        spooled = sum(len(q) for q in self.spool.values()) if self.spool is not None else 0
+        with self._queue_cond:
+            return self._pending_count() + spooled
+    
+    def get_stats(self):
+        """
+        各通道的排队和背压统计
+        
+        返回:
+            dict: {lane: {'pending', 'enqueued', 'published', 'dropped', 'coalesced', 'requeued',
+                   'spooled', 'replayed', 'qos'}}
+        """
+        with self._queue_cond:
+            pending = {LANE_ALARM: len(self._alarm_queue), LANE_NORMAL: len(self._normal_queue),
+                       LANE_FRAME: len(self._frame_slots)}
+            return {lane: dict(counters, pending=pending[lane], qos=self.lane_qos.get(lane, self.qos))
+                    for lane, counters in self.lane_stats.items()}
+    
+    def get_spool_stats(self):
+        """
+        磁盘队列统计
+        
+        返回:
+            dict: {'alarm': {...}, 'data': {...}, 'frame': {...}}，见DiskQueue.stats()；未启用时返回None
+        """
+        if self.spool is None:
+            return None
+        return {name: queue.stats() for name, queue in self.spool.items()}
     
     def wait_empty(self, timeout=None):
         """等待队列为空"""
-        try:
-            self.message_queue.join(timeout=timeout)
-            return True
-        except:
-            return False 
\ No newline at end of file
+        deadline = None if timeout is None else time.time() + timeout
+        while self.get_queue_size():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True 
\ No newline at end of file
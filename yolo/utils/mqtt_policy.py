@@ -0,0 +1,87 @@
+"""
+MQTT消息内容策略模块
+
+大部分检测帧只是重复画面，默认只发布检测结果；只有发生需要留证的事件时才附带缩小的快照:
+- accident: 出现事故
+- violation: 出现违停或超速
+- new_plate: 识别到该视频源最近没有出现过的车牌
+同一视频源的同一事件在冷却时间内只附带一次快照，持续存在的事故不会每帧都发送图像。
+"""
+
+import time
+import threading
+
+# 事件 -> 触发该事件的检测类型
+EVENT_TYPES = {
+    'accident': ('accident',),
+    'violation': ('illegal_parking', 'overspeed'),
+}
+
+DEFAULT_EVENTS = ('accident', 'violation', 'new_plate')
+
+
+class SnapshotPolicy:
+    """
+    决定一帧检测结果是否需要附带快照
+    """
+    def __init__(self, events=DEFAULT_EVENTS, cooldown=10.0, plate_memory=300.0):
+        """
+        参数:
+            events: 需要附带快照的事件
+            cooldown: 同一视频源同一事件两次快照的最小间隔(秒)
+            plate_memory: 车牌在多长时间内再次出现不算新车牌(秒)
+        """
+        self.events = tuple(events)
+        self.cooldown = cooldown
+        self.plate_memory = plate_memory
+        self._last_snapshot = {}  # (source_id, event) -> 时间
+        self._plates = {}  # (source_id, plate_text) -> 最近出现时间
+        self._lock = threading.Lock()
+
+    def check(self, source_id, detections, now=None):
+        """
+        检查一帧的检测结果
+
+        参数:
+            source_id: 视频源ID
+            detections: 检测结果列表(需要type字段，车牌需要plate_text字段)
+            now: 当前时间
+
+        返回:
+            list: 需要附带快照的事件，为空时只发布检测结果
+        """
+        now = now or time.time()
+        types = {d.get('type') for d in detections}
+        triggered = []
+        with self._lock:
+            for event in self.events:
+                if event == 'new_plate':
+                    if self._new_plate(source_id, detections, now):
+                        triggered.append(event)
+                    continue
+                if not types.intersection(EVENT_TYPES.get(event, ())):
+                    continue
+                last = self._last_snapshot.get((source_id, event), 0.0)
+                if now - last >= self.cooldown:
+                    self._last_snapshot[(source_id, event)] = now
+                    triggered.append(event)
+            if len(self._plates) > 10000:
+                self._forget(now)
+        return triggered
+
+    def _new_plate(self, source_id, detections, now):
+        """记录车牌出现时间，返回是否有新车牌(调用时需持有锁)"""
+        found = False
+        for detection in detections:
+            plate = detection.get('plate_text')
+            if not plate:
+                continue
+            last = self._plates.get((source_id, plate))
+            if last is None or now - last > self.plate_memory:
+                found = True
+            self._plates[(source_id, plate)] = now
+        return found
+
+    def _forget(self, now):
+        """清理过期的车牌记录(调用时需持有锁)"""
+        self._plates = {k: t for k, t in self._plates.items() if now - t <= self.plate_memory}
@@ -0,0 +1,284 @@
+"""
+检测结果缓存模块
+
+此模块按内容寻址缓存已完成的检测结果:
+- 缓存键由输入内容的哈希、检测参数和模型版本组成，相同的请求直接返回缓存的结果和输出文件
+- 相同的请求同时到达时，只有第一个请求执行处理，其余请求等待其结果(合并在途请求)
+- 缓存条目保存在磁盘上，超过容量上限时按最近最少使用(LRU)淘汰
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    """一个正在处理中的请求，等待者通过wait()获取其写入缓存的结果"""
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.entry = None
+        self._event = threading.Event()
+
+    def finish(self, entry=None):
+        if entry is not None:
+            self.entry = entry
+        self._event.set()
+
+    def wait(self, timeout=None):
+        """
+        等待处理完成
+
+        返回:
+            dict: 缓存条目，处理失败或超时时返回None
+        """
+        self._event.wait(timeout)
+        return self.entry
+
+
+class ResultCache:
+    """
+    磁盘结果缓存
+
+    目录结构:
+        <key>/result.json  检测结果
+        <key>/<name>       输出文件(如标注后的视频)
+    result.json的修改时间作为最近访问时间，重启后据此恢复LRU顺序。
+    """
+    RESULT_FILE = 'result.json'
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, logger=None):
+        """
+        参数:
+            directory: 缓存目录
+            max_bytes: 缓存占用的磁盘上限(字节)
+            logger: 日志函数(默认print)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.log = logger or print
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> 占用字节数，按访问时间从旧到新
+        self._flights = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(content_hash, params=None, model_version=None):
+        """
+        生成缓存键
+
+        参数:
+            content_hash: 输入内容的哈希
+            params: 影响结果的检测参数
+            model_version: 模型版本
+
+        返回:
+            str: 十六进制键
+        """
+        material = json.dumps([content_hash, params or {}, model_version], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def link_file(src, dst):
+        """硬链接文件(跨文件系统时复制)"""
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load_index(self):
+        """扫描缓存目录，按最近访问时间重建索引"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            result_path = os.path.join(path, self.RESULT_FILE)
+            if not os.path.isdir(path):
+                continue
+            if '.tmp-' in name or not os.path.exists(result_path):
+                # 写入中断留下的临时目录
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(result_path), name, size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+
+    @property
+    def total_bytes(self):
+        return sum(self._entries.values())
+
+    def get(self, key):
+        """
+        读取缓存条目
+
+        返回:
+            dict: {'key', 'result', 'files': {name: path}}，未命中时返回None
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        entry_dir = self._entry_dir(key)
+        result_path = os.path.join(entry_dir, self.RESULT_FILE)
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.utime(result_path)
+        except (OSError, ValueError) as e:
+            self.log(f"缓存条目损坏，已删除 {key}: {e}")
+            self.delete(key)
+            return None
+        files = {name: os.path.join(entry_dir, name)
+                 for name in os.listdir(entry_dir) if name != self.RESULT_FILE}
+        return {'key': key, 'result': result, 'files': files}
+
+    def put(self, key, result, files=None):
+        """
+        写入缓存条目，并唤醒等待该键的请求
+
+        参数:
+            key: 缓存键
+            result: 可JSON序列化的结果
+            files: 需要缓存的文件{name: 源路径}
+
+        返回:
+            dict: 缓存条目，超过容量上限无法缓存时返回None
+        """
+        tmp_dir = self._entry_dir(f"{key}.tmp-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp_dir)
+        try:
+            for name, src in (files or {}).items():
+                self.link_file(src, os.path.join(tmp_dir, name))
+            with open(os.path.join(tmp_dir, self.RESULT_FILE), 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            size = sum(os.path.getsize(os.path.join(tmp_dir, f)) for f in os.listdir(tmp_dir))
+            if size > self.max_bytes:
+                self.log(f"结果大小 {size} 字节超过缓存上限，不缓存")
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return None
+            with self._lock:
+                entry_dir = self._entry_dir(key)
+                if os.path.exists(entry_dir):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                os.rename(tmp_dir, entry_dir)
+                self._entries[key] = size
+                self._entries.move_to_end(key)
+                evicted = self._evict()
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        for old_key in evicted:
+            shutil.rmtree(self._entry_dir(old_key), ignore_errors=True)
+
+        entry = {'key': key, 'result': result,
+                 'files': {name: os.path.join(entry_dir, name) for name in (files or {})}}
+        with self._lock:
+            flight = self._flights.get(key)
+        if flight is not None:
+            flight.finish(entry)
+        return entry
+
+    def _evict(self):
+        """按LRU移出超过容量的条目(调用时需持有锁)，返回需要删除的键"""
+        evicted = []
+        total = self.total_bytes
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            total -= size
+            evicted.append(key)
+        if evicted:
+            self.log(f"缓存淘汰 {len(evicted)} 个条目，当前占用 {total} 字节")
+        return evicted
+
+    def delete(self, key):
+        """删除缓存条目"""
+        with self._lock:
+            self._entries.pop(key, None)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def join(self, key, owner=None):
+        """
+        加入键的在途请求
+
+        参数:
+            key: 缓存键
+            owner: 处理者标识(如任务ID)
+
+        返回:
+            tuple: (flight, is_leader)，is_leader为True时调用方负责处理并在结束后调用release
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = _Flight(owner)
+            self._flights[key] = flight
+            return flight, True
+
+    def inflight_owner(self, key):
+        """键的在途请求的处理者，没有在途请求时返回None"""
+        with self._lock:
+            flight = self._flights.get(key)
+        return flight.owner if flight is not None else None
+
+    def release(self, key):
+        """结束在途请求(处理失败时等待者会得到None)"""
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None:
+            flight.finish()
+
+    def get_or_compute(self, key, compute, wait_timeout=None):
+        """
+        读取缓存，未命中时计算并写入；相同键的并发调用只计算一次
+
+        参数:
+            key: 缓存键
+            compute: 计算函数，返回可JSON序列化的结果，返回None时不缓存
+            wait_timeout: 等待在途请求的最长时间(秒)，超时后自行计算
+
+        返回:
+            tuple: (result, cached)
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry['result'], True
+        flight, leader = self.join(key)
+        if not leader:
+            entry = flight.wait(wait_timeout)
+            if entry is not None:
+                return entry['result'], True
+            return compute(), False
+        try:
+            result = compute()
+            if result is not None:
+                self.put(key, result)
+            return result, False
+        finally:
+            self.release(key)
+
+    def stats(self):
+        """缓存统计"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'inflight': len(self._flights)
+            }